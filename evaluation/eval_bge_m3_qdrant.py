@@ -1,27 +1,29 @@
 from qdrant_client import QdrantClient, models
 from tqdm import tqdm
 import ir_datasets
+import utils.ir_metrics as ir_metrics
+from retrieval.ingest import sync_collection
+from retrieval.base import point_id, doc_payload, dense_config
+from retrieval.storage import QDRANT_STORAGE, collection_kwargs, search_params, storage_suffix
 import os
-import hashlib
-import uuid
+from types import SimpleNamespace
 import asyncio
 from qdrant_client.async_qdrant_client import AsyncQdrantClient
-import requests
 from typing import List
+from utils.embedding_client import get_client, QUERY_EMBEDDING_CACHE
 
 DATASET = "beir/quora/test"
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", None)
-COLLECTION_NAME = DATASET.replace("/", "_") + "_bge_m3"
+COLLECTION_NAME = DATASET.replace("/", "_") + "_bge_m3" + storage_suffix(QDRANT_STORAGE)
+# QDRANT_STORAGE 选择存储方案（int8 / binary / on_disk / on_disk_payload，可用 + 组合），量化方案查询时 rescore
+SEARCH_PARAMS = search_params(QDRANT_STORAGE)
+
+# 共享的 embedding 客户端：连接复用、按 token 预算切批、并发受限、失败重试
+embedding_client = get_client("bge-m3")
 
 def get_embedding(texts: List[str]) -> List[List[float]]:
-    url = "http://localhost:9998/v1/embeddings"
-    headers = {"Authorization": "Bearer sk-72tkvudyGLPMi"}
-    data = {"model": "bge-m3", "input": texts}
-    resp = requests.post(url, json=data, headers=headers)
-    resp.raise_for_status()
-    embeddings = [embedding_data['embedding'] for embedding_data in resp.json()["data"]]
-    return embeddings
+    return embedding_client.embed(texts)
 
 # Load nfcorpus data using ir_datasets
 def load_nfcorpus():
@@ -68,87 +70,71 @@ def index_docs(docs, doc_ids, reindex=False):
     print("Indexing documents with SentenceTransformer...")
     client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=True)
     
-    # Delete collection if exists and reindex is True
-    if client.collection_exists(COLLECTION_NAME):
-        if reindex:
-            client.delete_collection(COLLECTION_NAME)
-        else:
-            # If not reindexing, just return the client
-            return client
+    # 已有 collection 且不要求 reindex 时直接复用
+    if client.collection_exists(COLLECTION_NAME) and not reindex:
+        return client
     
     # Create collection with dense vector config
-    client.create_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=models.VectorParams(
-            size=1024,
-            distance=models.Distance.COSINE
+    def create_collection():
+        client.create_collection(
+            collection_name=COLLECTION_NAME,
+            **collection_kwargs(1024, models.Distance.COSINE, QDRANT_STORAGE)
         )
-    )
     
     # Index documents in batches
-    batch_size = 64
-    for i in tqdm(range(0, len(docs), batch_size)):
-        batch_docs = docs[i:i+batch_size]
-        batch_ids = doc_ids[i:i+batch_size]
-        
+    # embedding_client 会再切成 micro-batch 并发请求，这里只决定每次 upsert 的点数
+    batch_size = 256
+    progress = tqdm(desc="Embedding documents")
+
+    def encode(batch):
+        batch_docs = [doc for _, doc in batch]
         # Get embeddings
         embeddings = get_embedding(batch_docs)
-        
-        # Create points
-        points = []
-        for j, embedding in enumerate(embeddings):
-            doc_id = batch_ids[j]
-            # If doc_id is purely numeric, use it directly; otherwise, use UUID
-            if isinstance(doc_id, int):
-                point_id = doc_id
-            else:
-                # Convert doc_id to UUID using MD5
-                doc_id_str = str(doc_id)
-                md5_hash = hashlib.md5(doc_id_str.encode()).hexdigest()
-                point_id = str(uuid.UUID(md5_hash))
-            
-            points.append(models.PointStruct(
-                id=point_id,
-                vector=embeddings[j],
-                payload={"doc_id": doc_id, "text": batch_docs[j]}
-            ))
-        
-        # Upload points
-        client.upsert(
-            collection_name=COLLECTION_NAME,
-            points=points,
-            wait=True
+        progress.update(len(batch))
+        return embeddings
+
+    def make_point(item, embedding):
+        doc_id, doc = item
+        return models.PointStruct(
+            id=point_id(doc_id),
+            vector=embedding,
+            payload=doc_payload(SimpleNamespace(doc_id=doc_id, text=doc))
         )
+
+    # 按 doc_id + 内容哈希增量同步：只上传新增或变化的文档、删除已移除的文档；
+    # embedding 与上传流水线并行（upload_points, wait=False），返回前等待所有点写入可见
+    sync_collection(client, COLLECTION_NAME, zip(doc_ids, docs), create_collection, encode, make_point,
+                    reindex=reindex, config=dense_config("bge-m3", 1024, models.Distance.COSINE, QDRANT_STORAGE),
+                    batch_size=batch_size)
+    progress.close()
     
     # print(f"Indexed {len(docs)} documents into collection '{COLLECTION_NAME}'")
     return client
 
 def search_sparse(client, query, limit=10):
-    query_vector = get_embedding([query])[0]
+    query_vector = embedding_client.embed([query], cache=QUERY_EMBEDDING_CACHE)[0]
     result = client.search(
         collection_name=COLLECTION_NAME,
         query_vector=query_vector,
         limit=limit,
+        search_params=SEARCH_PARAMS,
         with_payload=True
     )
     return result
 
 async def search_sparse_async(client, query, limit=10):
-    loop = asyncio.get_event_loop()
-    query_vector = await loop.run_in_executor(
-        None,
-        lambda: get_embedding([query])[0]
-    )
+    query_vector = (await embedding_client.aembed([query], cache=QUERY_EMBEDDING_CACHE))[0]
     result = await client.query_points(
         collection_name=COLLECTION_NAME,
         query=query_vector,
         using="cosine",
         with_payload=True,
+        search_params=SEARCH_PARAMS,
         limit=limit
     )
     return result
 
-def main(async_mode=False, reindex=False):
+def main(async_mode=False, reindex=False, concurrency=20):
     # Load data
     docs, doc_ids, query_texts, query_ids, qrels_dict = load_nfcorpus()
 
@@ -157,14 +143,13 @@ def main(async_mode=False, reindex=False):
     
     if async_mode:
         client.close()  # Close sync client if running async
-        asyncio.run(main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex))
+        asyncio.run(main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex, concurrency))
     else:
         # Evaluation
         limit = 10
         number_of_queries = min(len(query_texts), 100_000)
         
-        recalls = []
-        precisions = []
+        run = {}
         
         for idx in tqdm(range(number_of_queries), desc="Evaluating queries"):
             query_id = query_ids[idx]
@@ -176,34 +161,14 @@ def main(async_mode=False, reindex=False):
                 
             # Search using SentenceTransformer
             results = search_sparse(client, query_text, limit)
-            retrieved_doc_ids = [hit.payload["doc_id"] for hit in results]
-            
-            # Calculate metrics
-            relevant_doc_ids = qrels_dict[query_id]
-            print(f"Query ID: {query_id}, Retrieved: {len(retrieved_doc_ids)}, Relevant: {len(relevant_doc_ids)}")
-            relevant_retrieved = set(retrieved_doc_ids) & set(relevant_doc_ids)
-            
-            # Recall@10: proportion of relevant docs retrieved in top-10
-            recall = len(relevant_retrieved) / len(relevant_doc_ids)
-            recalls.append(recall)
-            
-            # Precision@10: proportion of retrieved docs that are relevant
-            precision = len(relevant_retrieved) / limit
-            precisions.append(precision)
-            
-            print(f"Query {idx+1}/{number_of_queries}: {query_id}, Recall@10: {recall:.3f}, Precision@10: {precision:.3f}")
+            run[query_id] = [hit.payload["doc_id"] for hit in results]
     
-        # Report overall results
-        average_recall = sum(recalls) / len(recalls)
-        average_precision = sum(precisions) / len(precisions)
-        
-        print(f"\nEvaluation results for {len(recalls)} queries:")
-        print(f"Average Recall@{limit}: {average_recall:.4f}")
-        print(f"Average Precision@{limit}: {average_precision:.4f}")
+        results = ir_metrics.evaluate(run, qrels_dict, cutoffs=(1, 5, limit))
+        ir_metrics.print_results(results, len(run))
 
         client.close()  # Close the client after evaluation
 
-async def main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex=False):
+async def main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex=False, concurrency=20):
     print("Running in async mode...")
     # Create async client
     client = AsyncQdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=True)
@@ -212,57 +177,26 @@ async def main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex=
     limit = 10
     number_of_queries = min(len(query_texts), 100_000)
     
-    recalls = []
-    precisions = []
+    run = {}
     
-    # Process queries in batches for better async performance
-    batch_size = 20  # Increased batch size for better concurrency
-    for batch_start in tqdm(range(0, number_of_queries, batch_size), desc="Processing query batches"):
-        batch_end = min(batch_start + batch_size, number_of_queries)
-        batch_queries = []
-        
-        # Prepare the batch without awaiting
-        for idx in range(batch_start, batch_end):
-            query_id = query_ids[idx]
-            query_text = query_texts[idx]
-            
-            # Skip queries without relevant documents
-            if query_id not in qrels_dict or len(qrels_dict[query_id]) == 0:
-                continue
-                
-            batch_queries.append((idx, query_id, query_text))
-        
-        # Create all tasks at once
-        tasks = [search_sparse_async(client, query_text, limit) for _, _, query_text in batch_queries]
-        
-        # Await all tasks concurrently
-        results = await asyncio.gather(*tasks)
-        
-        # Process results
-        for i, (idx, query_id, _) in enumerate(batch_queries):
-            retrieved_doc_ids = [hit.payload["doc_id"] for hit in results[i]]
-            
-            # Calculate metrics
-            relevant_doc_ids = qrels_dict[query_id]
-            relevant_retrieved = set(retrieved_doc_ids) & set(relevant_doc_ids)
-            
-            # Recall@10: proportion of relevant docs retrieved in top-10
-            recall = len(relevant_retrieved) / len(relevant_doc_ids)
-            recalls.append(recall)
-            
-            # Precision@10: proportion of retrieved docs that are relevant
-            precision = len(relevant_retrieved) / limit
-            precisions.append(precision)
-            
-            print(f"Query {idx+1}/{number_of_queries}: {query_id}, Recall@10: {recall:.3f}, Precision@10: {precision:.3f}")
-    
-    # Report overall results
-    average_recall = sum(recalls) / len(recalls)
-    average_precision = sum(precisions) / len(precisions)
-    
-    print(f"\nEvaluation results for {len(recalls)} queries:")
-    print(f"Average Recall@{limit}: {average_recall:.4f}")
-    print(f"Average Precision@{limit}: {average_precision:.4f}")
+    # 用 semaphore 限制在途请求数：一个请求完成就补上下一个，不再等整批里最慢的查询
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_query(query_id, query_text):
+        async with semaphore:
+            results = await search_sparse_async(client, query_text, limit)
+        run[query_id] = [hit.payload["doc_id"] for hit in results]
+
+    # Skip queries without relevant documents
+    tasks = [
+        run_query(query_ids[idx], query_texts[idx])
+        for idx in range(number_of_queries)
+        if query_ids[idx] in qrels_dict and len(qrels_dict[query_ids[idx]]) > 0
+    ]
+    for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Processing queries"):
+        await task
+    results = ir_metrics.evaluate(run, qrels_dict, cutoffs=(1, 5, limit))
+    ir_metrics.print_results(results, len(run))
     
     await client.close()
 
@@ -270,7 +204,8 @@ if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description='Evaluate BM25 with Qdrant')
     parser.add_argument('--async', dest='async_mode', action='store_true', help='Run in async mode')
-    parser.add_argument('--reindex', action='store_true', help='Reindex documents (delete and recreate collection)')
+    parser.add_argument('--reindex', action='store_true', help='Sync the collection with the corpus: upsert new or changed docs, delete removed ones (rebuilt when no manifest matches)')
+    parser.add_argument('--concurrency', type=int, default=20, help='Max in-flight queries in async mode')
     args = parser.parse_args()
     
-    main(async_mode=args.async_mode, reindex=args.reindex)
+    main(async_mode=args.async_mode, reindex=args.reindex, concurrency=args.concurrency)
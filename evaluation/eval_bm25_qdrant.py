@@ -2,9 +2,12 @@ from fastembed import SparseTextEmbedding
 from qdrant_client import QdrantClient, models
 from tqdm import tqdm
 import ir_datasets
+import utils.ir_metrics as ir_metrics
+from retrieval.encoders import BM25Encoder
+from retrieval.ingest import sync_collection, sparse_batch
+from retrieval.base import point_id, doc_payload, PAYLOAD_VERSION
 import os
-import hashlib
-import uuid
+from types import SimpleNamespace
 import asyncio
 from qdrant_client.async_qdrant_client import AsyncQdrantClient
 
@@ -57,74 +60,60 @@ def load_nfcorpus():
 
     return docs, doc_ids, query_texts, query_ids, qrels_dict
 
-def index_docs(docs, doc_ids, reindex=False):
+def index_docs(docs, doc_ids, reindex=False, encode_workers=1, chunk_size=64):
     print("Indexing documents with BM25...")
     client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=True)
     
-    # Delete collection if exists and reindex is True
-    if client.collection_exists(COLLECTION_NAME):
-        if reindex:
-            client.delete_collection(COLLECTION_NAME)
-        else:
-            # If not reindexing, just return the client
-            return client
+    # 已有 collection 且不要求 reindex 时直接复用
+    if client.collection_exists(COLLECTION_NAME) and not reindex:
+        return client
     
     # Create collection with BM25 sparse vector config
-    client.create_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config={},
-        sparse_vectors_config={
-            "bm25": models.SparseVectorParams(
-                modifier=models.Modifier.IDF
-            )
-        }
-    )
+    def create_collection():
+        client.create_collection(
+            collection_name=COLLECTION_NAME,
+            vectors_config={},
+            sparse_vectors_config={
+                "bm25": models.SparseVectorParams(
+                    modifier=models.Modifier.IDF
+                )
+            }
+        )
     
-    # Initialize BM25 model
-    model = SparseTextEmbedding(
-        model_name="Qdrant/bm25",
+    # Initialize BM25 model: encode_workers 个进程各自编码 chunk_size 篇文档
+    encoder = BM25Encoder(
         avg_len=256.0,  # Adjust based on average document length
+        workers=encode_workers,
+        chunk_size=chunk_size
     )
     
     # Index documents in batches
     batch_size = 64
-    for i in tqdm(range(0, len(docs), batch_size)):
-        batch_docs = docs[i:i+batch_size]
-        batch_ids = doc_ids[i:i+batch_size]
-        
+    progress = tqdm(desc="Embedding documents")
+
+    def encode(batch):
+        batch_docs = [doc for _, doc in batch]
         # Get embeddings
-        embeddings = list(model.embed(batch_docs))
-        
-        # Create points
-        points = []
-        for j, embedding in enumerate(embeddings):
-            doc_id = batch_ids[j]
-            # If doc_id is purely numeric, use it directly; otherwise, use UUID
-            if isinstance(doc_id, int):
-                point_id = doc_id
-            else:
-                # Convert doc_id to UUID using MD5
-                doc_id_str = str(doc_id)
-                md5_hash = hashlib.md5(doc_id_str.encode()).hexdigest()
-                point_id = str(uuid.UUID(md5_hash))
-            
-            points.append(models.PointStruct(
-                id=point_id,
-                vector={
-                    "bm25": models.SparseVector(
-                        values=embedding.values.tolist(),
-                        indices=embedding.indices.tolist()
-                    )
-                },
-                payload={"doc_id": doc_id, "text": batch_docs[j]}
-            ))
-        
-        # Upload points
-        client.upsert(
-            collection_name=COLLECTION_NAME,
-            points=points,
-            wait=True
-        )
+        embeddings = encoder.encode(batch_docs)
+        progress.update(len(batch))
+        return embeddings
+
+    def make_batch(batch, embeddings):
+        # 整批列式上传（models.Batch），不再为每个文档构造 PointStruct
+        return sparse_batch([point_id(doc_id) for doc_id, _ in batch], embeddings,
+                            [doc_payload(SimpleNamespace(doc_id=doc_id, text=doc)) for doc_id, doc in batch],
+                            name="bm25")
+
+    # 按 doc_id + 内容哈希增量同步：只上传新增或变化的文档、删除已移除的文档；
+    # embedding 与上传流水线并行（upsert, wait=False），返回前等待所有点写入可见
+    # 每个 embedding 线程一次占用一个进程，线程数不少于进程数
+    try:
+        sync_collection(client, COLLECTION_NAME, zip(doc_ids, docs), create_collection, encode, make_batch=make_batch,
+                        reindex=reindex, config=f"bm25:Qdrant/bm25:256.0:{PAYLOAD_VERSION}", batch_size=batch_size,
+                        embed_workers=max(2, encode_workers))
+    finally:
+        encoder.close()
+    progress.close()
     
     print(f"Indexed {len(docs)} documents into collection '{COLLECTION_NAME}'")
     return client
@@ -165,23 +154,22 @@ async def search_sparse_async(client, query, limit=10):
     )
     return result.points
 
-def main(async_mode=False, reindex=False):
+def main(async_mode=False, reindex=False, concurrency=20, encode_workers=1, chunk_size=64):
     # Load data
     docs, doc_ids, query_texts, query_ids, qrels_dict = load_nfcorpus()
 
     # Index documents
-    client = index_docs(docs, doc_ids, reindex=reindex)
+    client = index_docs(docs, doc_ids, reindex=reindex, encode_workers=encode_workers, chunk_size=chunk_size)
     
     if async_mode:
         client.close()  # Close sync client if running async
-        asyncio.run(main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex))
+        asyncio.run(main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex, concurrency))
     else:
         # Evaluation
         limit = 10
         number_of_queries = min(len(query_texts), 100_000)
         
-        recalls = []
-        precisions = []
+        run = {}
         
         for idx in tqdm(range(number_of_queries), desc="Evaluating queries"):
             query_id = query_ids[idx]
@@ -193,34 +181,14 @@ def main(async_mode=False, reindex=False):
                 
             # Search using BM25
             results = search_sparse(client, query_text, limit)
-            retrieved_doc_ids = [hit.payload["doc_id"] for hit in results]
-            
-            # Calculate metrics
-            relevant_doc_ids = qrels_dict[query_id]
-            print(f"Query ID: {query_id}, Retrieved: {len(retrieved_doc_ids)}, Relevant: {len(relevant_doc_ids)}")
-            relevant_retrieved = set(retrieved_doc_ids) & set(relevant_doc_ids)
-            
-            # Recall@10: proportion of relevant docs retrieved in top-10
-            recall = len(relevant_retrieved) / len(relevant_doc_ids)
-            recalls.append(recall)
-            
-            # Precision@10: proportion of retrieved docs that are relevant
-            precision = len(relevant_retrieved) / limit
-            precisions.append(precision)
-            
-            print(f"Query {idx+1}/{number_of_queries}: {query_id}, Recall@10: {recall:.3f}, Precision@10: {precision:.3f}")
+            run[query_id] = [hit.payload["doc_id"] for hit in results]
     
-        # Report overall results
-        average_recall = sum(recalls) / len(recalls)
-        average_precision = sum(precisions) / len(precisions)
-        
-        print(f"\nEvaluation results for {len(recalls)} queries:")
-        print(f"Average Recall@{limit}: {average_recall:.4f}")
-        print(f"Average Precision@{limit}: {average_precision:.4f}")
+        results = ir_metrics.evaluate(run, qrels_dict, cutoffs=(1, 5, limit))
+        ir_metrics.print_results(results, len(run))
 
         client.close()  # Close the client after evaluation
 
-async def main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex=False):
+async def main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex=False, concurrency=20):
     print("Running in async mode...")
     # Create async client
     client = AsyncQdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=True)
@@ -229,57 +197,26 @@ async def main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex=
     limit = 10
     number_of_queries = min(len(query_texts), 100_000)
     
-    recalls = []
-    precisions = []
+    run = {}
     
-    # Process queries in batches for better async performance
-    batch_size = 20  # Increased batch size for better concurrency
-    for batch_start in tqdm(range(0, number_of_queries, batch_size), desc="Processing query batches"):
-        batch_end = min(batch_start + batch_size, number_of_queries)
-        batch_queries = []
-        
-        # Prepare the batch without awaiting
-        for idx in range(batch_start, batch_end):
-            query_id = query_ids[idx]
-            query_text = query_texts[idx]
-            
-            # Skip queries without relevant documents
-            if query_id not in qrels_dict or len(qrels_dict[query_id]) == 0:
-                continue
-                
-            batch_queries.append((idx, query_id, query_text))
-        
-        # Create all tasks at once
-        tasks = [search_sparse_async(client, query_text, limit) for _, _, query_text in batch_queries]
-        
-        # Await all tasks concurrently
-        results = await asyncio.gather(*tasks)
-        
-        # Process results
-        for i, (idx, query_id, _) in enumerate(batch_queries):
-            retrieved_doc_ids = [hit.payload["doc_id"] for hit in results[i]]
-            
-            # Calculate metrics
-            relevant_doc_ids = qrels_dict[query_id]
-            relevant_retrieved = set(retrieved_doc_ids) & set(relevant_doc_ids)
-            
-            # Recall@10: proportion of relevant docs retrieved in top-10
-            recall = len(relevant_retrieved) / len(relevant_doc_ids)
-            recalls.append(recall)
-            
-            # Precision@10: proportion of retrieved docs that are relevant
-            precision = len(relevant_retrieved) / limit
-            precisions.append(precision)
-            
-            print(f"Query {idx+1}/{number_of_queries}: {query_id}, Recall@10: {recall:.3f}, Precision@10: {precision:.3f}")
-    
-    # Report overall results
-    average_recall = sum(recalls) / len(recalls)
-    average_precision = sum(precisions) / len(precisions)
-    
-    print(f"\nEvaluation results for {len(recalls)} queries:")
-    print(f"Average Recall@{limit}: {average_recall:.4f}")
-    print(f"Average Precision@{limit}: {average_precision:.4f}")
+    # 用 semaphore 限制在途请求数：一个请求完成就补上下一个，不再等整批里最慢的查询
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_query(query_id, query_text):
+        async with semaphore:
+            results = await search_sparse_async(client, query_text, limit)
+        run[query_id] = [hit.payload["doc_id"] for hit in results]
+
+    # Skip queries without relevant documents
+    tasks = [
+        run_query(query_ids[idx], query_texts[idx])
+        for idx in range(number_of_queries)
+        if query_ids[idx] in qrels_dict and len(qrels_dict[query_ids[idx]]) > 0
+    ]
+    for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Processing queries"):
+        await task
+    results = ir_metrics.evaluate(run, qrels_dict, cutoffs=(1, 5, limit))
+    ir_metrics.print_results(results, len(run))
     
     await client.close()
 
@@ -287,7 +224,12 @@ if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description='Evaluate BM25 with Qdrant')
     parser.add_argument('--async', dest='async_mode', action='store_true', help='Run in async mode')
-    parser.add_argument('--reindex', action='store_true', help='Reindex documents (delete and recreate collection)')
+    parser.add_argument('--reindex', action='store_true', help='Sync the collection with the corpus: upsert new or changed docs, delete removed ones (rebuilt when no manifest matches)')
+    parser.add_argument('--concurrency', type=int, default=20, help='Max in-flight queries in async mode')
+    parser.add_argument('--encode-workers', type=int, default=1,
+                        help='Processes for BM25 document encoding during indexing')
+    parser.add_argument('--chunk-size', type=int, default=64, help='Documents per BM25 encoding task')
     args = parser.parse_args()
     
-    main(async_mode=args.async_mode, reindex=args.reindex)
+    main(async_mode=args.async_mode, reindex=args.reindex, concurrency=args.concurrency,
+         encode_workers=args.encode_workers, chunk_size=args.chunk_size)
@@ -3,6 +3,8 @@ import re
 import json
 import os
 import ir_datasets
+import utils.ir_metrics as ir_metrics
+from utils.index_manifest import IndexManifest, content_hash, plan_sync
 import asyncio
 import argparse
 from tqdm import tqdm
@@ -56,33 +58,51 @@ def load_dataset():
     
     return docs, doc_ids, query_texts, query_ids, qrels_dict
 
+def build_schema():
+    schema_builder = tantivy.SchemaBuilder()
+    schema_builder.add_text_field("body", stored=True, tokenizer_name="en_stem")
+    # doc_id 用 raw 分词器整体索引，增量同步时可以按 term 删除
+    schema_builder.add_text_field("doc_id", stored=True, tokenizer_name="raw")
+    return schema_builder.build()
+
 def setup_tantivy_index(docs, doc_ids):
     print("Setting up Tantivy index...")
     file_out = f"data/tantivy_{DATASET.replace('/', '_')}/bm25.tantivy"
-    
-    if os.path.exists(file_out):
+
+    # 按 doc_id + 内容哈希增量同步；没有可用的 manifest（首次建库或旧索引）时才删除重建
+    exists = os.path.exists(file_out)
+    manifest = IndexManifest("tantivy", os.path.abspath(file_out), config="bm25:en_stem:raw_doc_id")
+    hashes = {doc_ids[i]: content_hash(docs[i]) for i in range(len(docs))}
+    full, changed, removed = plan_sync(manifest, hashes, exists)
+    if full and exists:
         # remove direcotry recursively
         shutil.rmtree(file_out)
 
     if not os.path.exists(file_out):
         os.makedirs(file_out, exist_ok=True)
-    
-    schema_builder = tantivy.SchemaBuilder()
-    schema_builder.add_text_field("body", stored=True, tokenizer_name="en_stem")
-    schema_builder.add_text_field("doc_id", stored=True)
-    schema = schema_builder.build()
-    
-    print("Creating new index...")
-    index = tantivy.Index(schema, path=file_out)
+        print("Creating new index...")
+
+    index = tantivy.Index(build_schema(), path=file_out)
     
     # Index documents
     writer = index.writer()
+    changed = set(changed)
+    for doc_id in removed:
+        writer.delete_documents("doc_id", doc_id)
     for i in tqdm(range(len(docs)), desc="Indexing documents"):
+        if doc_ids[i] not in changed:
+            continue
+        if not full:
+            # 内容变化的文档先删除旧版本
+            writer.delete_documents("doc_id", doc_ids[i])
         writer.add_document(tantivy.Document(
             body=docs[i],
             doc_id=doc_ids[i]
         ))
     writer.commit()
+    writer.wait_merging_threads()
+    manifest.save(hashes)
+    print(f"Indexed {len(changed)} documents, deleted {len(removed)}.")
 
 def search_bm25(index, searcher, query, limit):
     query = index.parse_query(sanitize_query_for_tantivy(query), ['body'])
@@ -111,11 +131,7 @@ def main(async_mode=False):
     # Setup Tantivy index
     setup_tantivy_index(docs, doc_ids)
     
-    schema_builder = tantivy.SchemaBuilder()
-    schema_builder.add_text_field("body", stored=True, tokenizer_name="en_stem")
-    schema_builder.add_text_field("doc_id", stored=True)
-    schema = schema_builder.build()
-    index = tantivy.Index(schema, path=f"data/tantivy_{DATASET.replace('/', '_')}/bm25.tantivy/")
+    index = tantivy.Index(build_schema(), path=f"data/tantivy_{DATASET.replace('/', '_')}/bm25.tantivy/")
 
     searcher = index.searcher()
     print(f"Index contains {searcher.num_docs} documents.")
@@ -127,8 +143,7 @@ def main(async_mode=False):
         limit = 10
         number_of_queries = min(len(query_texts), 100_000)
         
-        recalls = []
-        precisions = []
+        run = {}
         
         for idx in tqdm(range(number_of_queries), desc="Evaluating queries"):
             query_id = query_ids[idx]
@@ -140,29 +155,10 @@ def main(async_mode=False):
                 
             # Search using BM25
             results = search_bm25(index, searcher, query_text, limit)
-            retrieved_doc_ids = [hit["doc_id"][0] for hit in results]
-            
-            # Calculate metrics
-            relevant_doc_ids = qrels_dict[query_id]
-            relevant_retrieved = set(retrieved_doc_ids) & set(relevant_doc_ids)
-            
-            # Recall@10: proportion of relevant docs retrieved in top-10
-            recall = len(relevant_retrieved) / len(relevant_doc_ids)
-            recalls.append(recall)
-            
-            # Precision@10: proportion of retrieved docs that are relevant
-            precision = len(relevant_retrieved) / limit
-            precisions.append(precision)
-            
-            print(f"Query {idx+1}/{number_of_queries}: {query_id}, Recall@10: {recall:.3f}, Precision@10: {precision:.3f}")
+            run[query_id] = [hit["doc_id"][0] for hit in results]
     
-        # Report overall results
-        average_recall = sum(recalls) / len(recalls) if recalls else 0
-        average_precision = sum(precisions) / len(precisions) if precisions else 0
-        
-        print(f"\nEvaluation results for {len(recalls)} queries:")
-        print(f"Average Recall@{limit}: {average_recall:.4f}")
-        print(f"Average Precision@{limit}: {average_precision:.4f}")
+        results = ir_metrics.evaluate(run, qrels_dict, cutoffs=(1, 5, limit))
+        ir_metrics.print_results(results, len(run))
 
 async def main_async(index, searcher, query_texts, query_ids, qrels_dict):
     print("Running in async mode...")
@@ -171,8 +167,7 @@ async def main_async(index, searcher, query_texts, query_ids, qrels_dict):
     limit = 10
     number_of_queries = min(len(query_texts), 100_000)
     
-    recalls = []
-    precisions = []
+    run = {}
     
     # Process queries in batches for better async performance
     batch_size = 20  # Increased batch size for better concurrency
@@ -199,29 +194,10 @@ async def main_async(index, searcher, query_texts, query_ids, qrels_dict):
         
         # Process results
         for i, (idx, query_id, _) in enumerate(batch_queries):
-            retrieved_doc_ids = [hit["doc_id"][0] for hit in results[i]]
-            
-            # Calculate metrics
-            relevant_doc_ids = qrels_dict[query_id]
-            relevant_retrieved = set(retrieved_doc_ids) & set(relevant_doc_ids)
-            
-            # Recall@10: proportion of relevant docs retrieved in top-10
-            recall = len(relevant_retrieved) / len(relevant_doc_ids)
-            recalls.append(recall)
-            
-            # Precision@10: proportion of retrieved docs that are relevant
-            precision = len(relevant_retrieved) / limit
-            precisions.append(precision)
-            
-            print(f"Query {idx+1}/{number_of_queries}: {query_id}, Recall@10: {recall:.3f}, Precision@10: {precision:.3f}")
-    
-    # Report overall results
-    average_recall = sum(recalls) / len(recalls) if recalls else 0
-    average_precision = sum(precisions) / len(precisions) if precisions else 0
+            run[query_id] = [hit["doc_id"][0] for hit in results[i]]
     
-    print(f"\nEvaluation results for {len(recalls)} queries:")
-    print(f"Average Recall@{limit}: {average_recall:.4f}")
-    print(f"Average Precision@{limit}: {average_precision:.4f}")
+    results = ir_metrics.evaluate(run, qrels_dict, cutoffs=(1, 5, limit))
+    ir_metrics.print_results(results, len(run))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Evaluate BM25 with Tantivy')
@@ -1,4 +1,3 @@
-import requests
 from typing import List, Dict
 from tqdm import tqdm
 
@@ -7,6 +6,9 @@ from qdrant_client.http.models import PointStruct
 
 import ir_datasets
 
+from utils.embedding_client import get_client
+from retrieval.exact_dense import normalize, exact_top_k
+
 from sentence_transformers import SentenceTransformer
 
 NF_DATASET = "beir/nfcorpus/test"
@@ -72,10 +74,14 @@ def bm25_recall(docs: List[str], queries: List[str], doc_ids: List[str], topk=10
     return results
 
 # 3. 本地embedding召回
-def embedding_recall_local(docs, queries, doc_ids, topk=10):
+def embedding_recall_local(docs, queries, doc_ids, topk=10, exact=False):
     model = SentenceTransformer("all-MiniLM-L6-v2")
     doc_embs = model.encode(docs, batch_size=64, show_progress_bar=True)
     query_embs = model.encode(queries, batch_size=64, show_progress_bar=True)
+    if exact:
+        # 不经过 Qdrant：归一化后分块矩阵乘法求精确 top-k，可作为 HNSW 召回的 ground truth
+        indices, _ = exact_top_k(normalize(query_embs), normalize(doc_embs), topk)
+        return {idx: [doc_ids[i] for i in row] for idx, row in enumerate(indices)}
     # Qdrant入库
     client = QdrantClient(url=QDRANT_HOST)
     if not client.collection_exists(collection_name=QDRANT_COLLECTION):
@@ -94,14 +100,10 @@ def embedding_recall_local(docs, queries, doc_ids, topk=10):
 
 # 4. 远程embedding召回（xinference）
 def embedding_recall_xinference(docs, queries, doc_ids, topk=10):
-    # xinference embedding
+    # xinference embedding：共享客户端负责切批、并发和重试，返回顺序与输入一致
+    embedding_client = get_client("bge-m3")
     def get_embedding(texts: List[str]) -> List[List[float]]:
-        url = "http://localhost:9998/v1/embeddings"
-        headers = {"Authorization": "Bearer sk-72tkvudyGLPMi"}
-        data = {"model": "bge-m3", "input": texts}
-        resp = requests.post(url, json=data, headers=headers)
-        resp.raise_for_status()
-        return resp.json()["data"]["embeddings"]
+        return embedding_client.embed(texts)
     # 文档embedding
     doc_embs = get_embedding(docs)
     query_embs = get_embedding(queries)
@@ -1,32 +1,34 @@
 from qdrant_client import QdrantClient, models
 from tqdm import tqdm
 import utils.ir_local_datasets as ir_datasets
+import utils.ir_metrics as ir_metrics
+from retrieval.ingest import sync_collection
+from retrieval.base import point_id, doc_payload, dense_config
+from retrieval.filters import create_payload_indexes, to_qdrant_filter, parse_filter_args
+from retrieval.storage import QDRANT_STORAGE, collection_kwargs, search_params, storage_suffix
 import os
-import hashlib
-import uuid
+from types import SimpleNamespace
 import asyncio
 from qdrant_client.async_qdrant_client import AsyncQdrantClient
-import requests
 from typing import List
-import json
+from utils.embedding_client import get_client, QUERY_EMBEDDING_CACHE
 
 # DATASET = "temp_output/smartcn/ir_datasets_splitted/tm_textbook"
 DATASET = "temp_output/smartcn/ir_datasets_splitted/lesson_plan"
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", None)
-COLLECTION_NAME = DATASET.replace("/", "_") + "_bge_m3"
+COLLECTION_NAME = DATASET.replace("/", "_") + "_bge_m3" + storage_suffix(QDRANT_STORAGE)
+# QDRANT_STORAGE 选择存储方案（int8 / binary / on_disk / on_disk_payload，可用 + 组合），量化方案查询时 rescore
+SEARCH_PARAMS = search_params(QDRANT_STORAGE)
+
+# 共享的 embedding 客户端：连接复用、按 token 预算切批、并发受限、失败重试
+embedding_client = get_client("bge-m3")
 
 def get_embedding(texts: List[str]) -> List[List[float]]:
-    url = "http://localhost:9998/v1/embeddings"
-    headers = {"Authorization": "Bearer sk-72tkvudyGLPMi"}
-    data = {"model": "bge-m3", "input": texts}
-    resp = requests.post(url, json=data, headers=headers)
-    resp.raise_for_status()
-    embeddings = [embedding_data['embedding'] for embedding_data in resp.json()["data"]]
-    return embeddings
+    return embedding_client.embed(texts)
 
 def load_nfcorpus():
-    dataset = ir_datasets.load(DATASET)
+    dataset = ir_datasets.load(DATASET, cache=True)
     corpus = {
         doc.doc_id: {
             "text": doc.text,
@@ -74,68 +76,55 @@ def load_nfcorpus():
 def index_docs(docs, doc_ids, reindex=False):
     print("Indexing documents with bge-m3 embedding...")
     client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=True)
-    if client.collection_exists(COLLECTION_NAME):
-        if reindex:
-            client.delete_collection(COLLECTION_NAME)
-        else:
-            return client
-    client.create_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=models.VectorParams(
-            size=1024,
-            distance=models.Distance.COSINE
+    # 已有 collection 且不要求 reindex 时直接复用，只补建缺少的 payload 索引
+    if client.collection_exists(COLLECTION_NAME) and not reindex:
+        create_payload_indexes(client, COLLECTION_NAME)
+        return client
+
+    def create_collection():
+        client.create_collection(
+            collection_name=COLLECTION_NAME,
+            **collection_kwargs(1024, models.Distance.COSINE, QDRANT_STORAGE)
         )
-    )
-    batch_size = 10
-    for i in tqdm(range(0, len(docs), batch_size)):
-        batch_docs = docs[i:i+batch_size]
-        batch_ids = doc_ids[i:i+batch_size]
+    # embedding_client 会再切成 micro-batch 并发请求，这里只决定每次 upsert 的点数
+    batch_size = 256
+    progress = tqdm(desc="Embedding documents")
+
+    def encode(batch):
+        batch_docs = [doc for _, doc in batch]
         texts = [doc["text"] for doc in batch_docs]
         embeddings = get_embedding(texts)
-        points = []
-        for j, embedding in enumerate(embeddings):
-            doc_id = batch_ids[j]
-            doc = batch_docs[j]
-            if isinstance(doc_id, int):
-                point_id = doc_id
-            else:
-                doc_id_str = str(doc_id)
-                md5_hash = hashlib.md5(doc_id_str.encode()).hexdigest()
-                point_id = str(uuid.UUID(md5_hash))
-            # Prepare payload with metadata_fields flattened (first level only), skip key conflicts
-            payload = {
-                "doc_id": doc_id,
-                "text": doc["text"]
-            }
-            metadata_fields = doc.get("metadata_fields", {})
-            for k, v in metadata_fields.items():
-                if k not in payload:
-                    # 如果 v 是 json string，尝试转换为 json 对象
-                    if isinstance(v, str):
-                        try:
-                            v_json = json.loads(v)
-                            v = v_json
-                        except Exception:
-                            pass
-                    payload[k] = v
-            points.append(models.PointStruct(
-                id=point_id,
-                vector=embedding,
-                payload=payload
-            ))
-        client.upsert(
-            collection_name=COLLECTION_NAME,
-            points=points,
-            wait=True
+        progress.update(len(batch))
+        return embeddings
+
+    def make_point(item, embedding):
+        doc_id, doc = item
+        # doc_payload 展开 metadata_fields，并把 tag_list 拆成 tag_ids / tag_names 数组，供按学科、年级等标签过滤
+        return models.PointStruct(
+            id=point_id(doc_id),
+            vector=embedding,
+            payload=doc_payload(SimpleNamespace(doc_id=doc_id, text=doc["text"],
+                                                metadata_fields=doc.get("metadata_fields")))
         )
+
+    # 按 doc_id + 内容哈希增量同步：只上传新增或变化的文档、删除已移除的文档；
+    # embedding 与上传流水线并行（upload_points, wait=False），返回前等待所有点写入可见
+    sync_collection(client, COLLECTION_NAME, zip(doc_ids, docs), create_collection, encode, make_point,
+                    reindex=reindex, config=dense_config("bge-m3", 1024, models.Distance.COSINE, QDRANT_STORAGE),
+                    batch_size=batch_size)
+    progress.close()
+    # tag_ids / tag_names / resource_type_code / container_id / parent_id 等字段的 keyword 索引
+    create_payload_indexes(client, COLLECTION_NAME)
     return client
 
-def search_sparse(client, query, limit=10):
-    query_vector = get_embedding([query])[0]
+def search_sparse(client, query, limit=10, query_filter=None):
+    query_vector = embedding_client.embed([query], cache=QUERY_EMBEDDING_CACHE)[0]
     result = client.search(
         collection_name=COLLECTION_NAME,
         query_vector=query_vector,
+        query_filter=query_filter,
         limit=limit,
+        search_params=SEARCH_PARAMS,
         with_payload=True
     )
     hits = []
@@ -147,16 +136,14 @@ def search_sparse(client, query, limit=10):
         })
     return hits
 
-async def search_sparse_async(client, query, limit=10):
-    loop = asyncio.get_event_loop()
-    query_vector = await loop.run_in_executor(
-        None,
-        lambda: get_embedding([query])[0]
-    )
+async def search_sparse_async(client, query, limit=10, query_filter=None):
+    query_vector = (await embedding_client.aembed([query], cache=QUERY_EMBEDDING_CACHE))[0]
     result = await client.search(
         collection_name=COLLECTION_NAME,
         query_vector=query_vector,
+        query_filter=query_filter,
         limit=limit,
+        search_params=SEARCH_PARAMS,
         with_payload=True
     )
     hits = []
@@ -168,73 +155,62 @@ async def search_sparse_async(client, query, limit=10):
         })
     return hits
 
-def main(async_mode=False, reindex=False):
+def main(async_mode=False, reindex=False, concurrency=20, filters=None):
     docs, doc_ids, query_texts, query_ids, qrels_dict = load_nfcorpus()
     client = index_docs(docs, doc_ids, reindex=reindex)
+    # 所有查询限定在同一个范围内（如学科 + 年级）
+    query_filter = to_qdrant_filter(filters)
     if async_mode:
         client.close()
-        asyncio.run(main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex))
+        asyncio.run(main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex, concurrency, query_filter))
     else:
         limit = 10
-        recalls = []
-        precisions = []
+        run = {}
         for idx in tqdm(range(len(query_texts)), desc="Evaluating queries"):
             query_id = query_ids[idx]
             query_text = query_texts[idx]
             if query_id not in qrels_dict or len(qrels_dict[query_id]) == 0:
                 continue
-            results = search_sparse(client, query_text, limit)
-            retrieved_doc_ids = [hit["_payload"]["doc_id"] for hit in results]
-            relevant_doc_ids = qrels_dict[query_id]
-            relevant_retrieved = set(retrieved_doc_ids) & set(relevant_doc_ids)
-            recall = len(relevant_retrieved) / len(relevant_doc_ids)
-            recalls.append(recall)
-            precision = len(relevant_retrieved) / limit
-            precisions.append(precision)
-        average_recall = sum(recalls) / len(recalls)
-        average_precision = sum(precisions) / len(precisions)
-        print(f"\nEvaluation results for {len(recalls)} queries:")
-        print(f"Average Recall@{limit}: {average_recall:.4f}")
-        print(f"Average Precision@{limit}: {average_precision:.4f}")
+            results = search_sparse(client, query_text, limit, query_filter)
+            run[query_id] = [hit["_payload"]["doc_id"] for hit in results]
+        results = ir_metrics.evaluate(run, qrels_dict, cutoffs=(1, 5, limit))
+        ir_metrics.print_results(results, len(run))
         client.close()
 
-async def main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex=False):
+async def main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex=False, concurrency=20,
+                     query_filter=None):
     print("Running in async mode...")
     client = AsyncQdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=True)
     limit = 10
-    recalls = []
-    precisions = []
-    batch_size = 20
-    for batch_start in tqdm(range(0, len(query_texts), batch_size), desc="Processing query batches"):
-        batch_end = min(batch_start + batch_size, len(query_texts))
-        batch_queries = []
-        for idx in range(batch_start, batch_end):
-            query_id = query_ids[idx]
-            query_text = query_texts[idx]
-            if query_id not in qrels_dict or len(qrels_dict[query_id]) == 0:
-                continue
-            batch_queries.append((idx, query_id, query_text))
-        tasks = [search_sparse_async(client, query_text, limit) for _, _, query_text in batch_queries]
-        results = await asyncio.gather(*tasks)
-        for i, (idx, query_id, _) in enumerate(batch_queries):
-            retrieved_doc_ids = [hit["_payload"]["doc_id"] for hit in results[i]]
-            relevant_doc_ids = qrels_dict[query_id]
-            relevant_retrieved = set(retrieved_doc_ids) & set(relevant_doc_ids)
-            recall = len(relevant_retrieved) / len(relevant_doc_ids)
-            recalls.append(recall)
-            precision = len(relevant_retrieved) / limit
-            precisions.append(precision)
-    average_recall = sum(recalls) / len(recalls)
-    average_precision = sum(precisions) / len(precisions)
-    print(f"\nEvaluation results for {len(recalls)} queries:")
-    print(f"Average Recall@{limit}: {average_recall:.4f}")
-    print(f"Average Precision@{limit}: {average_precision:.4f}")
+    run = {}
+    # 用 semaphore 限制在途请求数：一个请求完成就补上下一个，不再等整批里最慢的查询
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run_query(query_id, query_text):
+        async with semaphore:
+            results = await search_sparse_async(client, query_text, limit, query_filter)
+        run[query_id] = [hit["_payload"]["doc_id"] for hit in results]
+
+    # Skip queries without relevant documents
+    tasks = [
+        run_query(query_ids[idx], query_texts[idx])
+        for idx in range(len(query_texts))
+        if query_ids[idx] in qrels_dict and len(qrels_dict[query_ids[idx]]) > 0
+    ]
+    for task in tqdm(asyncio.as_completed(tasks), total=len(tasks), desc="Processing queries"):
+        await task
+    results = ir_metrics.evaluate(run, qrels_dict, cutoffs=(1, 5, limit))
+    ir_metrics.print_results(results, len(run))
     await client.close()
 
 if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description='Evaluate BM25 with Qdrant')
     parser.add_argument('--async', dest='async_mode', action='store_true', help='Run in async mode')
-    parser.add_argument('--reindex', action='store_true', help='Reindex documents (delete and recreate collection)')
+    parser.add_argument('--reindex', action='store_true', help='Sync the collection with the corpus: upsert new or changed docs, delete removed ones (rebuilt when no manifest matches)')
+    parser.add_argument('--concurrency', type=int, default=20, help='Max in-flight queries in async mode')
+    parser.add_argument('--filter', dest='filters', action='append', default=[],
+                        help='Payload filter field=value or field=v1|v2 (any of), repeatable, e.g. --filter tag_names=语文')
     args = parser.parse_args()
-    main(async_mode=args.async_mode, reindex=args.reindex)
+    main(async_mode=args.async_mode, reindex=args.reindex, concurrency=args.concurrency,
+         filters=parse_filter_args(args.filters))
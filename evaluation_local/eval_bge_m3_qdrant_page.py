@@ -1,13 +1,18 @@
 from qdrant_client import QdrantClient, models
 from tqdm import tqdm
 import utils.ir_local_datasets as ir_datasets
+import utils.ir_metrics as ir_metrics
+from retrieval.ingest import sync_collection
+from retrieval.base import Hit, point_id, doc_payload, to_page_id, dense_config
+from retrieval.filters import create_payload_indexes
+from retrieval.storage import collection_kwargs
+from retrieval.aggregation import METHODS, aggregate
 import os
-import hashlib
-import uuid
+from types import SimpleNamespace
 import asyncio
 from qdrant_client.async_qdrant_client import AsyncQdrantClient
-import requests
 from typing import List
+from utils.embedding_client import get_client, QUERY_EMBEDDING_CACHE
 
 DATASET = "temp_output/smartcn/ir_datasets_splitted/tm_textbook"
 # DATASET = "temp_output/smartcn/ir_datasets_splitted/lesson_plan"
@@ -15,17 +20,21 @@ QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", None)
 COLLECTION_NAME = DATASET.replace("/", "_") + "_bge_m3"
 
+# 共享的 embedding 客户端：连接复用、按 token 预算切批、并发受限、失败重试
+embedding_client = get_client("bge-m3")
+
 def get_embedding(texts: List[str]) -> List[List[float]]:
-    url = "http://localhost:9998/v1/embeddings"
-    headers = {"Authorization": "Bearer sk-72tkvudyGLPMi"}
-    data = {"model": "bge-m3", "input": texts}
-    resp = requests.post(url, json=data, headers=headers)
-    resp.raise_for_status()
-    embeddings = [embedding_data['embedding'] for embedding_data in resp.json()["data"]]
-    return embeddings
+    return embedding_client.embed(texts)
+
+def page_qrels(qrels_dict):
+    # 段落级 qrels 折叠为页面级：{query_id: [page_id, ...]}
+    return {
+        qid: list(dict.fromkeys(to_page_id(doc_id) for doc_id in doc_ids))
+        for qid, doc_ids in qrels_dict.items()
+    }
 
 def load_nfcorpus():
-    dataset = ir_datasets.load(DATASET)
+    dataset = ir_datasets.load(DATASET, cache=True)
     corpus = {
         doc.doc_id: {
             "text": doc.text,
@@ -73,125 +82,101 @@ def load_nfcorpus():
 def index_docs(docs, doc_ids, reindex=False):
     print("Indexing documents with bge-m3 embedding...")
     client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=True)
-    if client.collection_exists(COLLECTION_NAME):
-        if reindex:
-            client.delete_collection(COLLECTION_NAME)
-        else:
-            return client
-    client.create_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=models.VectorParams(
-            size=1024,
-            distance=models.Distance.COSINE
+    # 与 eval_bge_m3_qdrant.py / bge_m3_qdrant 后端共用同一个 collection 和 manifest config；
+    # 已有 collection 且不要求 reindex 时直接复用，只补建缺少的 payload 索引（含分组用的 page_id）
+    if client.collection_exists(COLLECTION_NAME) and not reindex:
+        create_payload_indexes(client, COLLECTION_NAME)
+        return client
+
+    def create_collection():
+        client.create_collection(
+            collection_name=COLLECTION_NAME,
+            **collection_kwargs(1024, models.Distance.COSINE)
         )
-    )
-    batch_size = 10
-    for i in tqdm(range(0, len(docs), batch_size)):
-        batch_docs = docs[i:i+batch_size]
-        batch_ids = doc_ids[i:i+batch_size]
+    # embedding_client 会再切成 micro-batch 并发请求，这里只决定每次 upsert 的点数
+    batch_size = 256
+    progress = tqdm(desc="Embedding documents")
+
+    def encode(batch):
+        batch_docs = [doc for _, doc in batch]
         texts = [doc["text"] for doc in batch_docs]
         embeddings = get_embedding(texts)
-        points = []
-        for j, embedding in enumerate(embeddings):
-            doc_id = batch_ids[j]
-            doc = batch_docs[j]
-            if isinstance(doc_id, int):
-                point_id = doc_id
-            else:
-                doc_id_str = str(doc_id)
-                md5_hash = hashlib.md5(doc_id_str.encode()).hexdigest()
-                point_id = str(uuid.UUID(md5_hash))
-            points.append(models.PointStruct(
-                id=point_id,
-                vector=embedding,
-                payload={
-                    "doc_id": doc_id,
-                    "text": doc["text"],
-                    "metadata_fields": doc.get("metadata_fields", {})
-                }
-            ))
-        client.upsert(
-            collection_name=COLLECTION_NAME,
-            points=points,
-            wait=True
+        progress.update(len(batch))
+        return embeddings
+
+    def make_point(item, embedding):
+        doc_id, doc = item
+        # doc_payload 带 page_id：metadata_fields 里没有时由 doc_id 推出
+        return models.PointStruct(
+            id=point_id(doc_id),
+            vector=embedding,
+            payload=doc_payload(SimpleNamespace(doc_id=doc_id, text=doc["text"],
+                                                metadata_fields=doc.get("metadata_fields")))
         )
+
+    # 按 doc_id + 内容哈希增量同步：只上传新增或变化的文档、删除已移除的文档；
+    # embedding 与上传流水线并行（upload_points, wait=False），返回前等待所有点写入可见
+    sync_collection(client, COLLECTION_NAME, zip(doc_ids, docs), create_collection, encode, make_point,
+                    reindex=reindex, config=dense_config("bge-m3", 1024, models.Distance.COSINE), batch_size=batch_size)
+    progress.close()
+    # query_points_groups 按 page_id 分组，keyword 索引加速分组
+    create_payload_indexes(client, COLLECTION_NAME)
     return client
 
-def search_sparse(client, query, limit=10):
-    query_vector = get_embedding([query])[0]
-    result = client.search(
+def to_hits(groups):
+    return [Hit(point.payload["doc_id"], point.score, point.payload) for group in groups for point in group.hits]
+
+def search_pages(client, query, num_groups=10, group_size=3):
+    # query_points_groups 在服务端按 page_id 分组：num_groups 个页面（按页面内最好段落排序），
+    # 每个页面带回得分最高的 group_size 个段落
+    query_vector = embedding_client.embed([query], cache=QUERY_EMBEDDING_CACHE)[0]
+    result = client.query_points_groups(
         collection_name=COLLECTION_NAME,
-        query_vector=query_vector,
-        limit=limit,
+        query=query_vector,
+        group_by="page_id",
+        limit=num_groups,
+        group_size=group_size,
         with_payload=True
     )
-    hits = []
-    for hit in result:
-        hits.append({
-            "_id": hit.id,
-            "_score": hit.score,
-            "_payload": hit.payload
-        })
-    return hits
-
-async def search_sparse_async(client, query, limit=10):
-    loop = asyncio.get_event_loop()
-    query_vector = await loop.run_in_executor(
-        None,
-        lambda: get_embedding([query])[0]
-    )
-    result = await client.search(
+    return to_hits(result.groups)
+
+async def search_pages_async(client, query, num_groups=10, group_size=3):
+    query_vector = (await embedding_client.aembed([query], cache=QUERY_EMBEDDING_CACHE))[0]
+    result = await client.query_points_groups(
         collection_name=COLLECTION_NAME,
-        query_vector=query_vector,
-        limit=limit,
+        query=query_vector,
+        group_by="page_id",
+        limit=num_groups,
+        group_size=group_size,
         with_payload=True
     )
-    hits = []
-    for hit in result:
-        hits.append({
-            "_id": hit.id,
-            "_score": hit.score,
-            "_payload": hit.payload
-        })
-    return hits
-
-def main(async_mode=False, reindex=False):
+    return to_hits(result.groups)
+
+def main(async_mode=False, reindex=False, method="maxp", limit=10, group_size=3, fetch_factor=3):
     docs, doc_ids, query_texts, query_ids, qrels_dict = load_nfcorpus()
     client = index_docs(docs, doc_ids, reindex=reindex)
+    # maxp 正好取 limit 个页面；sump / rrf 多取候选页面，用页面内段落重新打分
+    num_groups = limit if method == "maxp" else limit * fetch_factor
     if async_mode:
         client.close()
-        asyncio.run(main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex))
+        asyncio.run(main_async(query_texts, query_ids, qrels_dict, method, limit, num_groups, group_size))
     else:
-        limit = 10
-        recalls = []
-        precisions = []
+        run = {}
         for idx in tqdm(range(len(query_texts)), desc="Evaluating queries"):
             query_id = query_ids[idx]
             query_text = query_texts[idx]
             if query_id not in qrels_dict or len(qrels_dict[query_id]) == 0:
                 continue
-            results = search_sparse(client, query_text, limit)
-            # 去掉最后的 _{number} 并对 retrieved_doc_ids 和 relevant_doc_ids 都去重
-            retrieved_doc_ids = list(set([hit["_payload"]["doc_id"].rsplit("_", 1)[0] for hit in results]))
-            relevant_doc_ids = list(set([doc_id.rsplit("_", 1)[0] for doc_id in qrels_dict[query_id]]))
-            relevant_retrieved = set(retrieved_doc_ids) & set(relevant_doc_ids)
-            recall = len(relevant_retrieved) / len(relevant_doc_ids) if relevant_doc_ids else 0
-            recalls.append(recall)
-            precision = len(relevant_retrieved) / limit
-            precisions.append(precision)
-        average_recall = sum(recalls) / len(recalls)
-        average_precision = sum(precisions) / len(precisions)
-        print(f"\nEvaluation results for {len(recalls)} queries:")
-        print(f"Average Recall@{limit}: {average_recall:.4f}")
-        print(f"Average Precision@{limit}: {average_precision:.4f}")
+            paragraphs = search_pages(client, query_text, num_groups, group_size)
+            run[query_id] = [page.doc_id for page in aggregate(paragraphs, limit, method)]
+        results = ir_metrics.evaluate(run, page_qrels(qrels_dict), cutoffs=(1, 5, limit))
+        ir_metrics.print_results(results, len(run))
         client.close()
 
-async def main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex=False):
+async def main_async(query_texts, query_ids, qrels_dict, method="maxp", limit=10, num_groups=10, group_size=3):
     print("Running in async mode...")
     client = AsyncQdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=True)
-    limit = 10
-    recalls = []
-    precisions = []
+    run = {}
     batch_size = 20
     for batch_start in tqdm(range(0, len(query_texts), batch_size), desc="Processing query batches"):
         batch_end = min(batch_start + batch_size, len(query_texts))
@@ -202,28 +187,22 @@ async def main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex=
             if query_id not in qrels_dict or len(qrels_dict[query_id]) == 0:
                 continue
             batch_queries.append((idx, query_id, query_text))
-        tasks = [search_sparse_async(client, query_text, limit) for _, _, query_text in batch_queries]
+        tasks = [search_pages_async(client, query_text, num_groups, group_size) for _, _, query_text in batch_queries]
         results = await asyncio.gather(*tasks)
         for i, (idx, query_id, _) in enumerate(batch_queries):
-            # 修改：去掉最后的 _{number} 并去重
-            retrieved_doc_ids = list(set([hit["_payload"]["doc_id"].rsplit("_", 1)[0] for hit in results[i]]))
-            relevant_doc_ids = list(set([doc_id.rsplit("_", 1)[0] for doc_id in qrels_dict[query_id]]))
-            relevant_retrieved = set(retrieved_doc_ids) & set(relevant_doc_ids)
-            recall = len(relevant_retrieved) / len(relevant_doc_ids) if relevant_doc_ids else 0
-            recalls.append(recall)
-            precision = len(relevant_retrieved) / limit
-            precisions.append(precision)
-    average_recall = sum(recalls) / len(recalls)
-    average_precision = sum(precisions) / len(precisions)
-    print(f"\nEvaluation results for {len(recalls)} queries:")
-    print(f"Average Recall@{limit}: {average_recall:.4f}")
-    print(f"Average Precision@{limit}: {average_precision:.4f}")
+            run[query_id] = [page.doc_id for page in aggregate(results[i], limit, method)]
+    results = ir_metrics.evaluate(run, page_qrels(qrels_dict), cutoffs=(1, 5, limit))
+    ir_metrics.print_results(results, len(run))
     await client.close()
 
 if __name__ == "__main__":
     import argparse
-    parser = argparse.ArgumentParser(description='Evaluate BM25 with Qdrant')
+    parser = argparse.ArgumentParser(description='Evaluate page-level bge-m3 retrieval with Qdrant')
     parser.add_argument('--async', dest='async_mode', action='store_true', help='Run in async mode')
-    parser.add_argument('--reindex', action='store_true', help='Reindex documents (delete and recreate collection)')
+    parser.add_argument('--reindex', action='store_true', help='Sync the collection with the corpus: upsert new or changed docs, delete removed ones (rebuilt when no manifest matches)')
+    parser.add_argument('--method', default="maxp", choices=METHODS, help='Paragraph to page aggregation')
+    parser.add_argument('--limit', type=int, default=10, help='Pages per query')
+    parser.add_argument('--group-size', type=int, default=3, help='Paragraphs returned per page (sump / rrf)')
+    parser.add_argument('--fetch-factor', type=int, default=3, help='Candidate pages per result page for sump / rrf')
     args = parser.parse_args()
-    main(async_mode=args.async_mode, reindex=args.reindex)
+    main(args.async_mode, args.reindex, args.method, args.limit, args.group_size, args.fetch_factor)
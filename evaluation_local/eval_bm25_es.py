@@ -3,6 +3,8 @@ import re
 import json
 import os
 import utils.ir_local_datasets as ir_datasets
+import utils.ir_metrics as ir_metrics
+from utils.index_manifest import IndexManifest, content_hash, plan_sync
 import argparse
 from tqdm import tqdm
 import shutil
@@ -18,7 +20,7 @@ def sanitize_query_for_es(query):
 
 def load_dataset():
     print(f"Loading dataset {DATASET}...")
-    dataset = ir_datasets.load(DATASET)
+    dataset = ir_datasets.load(DATASET, cache=True)
     dataset_name = dataset.name
 
     # Load documents, queries, and relevance judgments
@@ -81,7 +83,14 @@ def setup_es_index(dataset_name, docs, doc_ids):
         verify_certs=False
     )
     index_name = ES_INDEX_PREFIX + dataset_name.replace("/", "_")
-    if es.indices.exists(index=index_name):
+    # 按 doc_id + 内容哈希增量同步：已有索引只写入新增或变化的文档、删除已移除的文档，
+    # 没有可用的 manifest 时才删除重建
+    exists = es.indices.exists(index=index_name)
+    manifest = IndexManifest("es", index_name, config="bm25:ik_smart")
+    hashes = {doc_ids[i]: content_hash(docs[i]) for i in range(len(docs))}
+    indexed_count = es.count(index=index_name)["count"] if exists else None
+    full, changed, removed = plan_sync(manifest, hashes, exists, indexed_count)
+    if full and exists:
         es.indices.delete(index=index_name)
     # 创建 mapping，使用 ik_smart 分词器，并添加 metadata_fields
     mapping = {
@@ -111,7 +120,9 @@ def setup_es_index(dataset_name, docs, doc_ids):
             }
         }
     }
-    es.indices.create(index=index_name, body=mapping)
+    if full:
+        es.indices.create(index=index_name, body=mapping)
+    changed = set(changed)
     # 批量写入文档，包含 metadata_fields
     actions = [
         {
@@ -123,12 +134,14 @@ def setup_es_index(dataset_name, docs, doc_ids):
                 "metadata_fields": docs[i]["metadata_fields"]
             }
         }
-        for i in range(len(docs))
+        for i in range(len(docs)) if doc_ids[i] in changed
     ]
+    actions += [{"_op_type": "delete", "_index": index_name, "_id": doc_id} for doc_id in removed]
     helpers.bulk(es, actions)
-    print(f"Indexed {len(docs)} documents to {index_name}.")
+    print(f"Indexed {len(changed)} documents to {index_name}, deleted {len(removed)}.")
     # flush index to ensure it's ready for search
     es.indices.refresh(index=index_name)
+    manifest.save(hashes)
     return es, index_name
 
 def search_bm25(es, index_name, query, limit):
@@ -155,27 +168,16 @@ def main(async_mode=False):
     print(f"Index contains {es.count(index=index_name)['count']} documents.")
     limit = 10
     number_of_queries = min(len(query_texts), 100_000)
-    recalls = []
-    precisions = []
+    run = {}
     for idx in tqdm(range(number_of_queries), desc="Evaluating queries"):
         query_id = query_ids[idx]
         query_text = query_texts[idx]
         if query_id not in qrels_dict or len(qrels_dict[query_id]) == 0:
             continue
         results = search_bm25(es, index_name, query_text, limit)
-        retrieved_doc_ids = [hit["_source"]["doc_id"] for hit in results]
-        relevant_doc_ids = qrels_dict[query_id]
-        relevant_retrieved = set(retrieved_doc_ids) & set(relevant_doc_ids)
-        recall = len(relevant_retrieved) / len(relevant_doc_ids)
-        recalls.append(recall)
-        precision = len(relevant_retrieved) / limit
-        precisions.append(precision)
-        # print(f"Query {idx+1}/{number_of_queries}: {query_id}, Recall@10: {recall:.3f}, Precision@10: {precision:.3f}")
-    average_recall = sum(recalls) / len(recalls) if recalls else 0
-    average_precision = sum(precisions) / len(precisions) if precisions else 0
-    print(f"\nEvaluation results for {len(recalls)} queries:")
-    print(f"Average Recall@{limit}: {average_recall:.4f}")
-    print(f"Average Precision@{limit}: {average_precision:.4f}")
+        run[query_id] = [hit["_source"]["doc_id"] for hit in results]
+    results = ir_metrics.evaluate(run, qrels_dict, cutoffs=(1, 5, limit))
+    ir_metrics.print_results(results, len(run))
 
 
 if __name__ == "__main__":
@@ -3,6 +3,10 @@ import re
 import json
 import os
 import utils.ir_local_datasets as ir_datasets
+import utils.ir_metrics as ir_metrics
+from utils.index_manifest import IndexManifest, content_hash, plan_sync
+from retrieval.base import Hit, to_page_id
+from retrieval.aggregation import METHODS, aggregate
 import argparse
 from tqdm import tqdm
 import shutil
@@ -16,9 +20,16 @@ def sanitize_query_for_es(query):
     query = re.sub(r'([+\-!(){}\[\]^"~*?:\\<\'])', r' ', query)
     return query
 
+def page_qrels(qrels_dict):
+    # 段落级 qrels 折叠为页面级：{query_id: [page_id, ...]}
+    return {
+        qid: list(dict.fromkeys(to_page_id(doc_id) for doc_id in doc_ids))
+        for qid, doc_ids in qrels_dict.items()
+    }
+
 def load_dataset():
     print(f"Loading dataset {DATASET}...")
-    dataset = ir_datasets.load(DATASET)
+    dataset = ir_datasets.load(DATASET, cache=True)
     dataset_name = dataset.name
 
     # Load documents, queries, and relevance judgments
@@ -81,7 +92,14 @@ def setup_es_index(dataset_name, docs, doc_ids):
         verify_certs=False
     )
     index_name = ES_INDEX_PREFIX + dataset_name.replace("/", "_")
-    if es.indices.exists(index=index_name):
+    # 按 doc_id + 内容哈希增量同步：已有索引只写入新增或变化的文档、删除已移除的文档，
+    # 没有可用的 manifest 时才删除重建
+    exists = es.indices.exists(index=index_name)
+    manifest = IndexManifest("es", index_name, config="bm25:ik_smart:page_id")
+    hashes = {doc_ids[i]: content_hash(docs[i]) for i in range(len(docs))}
+    indexed_count = es.count(index=index_name)["count"] if exists else None
+    full, changed, removed = plan_sync(manifest, hashes, exists, indexed_count)
+    if full and exists:
         es.indices.delete(index=index_name)
     # 创建 mapping，使用 ik_smart 分词器，并添加 metadata_fields
     mapping = {
@@ -104,6 +122,10 @@ def setup_es_index(dataset_name, docs, doc_ids):
                 "doc_id": {
                     "type": "keyword"
                 },
+                # 段落所属页面，collapse 按它分组
+                "page_id": {
+                    "type": "keyword"
+                },
                 "metadata_fields": {
                     "type": "object",
                     "enabled": True
@@ -111,7 +133,9 @@ def setup_es_index(dataset_name, docs, doc_ids):
             }
         }
     }
-    es.indices.create(index=index_name, body=mapping)
+    if full:
+        es.indices.create(index=index_name, body=mapping)
+    changed = set(changed)
     # 批量写入文档，包含 metadata_fields
     actions = [
         {
@@ -120,18 +144,23 @@ def setup_es_index(dataset_name, docs, doc_ids):
             "_source": {
                 "content": docs[i]["text"],
                 "doc_id": doc_ids[i],
+                "page_id": (docs[i]["metadata_fields"] or {}).get("page_id") or to_page_id(doc_ids[i]),
                 "metadata_fields": docs[i]["metadata_fields"]
             }
         }
-        for i in range(len(docs))
+        for i in range(len(docs)) if doc_ids[i] in changed
     ]
+    actions += [{"_op_type": "delete", "_index": index_name, "_id": doc_id} for doc_id in removed]
     helpers.bulk(es, actions)
-    print(f"Indexed {len(docs)} documents to {index_name}.")
+    print(f"Indexed {len(changed)} documents to {index_name}, deleted {len(removed)}.")
     # flush index to ensure it's ready for search
     es.indices.refresh(index=index_name)
+    manifest.save(hashes)
     return es, index_name
 
-def search_bm25(es, index_name, query, limit):
+def search_bm25(es, index_name, query, limit, group_size=3):
+    # collapse 在服务端按 page_id 分组：返回 limit 个页面（按页面内最好段落排序），
+    # inner_hits 带回每个页面得分最高的 group_size 个段落
     query = sanitize_query_for_es(query)
     content = {
         "query": {
@@ -141,45 +170,45 @@ def search_bm25(es, index_name, query, limit):
                     "analyzer": "ik_smart"
                 }
             }
+        },
+        "collapse": {
+            "field": "page_id",
+            "inner_hits": {"name": "paragraphs", "size": group_size, "sort": [{"_score": "desc"}]}
         }
     }
     res = es.search(index=index_name, body=content, size=limit)
-    hits = res["hits"]["hits"]
-    return hits
+    return [
+        Hit(paragraph["_source"]["doc_id"], paragraph["_score"], paragraph["_source"])
+        for hit in res["hits"]["hits"]
+        for paragraph in hit["inner_hits"]["paragraphs"]["hits"]["hits"]
+    ]
 
-def main(async_mode=False):
+def main(method="maxp", limit=10, group_size=3, fetch_factor=3):
     # Load dataset
     dataset_name, docs, doc_ids, query_texts, query_ids, qrels_dict = load_dataset()
     # Setup Elasticsearch index
     es, index_name = setup_es_index(dataset_name, docs, doc_ids)
     print(f"Index contains {es.count(index=index_name)['count']} documents.")
-    limit = 10
     number_of_queries = min(len(query_texts), 100_000)
-    recalls = []
-    precisions = []
+    # maxp 正好取 limit 个页面；sump / rrf 多取候选页面，用页面内段落重新打分
+    num_groups = limit if method == "maxp" else limit * fetch_factor
+    run = {}
     for idx in tqdm(range(number_of_queries), desc="Evaluating queries"):
         query_id = query_ids[idx]
         query_text = query_texts[idx]
         if query_id not in qrels_dict or len(qrels_dict[query_id]) == 0:
             continue
-        results = search_bm25(es, index_name, query_text, limit)
-        # 去掉最后的 _{number} 并对 retrieved_doc_ids 和 relevant_doc_ids 都去重
-        retrieved_doc_ids = list(set([hit["_source"]["doc_id"].rsplit("_", 1)[0] for hit in results]))
-        relevant_doc_ids = list(set([doc_id.rsplit("_", 1)[0] for doc_id in qrels_dict[query_id]]))
-        relevant_retrieved = set(retrieved_doc_ids) & set(relevant_doc_ids)
-        recall = len(relevant_retrieved) / len(relevant_doc_ids) if relevant_doc_ids else 0
-        recalls.append(recall)
-        precision = len(relevant_retrieved) / limit
-        precisions.append(precision)
-        # print(f"Query {idx+1}/{number_of_queries}: {query_id}, Recall@10: {recall:.3f}, Precision@10: {precision:.3f}")
-    average_recall = sum(recalls) / len(recalls) if recalls else 0
-    average_precision = sum(precisions) / len(precisions) if precisions else 0
-    print(f"\nEvaluation results for {len(recalls)} queries:")
-    print(f"Average Recall@{limit}: {average_recall:.4f}")
-    print(f"Average Precision@{limit}: {average_precision:.4f}")
+        paragraphs = search_bm25(es, index_name, query_text, num_groups, group_size)
+        run[query_id] = [page.doc_id for page in aggregate(paragraphs, limit, method)]
+    results = ir_metrics.evaluate(run, page_qrels(qrels_dict), cutoffs=(1, 5, limit))
+    ir_metrics.print_results(results, len(run))
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description='Evaluate BM25 with Tantivy')
+    parser = argparse.ArgumentParser(description='Evaluate page-level BM25 with Elasticsearch')
+    parser.add_argument('--method', default="maxp", choices=METHODS, help='Paragraph to page aggregation')
+    parser.add_argument('--limit', type=int, default=10, help='Pages per query')
+    parser.add_argument('--group-size', type=int, default=3, help='Paragraphs returned per page (sump / rrf)')
+    parser.add_argument('--fetch-factor', type=int, default=3, help='Candidate pages per result page for sump / rrf')
     args = parser.parse_args()
-    main()
+    main(args.method, args.limit, args.group_size, args.fetch_factor)
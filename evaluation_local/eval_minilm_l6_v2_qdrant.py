@@ -1,25 +1,40 @@
 from qdrant_client import QdrantClient, models
 from tqdm import tqdm
 import utils.ir_local_datasets as ir_datasets
+import utils.ir_metrics as ir_metrics
+from retrieval.ingest import sync_collection, dense_batch
+from retrieval.base import point_id, doc_payload, dense_config
+from retrieval.storage import QDRANT_STORAGE, collection_kwargs, search_params, storage_suffix
 import os
-import hashlib
-import uuid
+from types import SimpleNamespace
 import asyncio
 from qdrant_client.async_qdrant_client import AsyncQdrantClient
 from sentence_transformers import SentenceTransformer
+from utils.embedding_cache import EmbeddingCache
+from utils.embedding_client import QUERY_EMBEDDING_CACHE
 
 # DATASET = "temp_output/smartcn/ir_datasets_splitted/tm_textbook"
 DATASET = "temp_output/smartcn/ir_datasets_splitted/lesson_plan"
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
 QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", None)
-COLLECTION_NAME = DATASET.replace("/", "_") + "_minilm_l6_v2"
+COLLECTION_NAME = DATASET.replace("/", "_") + "_minilm_l6_v2" + storage_suffix(QDRANT_STORAGE)
+# QDRANT_STORAGE 选择存储方案（int8 / binary / on_disk / on_disk_payload，可用 + 组合），量化方案查询时 rescore
+SEARCH_PARAMS = search_params(QDRANT_STORAGE)
 
 # Create a global model instance to avoid recreating it for each query
 model = SentenceTransformer("all-MiniLM-L6-v2")
+# 磁盘 embedding 缓存：--reindex 时只对新增或改动的文本重新编码
+embedding_cache = EmbeddingCache("all-MiniLM-L6-v2")
+
+def embed_query(query):
+    # query 默认直接过模型，计时测的是编码延迟；QUERY_EMBEDDING_CACHE=1 时也走缓存
+    if QUERY_EMBEDDING_CACHE:
+        return embedding_cache.embed([query], lambda missing: model.encode(missing, convert_to_numpy=True))[0]
+    return model.encode([query], convert_to_numpy=True)[0]
 
 # Load nfcorpus data using ir_datasets
 def load_nfcorpus():
-    dataset = ir_datasets.load(DATASET)
+    dataset = ir_datasets.load(DATASET, cache=True)
     # corpus: dict[str, dict], queries: dict[str, str], qrels: dict[str, dict[str, int]]
     corpus = {
         doc.doc_id: {
@@ -70,56 +85,48 @@ def load_nfcorpus():
 def index_docs(docs, doc_ids, reindex=False):
     print("Indexing documents with SentenceTransformer...")
     client = QdrantClient(url=QDRANT_URL, api_key=QDRANT_API_KEY, prefer_grpc=True)
-    if client.collection_exists(COLLECTION_NAME):
-        if reindex:
-            client.delete_collection(COLLECTION_NAME)
-        else:
-            return client
-    client.create_collection(
-        collection_name=COLLECTION_NAME,
-        vectors_config=models.VectorParams(
-            size=384,
-            distance=models.Distance.COSINE
+    # 已有 collection 且不要求 reindex 时直接复用
+    if client.collection_exists(COLLECTION_NAME) and not reindex:
+        return client
+
+    def create_collection():
+        client.create_collection(
+            collection_name=COLLECTION_NAME,
+            **collection_kwargs(384, models.Distance.COSINE, QDRANT_STORAGE)
         )
-    )
     batch_size = 64
-    for i in tqdm(range(0, len(docs), batch_size)):
-        batch_docs = docs[i:i+batch_size]
-        batch_ids = doc_ids[i:i+batch_size]
+    progress = tqdm(desc="Embedding documents")
+
+    def encode(batch):
+        batch_docs = [doc for _, doc in batch]
         texts = [doc["text"] for doc in batch_docs]
-        embeddings = model.encode(texts, convert_to_numpy=True, device="cuda")
-        points = []
-        for j, embedding in enumerate(embeddings):
-            doc_id = batch_ids[j]
-            doc = batch_docs[j]
-            if isinstance(doc_id, int):
-                point_id = doc_id
-            else:
-                doc_id_str = str(doc_id)
-                md5_hash = hashlib.md5(doc_id_str.encode()).hexdigest()
-                point_id = str(uuid.UUID(md5_hash))
-            points.append(models.PointStruct(
-                id=point_id,
-                vector=embedding.tolist(),
-                payload={
-                    "doc_id": doc_id,
-                    "text": doc["text"],
-                    "metadata_fields": doc.get("metadata_fields", {})
-                }
-            ))
-        client.upsert(
-            collection_name=COLLECTION_NAME,
-            points=points,
-            wait=True
-        )
+        embeddings = embedding_cache.embed(texts, lambda missing: model.encode(missing, convert_to_numpy=True, device="cuda"))
+        progress.update(len(batch))
+        return embeddings
+
+    def make_batch(batch, embeddings):
+        # 整批列式上传（models.Batch），整个向量矩阵只做一次 tolist()
+        payloads = [
+            doc_payload(SimpleNamespace(doc_id=doc_id, text=doc["text"], metadata_fields=doc.get("metadata_fields")))
+            for doc_id, doc in batch
+        ]
+        return dense_batch([point_id(doc_id) for doc_id, _ in batch], embeddings, payloads)
+
+    # 按 doc_id + 内容哈希增量同步：只上传新增或变化的文档、删除已移除的文档；
+    # embedding 与上传流水线并行（upsert, wait=False），返回前等待所有点写入可见
+    sync_collection(client, COLLECTION_NAME, zip(doc_ids, docs), create_collection, encode, make_batch=make_batch,
+                    reindex=reindex, config=dense_config("all-MiniLM-L6-v2", 384, models.Distance.COSINE, QDRANT_STORAGE),
+                    batch_size=batch_size)
+    progress.close()
     return client
 
 def search_sparse(client, query, limit=10):
-    query_vector = model.encode(query, convert_to_numpy=True)
+    query_vector = embed_query(query)
     result = client.search(
         collection_name=COLLECTION_NAME,
         query_vector=query_vector,
         limit=limit,
+        search_params=SEARCH_PARAMS,
         with_payload=True
     )
     # 返回结构与 BM25 类似
@@ -135,12 +142,13 @@ def search_sparse(client, query, limit=10):
 async def search_sparse_async(client, query, limit=10):
     query_vector = await asyncio.get_event_loop().run_in_executor(
         None, 
-        lambda: model.encode(query, convert_to_numpy=True)
+        lambda: embed_query(query)
     )
     result = await client.search(
         collection_name=COLLECTION_NAME,
         query_vector=query_vector,
         limit=limit,
+        search_params=SEARCH_PARAMS,
         with_payload=True
     )
     hits = []
@@ -165,8 +173,7 @@ def main(async_mode=False, reindex=False):
     else:
         # Evaluation
         limit = 10
-        recalls = []
-        precisions = []
+        run = {}
         
         for idx in tqdm(range(len(query_texts)), desc="Evaluating queries"):
             query_id = query_ids[idx]
@@ -179,27 +186,9 @@ def main(async_mode=False, reindex=False):
             # Search using SentenceTransformer
             results = search_sparse(client, query_text, limit)
             # 修正此处，适配 hits 结构
-            retrieved_doc_ids = [hit["_payload"]["doc_id"] for hit in results]
-            
-            # Calculate metrics
-            relevant_doc_ids = qrels_dict[query_id]
-            relevant_retrieved = set(retrieved_doc_ids) & set(relevant_doc_ids)
-            
-            # Recall@10: proportion of relevant docs retrieved in top-10
-            recall = len(relevant_retrieved) / len(relevant_doc_ids)
-            recalls.append(recall)
-            
-            # Precision@10: proportion of retrieved docs that are relevant
-            precision = len(relevant_retrieved) / limit
-            precisions.append(precision)
-    
-        # Report overall results
-        average_recall = sum(recalls) / len(recalls)
-        average_precision = sum(precisions) / len(precisions)
-        
-        print(f"\nEvaluation results for {len(recalls)} queries:")
-        print(f"Average Recall@{limit}: {average_recall:.4f}")
-        print(f"Average Precision@{limit}: {average_precision:.4f}")
+            run[query_id] = [hit["_payload"]["doc_id"] for hit in results]
+        results = ir_metrics.evaluate(run, qrels_dict, cutoffs=(1, 5, limit))
+        ir_metrics.print_results(results, len(run))
 
         client.close()  # Close the client after evaluation
 
@@ -210,8 +199,7 @@ async def main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex=
     # Note: Async indexing is not implemented; assumes sync indexing already done.
     # Evaluation
     limit = 10
-    recalls = []
-    precisions = []
+    run = {}
     
     # Process queries in batches for better async performance
     batch_size = 20  # Increased batch size for better concurrency
@@ -239,27 +227,9 @@ async def main_async(docs, doc_ids, query_texts, query_ids, qrels_dict, reindex=
         # Process results
         for i, (idx, query_id, _) in enumerate(batch_queries):
             # 修正此处，适配 hits 结构
-            retrieved_doc_ids = [hit["_payload"]["doc_id"] for hit in results[i]]
-            
-            # Calculate metrics
-            relevant_doc_ids = qrels_dict[query_id]
-            relevant_retrieved = set(retrieved_doc_ids) & set(relevant_doc_ids)
-            
-            # Recall@10: proportion of relevant docs retrieved in top-10
-            recall = len(relevant_retrieved) / len(relevant_doc_ids)
-            recalls.append(recall)
-            
-            # Precision@10: proportion of retrieved docs that are relevant
-            precision = len(relevant_retrieved) / limit
-            precisions.append(precision)
-    
-    # Report overall results
-    average_recall = sum(recalls) / len(recalls)
-    average_precision = sum(precisions) / len(precisions)
-    
-    print(f"\nEvaluation results for {len(recalls)} queries:")
-    print(f"Average Recall@{limit}: {average_recall:.4f}")
-    print(f"Average Precision@{limit}: {average_precision:.4f}")
+            run[query_id] = [hit["_payload"]["doc_id"] for hit in results[i]]
+    results = ir_metrics.evaluate(run, qrels_dict, cutoffs=(1, 5, limit))
+    ir_metrics.print_results(results, len(run))
     
     await client.close()
 
@@ -267,7 +237,7 @@ if __name__ == "__main__":
     import argparse
     parser = argparse.ArgumentParser(description='Evaluate BM25 with Qdrant')
     parser.add_argument('--async', dest='async_mode', action='store_true', help='Run in async mode')
-    parser.add_argument('--reindex', action='store_true', help='Reindex documents (delete and recreate collection)')
+    parser.add_argument('--reindex', action='store_true', help='Sync the collection with the corpus: upsert new or changed docs, delete removed ones (rebuilt when no manifest matches)')
     args = parser.parse_args()
     
     main(async_mode=args.async_mode, reindex=args.reindex)
@@ -0,0 +1,121 @@
+import random
+import argparse
+from tqdm import tqdm
+
+import utils.ir_metrics as ir_metrics
+from retrieval import create_retriever, doc_payload
+from retrieval.benchmark import timed_search, summarize_latencies, write_report
+from retrieval.filters import to_qdrant_filter, parse_filter_args
+from evaluation_local.run_benchmark import DATASET, load_dataset, print_table
+
+# 对比带 payload 过滤与不过滤的稠密检索：延迟（p50/p95/p99）、效果和过滤条件的选择度。
+# 过滤条件可以对所有查询固定（--filter），也可以按固定种子为每个查询随机抽一篇语料文档、取其字段值生成（--scope-fields），
+# 模拟产品里总是限定学科 / 年级等范围的检索。随机范围与查询无关，qrels 里的相关文档可能被过滤掉，
+# 这时过滤一行只报告延迟和选择度，不报告 Recall / nDCG 等效果指标
+MODELS = ("bge_m3", "minilm")
+
+
+def scope_filter(doc, fields):
+    """
+    [(field, value)] pinning the given payload fields to the values of doc;
+    every value of an array field (e.g. tag_names) becomes its own condition,
+    so a doc tagged 语文 and 七年级 scopes to both the subject and the grade.
+    """
+    payload = doc_payload(doc)
+    filters = []
+    for field in fields:
+        value = payload.get(field)
+        if value is None:
+            continue
+        if isinstance(value, list):
+            filters.extend((field, v) for v in value)
+        else:
+            filters.append((field, value))
+    return filters
+
+
+def sample_scopes(docs, fields, n, seed=0):
+    """
+    n scope filters from corpus docs drawn with a fixed seed, among the docs
+    that carry at least one of fields.
+    """
+    candidates = [doc for doc in docs if scope_filter(doc, fields)]
+    if not candidates:
+        raise ValueError(f"No document has any of the scope fields {', '.join(fields)}")
+    rng = random.Random(seed)
+    return [scope_filter(rng.choice(candidates), fields) for _ in range(n)]
+
+
+def filter_key(filters):
+    return tuple((field, tuple(value) if isinstance(value, list) else value) for field, value in filters or [])
+
+
+def run_queries(retriever, query_ids, query_texts, query_filters, limit):
+    run = {}
+    samples = []
+    for query_id, query_text, filters in tqdm(zip(query_ids, query_texts, query_filters), total=len(query_ids),
+                                              desc=f"Querying {retriever.name}"):
+        hits, sample = timed_search(retriever, query_text, limit, filters=filters)
+        run[query_id] = [hit.doc_id for hit in hits]
+        samples.append(sample)
+    return run, samples
+
+
+def main(dataset, model="bge_m3", filters=None, scope_fields=None, use_ir_datasets=False, limit=10, max_queries=1000,
+         warmup=20, reindex=False, output=None, seed=0):
+    if not filters and not scope_fields:
+        raise ValueError("Give fixed filters or scope fields to filter by")
+    docs, query_ids, query_texts, qrels_dict = load_dataset(dataset, use_ir_datasets)
+    query_ids, query_texts = query_ids[:max_queries], query_texts[:max_queries]
+    if scope_fields:
+        query_filters = sample_scopes(docs, scope_fields, len(query_ids), seed)
+    else:
+        query_filters = [filters] * len(query_ids)
+    warmup = min(warmup, len(query_ids) // 2)
+
+    rows = []
+    with create_retriever(f"{model}_qdrant", dataset) as dense:
+        dense.index(docs, reindex=reindex)
+        client, collection_name = dense.client, dense.collection_name
+        total = client.count(collection_name=collection_name, exact=True).count
+        # 每种过滤条件命中的点数占比，选择度越低 Qdrant 越可能直接走 payload 索引而不是 HNSW
+        counts = {}
+        for query_filter in query_filters:
+            key = filter_key(query_filter)
+            if key not in counts:
+                counts[key] = client.count(collection_name=collection_name, count_filter=to_qdrant_filter(query_filter),
+                                           exact=True).count
+        selectivity = sum(counts[filter_key(f)] for f in query_filters) / (len(query_filters) * total) if total else 0.0
+        for mode, mode_filters in (("unfiltered", [None] * len(query_ids)), ("filtered", query_filters)):
+            run, samples = run_queries(dense, query_ids, query_texts, mode_filters, limit)
+            row = {"mode": mode, "selectivity": selectivity if mode == "filtered" else 1.0, "warmup": warmup}
+            row.update(summarize_latencies(samples, warmup))
+            if mode == "unfiltered" or not scope_fields:
+                row.update(ir_metrics.evaluate(run, qrels_dict, cutoffs=(1, 5, limit)))
+            rows.append(row)
+    print_table(rows)
+    if output:
+        write_report([{"dataset": dataset, "model": model, "limit": limit, **row} for row in rows], output)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare filtered and unfiltered Qdrant dense search latency')
+    parser.add_argument('--dataset', default=DATASET, help='Local dataset directory, or an ir_datasets id with --ir-datasets')
+    parser.add_argument('--ir-datasets', dest='use_ir_datasets', action='store_true', help='Load --dataset through ir_datasets')
+    parser.add_argument('--model', default="bge_m3", choices=MODELS, help='Dense model / collection to query')
+    parser.add_argument('--filter', dest='filters', action='append', default=[],
+                        help='Filter applied to every query: field=value or field=v1|v2 (any of), repeatable')
+    parser.add_argument('--scope-fields', default=None,
+                        help='Comma separated payload fields (e.g. tag_names,resource_type_code) pinned per query '
+                             'to the values of a corpus document sampled with --seed')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for sampling scope documents')
+    parser.add_argument('--limit', type=int, default=10, help='Results per query')
+    parser.add_argument('--max-queries', type=int, default=1000, help='Queries per mode')
+    parser.add_argument('--warmup', type=int, default=20, help='Queries excluded from the latency summary')
+    parser.add_argument('--reindex', action='store_true', help='Rebuild the collection first')
+    parser.add_argument('--output', default=None, help='Append results to a .csv/.jsonl file (or write a .json list)')
+    args = parser.parse_args()
+    main(args.dataset, args.model, parse_filter_args(args.filters),
+         args.scope_fields.split(",") if args.scope_fields else None, args.use_ir_datasets, args.limit,
+         args.max_queries, args.warmup, args.reindex, args.output, args.seed)
@@ -0,0 +1,78 @@
+import argparse
+
+from qdrant_client import models
+
+from retrieval import create_retriever
+from retrieval.benchmark import write_report
+from retrieval.exact_dense import normalize, exact_top_k
+from retrieval.hnsw import HNSW_M, HNSW_EF_CONSTRUCT, HNSW_EF, tune_hnsw, measure_search, pareto_frontier
+from evaluation_local.run_benchmark import DATASET, load_dataset, print_table
+
+# 扫描 Qdrant HNSW 参数（m / ef_construct / hnsw_ef / exact），以暴力精确检索为 ground truth
+# 计算 recall@k，同时记录延迟和 QPS，打印 Pareto 前沿用于挑选线上参数
+MODELS = ("bge_m3", "minilm")
+
+
+def main(dataset, model="bge_m3", use_ir_datasets=False, limit=10, m_values=HNSW_M, ef_construct_values=HNSW_EF_CONSTRUCT,
+         ef_values=HNSW_EF, max_queries=1000, indexing_threshold=1, reindex=False, output=None):
+    docs, _, query_texts, _ = load_dataset(dataset, use_ir_datasets)
+    query_texts = query_texts[:max_queries]
+    with create_retriever(f"{model}_qdrant", dataset) as dense, create_retriever(f"{model}_exact", dataset) as exact:
+        dense.index(docs, reindex=reindex)
+        exact.index(docs, reindex=reindex)
+        # query 只编码一次，计时只包含 Qdrant 检索本身
+        query_vectors = normalize(dense.encoder.encode(query_texts))
+        indices, _ = exact_top_k(query_vectors, exact.matrix, limit)
+        exact_run = {i: [exact.doc_ids[j] for j in row] for i, row in enumerate(indices)}
+        query_vectors = query_vectors.tolist()
+
+        client, collection_name = dense.client, dense.collection_name
+        config = client.get_collection(collection_name).config
+        original, original_threshold = config.hnsw_config, config.optimizer_config.indexing_threshold
+        rows = []
+        try:
+            for m in m_values:
+                for ef_construct in ef_construct_values:
+                    print(f"Rebuilding HNSW of {collection_name} with m={m}, ef_construct={ef_construct}...")
+                    tune_hnsw(client, collection_name, m, ef_construct, indexing_threshold)
+                    for ef in ef_values:
+                        row = {"m": m, "ef_construct": ef_construct, "hnsw_ef": ef}
+                        row.update(measure_search(client, collection_name, query_vectors, exact_run, limit,
+                                                  models.SearchParams(hnsw_ef=ef)))
+                        rows.append(row)
+            row = {"m": "-", "ef_construct": "-", "hnsw_ef": "exact"}
+            row.update(measure_search(client, collection_name, query_vectors, exact_run, limit,
+                                      models.SearchParams(exact=True)))
+            rows.append(row)
+        finally:
+            # 恢复扫描前的构建参数；在 finally 里等待超时只告警，不掩盖扫描本身的异常
+            tune_hnsw(client, collection_name, original.m, original.ef_construct, original_threshold, strict=False)
+
+    frontier = pareto_frontier(rows)
+    print_table(rows)
+    print("\nPareto frontier (recall vs QPS):")
+    print_table(frontier)
+    if output:
+        write_report([{"dataset": dataset, "model": model, "limit": limit, **row} for row in rows], output)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Sweep Qdrant HNSW parameters and report recall vs latency')
+    parser.add_argument('--dataset', default=DATASET, help='Local dataset directory, or an ir_datasets id with --ir-datasets')
+    parser.add_argument('--ir-datasets', dest='use_ir_datasets', action='store_true', help='Load --dataset through ir_datasets')
+    parser.add_argument('--model', default="bge_m3", choices=MODELS, help='Dense model / collection to tune')
+    parser.add_argument('--limit', type=int, default=10, help='Results per query (recall@limit)')
+    parser.add_argument('--m', default=",".join(map(str, HNSW_M)), help='Comma separated HNSW m values')
+    parser.add_argument('--ef-construct', default=",".join(map(str, HNSW_EF_CONSTRUCT)),
+                        help='Comma separated HNSW ef_construct values')
+    parser.add_argument('--hnsw-ef', default=",".join(map(str, HNSW_EF)), help='Comma separated search-time hnsw_ef values')
+    parser.add_argument('--max-queries', type=int, default=1000, help='Queries used per setting')
+    parser.add_argument('--indexing-threshold', type=int, default=1,
+                        help='Qdrant indexing_threshold (KB) so small collections get an HNSW graph at all')
+    parser.add_argument('--reindex', action='store_true', help='Rebuild the collection and exact matrix first')
+    parser.add_argument('--output', default=None, help='Append results to a .csv/.jsonl file (or write a .json list)')
+    args = parser.parse_args()
+    main(args.dataset, args.model, args.use_ir_datasets, args.limit,
+         [int(v) for v in args.m.split(",")], [int(v) for v in args.ef_construct.split(",")],
+         [int(v) for v in args.hnsw_ef.split(",")], args.max_queries, args.indexing_threshold, args.reindex, args.output)
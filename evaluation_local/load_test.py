@@ -0,0 +1,45 @@
+import argparse
+
+from retrieval import BACKENDS, create_retriever
+from retrieval.benchmark import write_report
+from retrieval.loadgen import CONCURRENCY_LEVELS, sweep, plot_curve
+from evaluation_local.run_benchmark import DATASET, load_dataset, print_table
+
+# 对检索后端做并发压测，扫描并发度（闭环）或目标 QPS（开环），画吞吐/延迟曲线
+
+
+def main(dataset, backends, use_ir_datasets=False, limit=10, levels=CONCURRENCY_LEVELS, open_loop=False,
+         max_in_flight=256, duration=30.0, warmup=5.0, reindex=False, output=None, plot=None):
+    docs, _, query_texts, _ = load_dataset(dataset, use_ir_datasets)
+    rows = []
+    for backend in backends:
+        with create_retriever(backend, dataset) as retriever:
+            retriever.index(docs, reindex=reindex)
+            rows.extend(sweep(retriever, query_texts, limit, levels, open_loop, max_in_flight, duration, warmup))
+    print_table(rows)
+    if output:
+        write_report([{"dataset": dataset, "limit": limit, **row} for row in rows], output)
+    if plot:
+        plot_curve(rows, plot)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Sweep concurrency against retrieval backends and plot throughput/latency')
+    parser.add_argument('--dataset', default=DATASET, help='Local dataset directory, or an ir_datasets id with --ir-datasets')
+    parser.add_argument('--ir-datasets', dest='use_ir_datasets', action='store_true', help='Load --dataset through ir_datasets')
+    parser.add_argument('--backends', default="bm25_es", help=f'Comma separated backends: {", ".join(BACKENDS)}')
+    parser.add_argument('--limit', type=int, default=10, help='Results per query')
+    parser.add_argument('--levels', default=",".join(str(c) for c in CONCURRENCY_LEVELS),
+                        help='Comma separated concurrency levels (closed loop) or target QPS values (--open-loop)')
+    parser.add_argument('--open-loop', action='store_true', help='Issue queries at a fixed rate instead of a fixed concurrency')
+    parser.add_argument('--max-in-flight', type=int, default=256, help='Open loop: cap on concurrent queries')
+    parser.add_argument('--duration', type=float, default=30.0, help='Measured seconds per level')
+    parser.add_argument('--warmup', type=float, default=5.0, help='Seconds per level excluded from the results')
+    parser.add_argument('--reindex', action='store_true', help='Rebuild indexes even if they exist')
+    parser.add_argument('--output', default=None, help='Append results to a .csv/.jsonl file (or write a .json list)')
+    parser.add_argument('--plot', default=None, help='Save the throughput/latency curve to this image file')
+    args = parser.parse_args()
+    main(args.dataset, args.backends.split(","), args.use_ir_datasets, args.limit,
+         [float(level) if "." in level else int(level) for level in args.levels.split(",")], args.open_loop, args.max_in_flight,
+         args.duration, args.warmup, args.reindex, args.output, args.plot)
@@ -0,0 +1,183 @@
+import time
+import argparse
+from tqdm import tqdm
+
+import utils.ir_local_datasets as ir_local_datasets
+import utils.ir_metrics as ir_metrics
+from retrieval import BACKENDS, create_retriever
+from retrieval.benchmark import timed_search, summarize_latencies, write_report
+from retrieval.exact_dense import ann_recall
+from retrieval.rerank import RerankRetriever
+from retrieval.aggregation import METHODS, PageRetriever
+from retrieval.base import to_page_id
+
+# 一次加载数据集，依次跑多个检索后端，并排比较效果和吞吐
+DATASET = "temp_output/smartcn/ir_datasets_splitted/lesson_plan"
+
+
+def load_dataset(dataset, use_ir_datasets=False, num_workers=ir_local_datasets.LOAD_WORKERS):
+    """
+    Load docs, queries and qrels once for every backend; num_workers > 1
+    parses a large local docs.jsonl in a process pool. Returns
+    (docs, query_ids, query_texts, qrels_dict) where qrels_dict only keeps
+    queries with at least one doc of relevance > 0.
+    """
+    if use_ir_datasets:
+        import ir_datasets
+        ds = ir_datasets.load(dataset)
+    else:
+        ds = ir_local_datasets.load(dataset, cache=True, num_workers=num_workers)
+    docs = list(ds.docs_iter())
+    queries = {q.query_id: q.text for q in ds.queries_iter()}
+    qrels = {}
+    for qrel in ds.qrels_iter():
+        if qrel.query_id not in qrels:
+            qrels[qrel.query_id] = {}
+        qrels[qrel.query_id][qrel.doc_id] = qrel.relevance
+    qrels_dict = {}
+    for qid, doc_dict in qrels.items():
+        relevant = [did for did, rel in doc_dict.items() if rel > 0]
+        if relevant:
+            qrels_dict[qid] = relevant
+    query_ids = [qid for qid in queries if qid in qrels_dict]
+    query_texts = [queries[qid] for qid in query_ids]
+    print(f"{len(docs)} documents loaded.")
+    print(f"{len(queries)} queries loaded, {len(query_ids)} with relevant documents.")
+    return docs, query_ids, query_texts, qrels_dict
+
+
+def open_docs_store(dataset, use_ir_datasets=False):
+    # rerank 时给只返回 doc_id 的后端按需取正文
+    if use_ir_datasets:
+        import ir_datasets
+        return ir_datasets.load(dataset).docs_store()
+    return ir_local_datasets.load(dataset, lazy=True).docs_store()
+
+
+def run_backend(retriever, docs, query_ids, query_texts, qrels_dict, limit=10, batch_size=32, reindex=False):
+    start = time.perf_counter()
+    retriever.index(docs, reindex=reindex)
+    index_seconds = time.perf_counter() - start
+
+    run = {}
+    start = time.perf_counter()
+    for batch_start in tqdm(range(0, len(query_texts), batch_size), desc=f"Querying {retriever.name}"):
+        batch_ids = query_ids[batch_start:batch_start + batch_size]
+        batch_texts = query_texts[batch_start:batch_start + batch_size]
+        for query_id, hits in zip(batch_ids, retriever.search_batch(batch_texts, limit)):
+            run[query_id] = [hit.doc_id for hit in hits]
+    search_seconds = time.perf_counter() - start
+
+    row = {
+        "backend": retriever.name,
+        "index_s": index_seconds,
+        "search_s": search_seconds,
+        "qps": len(run) / search_seconds if search_seconds > 0 else 0.0
+    }
+    row.update(ir_metrics.evaluate(run, qrels_dict, cutoffs=(1, 5, limit)))
+    return row, run
+
+
+def benchmark_backend(retriever, docs, query_ids, query_texts, qrels_dict, limit=10, warmup=20, reindex=False):
+    """
+    Latency mode: one query at a time, recording total and per-stage wall time
+    of every query. The first `warmup` queries (cold caches, connection setup)
+    are excluded from the latency summary but still count for the metrics.
+    """
+    retriever.index(docs, reindex=reindex)
+    # 查询不足时 warmup 取一半，保证至少有可统计的样本
+    warmup = min(warmup, len(query_texts) // 2)
+    run = {}
+    samples = []
+    for query_id, query_text in tqdm(zip(query_ids, query_texts), total=len(query_ids), desc=f"Benchmarking {retriever.name}"):
+        hits, sample = timed_search(retriever, query_text, limit)
+        run[query_id] = [hit.doc_id for hit in hits]
+        samples.append(sample)
+
+    row = {"backend": retriever.name, "warmup": warmup}
+    row.update(summarize_latencies(samples, warmup))
+    row.update(ir_metrics.evaluate(run, qrels_dict, cutoffs=(1, 5, limit)))
+    return row, run
+
+
+def print_table(rows):
+    if not rows:
+        return
+    # 各行的列可能不同（如只有 rerank 的行才有 rerank 阶段耗时），按出现顺序取并集
+    columns = []
+    for row in rows:
+        columns.extend(c for c in row if c not in columns)
+    widths = [max(len(c), 10) for c in columns]
+    print("\n" + "  ".join(c.ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        cells = []
+        for c, w in zip(columns, widths):
+            value = row.get(c, "")
+            cells.append((f"{value:.4f}" if isinstance(value, float) else str(value)).ljust(w))
+        print("  ".join(cells))
+
+
+def main(dataset, backends, use_ir_datasets=False, limit=10, batch_size=32, reindex=False,
+         latency=False, warmup=20, output=None, ground_truth=None, rerank_top_n=(0,), aggregate=None,
+         load_workers=ir_local_datasets.LOAD_WORKERS):
+    docs, query_ids, query_texts, qrels_dict = load_dataset(dataset, use_ir_datasets, load_workers)
+    if aggregate:
+        # 页面级评测：段落 qrels 折叠到页面，检索结果按 aggregate 方式聚合成页面排名
+        qrels_dict = {qid: list(dict.fromkeys(to_page_id(doc_id) for doc_id in doc_ids))
+                      for qid, doc_ids in qrels_dict.items()}
+    # ground_truth（如 bge_m3_exact）先跑，其余后端额外报告相对它的 top-k 重合率（ANN recall）
+    if ground_truth:
+        backends = [ground_truth] + [backend for backend in backends if backend != ground_truth]
+    docs_store = open_docs_store(dataset, use_ir_datasets) if any(rerank_top_n) else None
+    rows = []
+    exact_run = None
+    for backend in backends:
+        with create_retriever(backend, dataset) as base:
+            # 每个 top_n 在同一个一阶段检索上加 rerank，0 表示不 rerank；ground truth 不 rerank。
+            # 索引只在第一轮按 reindex 重建
+            rebuild = reindex
+            for top_n in ((0,) if backend == ground_truth else rerank_top_n):
+                retriever = RerankRetriever(base, top_n=top_n, docs_store=docs_store) if top_n else base
+                if aggregate:
+                    retriever = PageRetriever(retriever, method=aggregate)
+                if latency:
+                    row, run = benchmark_backend(retriever, docs, query_ids, query_texts, qrels_dict, limit, warmup,
+                                                 rebuild)
+                else:
+                    row, run = run_backend(retriever, docs, query_ids, query_texts, qrels_dict, limit, batch_size,
+                                           rebuild)
+                rebuild = False
+                if ground_truth:
+                    if exact_run is None:
+                        exact_run = run
+                    row[f"ann_recall@{limit}"] = ann_recall(run, exact_run, limit)
+                rows.append(row)
+    print_table(rows)
+    if output:
+        write_report([{"dataset": dataset, "limit": limit, **row} for row in rows], output)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run retrieval backends over one dataset and compare them')
+    parser.add_argument('--dataset', default=DATASET, help='Local dataset directory, or an ir_datasets id with --ir-datasets')
+    parser.add_argument('--ir-datasets', dest='use_ir_datasets', action='store_true', help='Load --dataset through ir_datasets')
+    parser.add_argument('--backends', default="bm25_es", help=f'Comma separated backends: {", ".join(BACKENDS)}')
+    parser.add_argument('--limit', type=int, default=10, help='Results per query')
+    parser.add_argument('--batch-size', type=int, default=32, help='Queries per search_batch call')
+    parser.add_argument('--reindex', action='store_true', help='Rebuild indexes even if they exist')
+    parser.add_argument('--latency', action='store_true', help='Query one at a time and report QPS and p50/p95/p99 per stage')
+    parser.add_argument('--warmup', type=int, default=20, help='Queries excluded from the latency summary')
+    parser.add_argument('--output', default=None, help='Append results to a .csv/.jsonl file (or write a .json list)')
+    parser.add_argument('--ground-truth', default=None,
+                        help='Exact backend (e.g. bge_m3_exact) whose top-k the other backends are compared against')
+    parser.add_argument('--rerank-top-n', default="0",
+                        help='Comma separated candidate counts reranked by the cross-encoder, 0 = no rerank (e.g. 0,20,50,100)')
+    parser.add_argument('--aggregate', default=None, choices=METHODS,
+                        help='Evaluate at page level, aggregating paragraph hits with this method')
+    parser.add_argument('--load-workers', type=int, default=ir_local_datasets.LOAD_WORKERS,
+                        help='Processes parsing a large local docs.jsonl (0 = all cores, default IR_LOAD_WORKERS or 1)')
+    args = parser.parse_args()
+    main(args.dataset, args.backends.split(","), args.use_ir_datasets, args.limit, args.batch_size, args.reindex,
+         args.latency, args.warmup, args.output, args.ground_truth, [int(n) for n in args.rerank_top_n.split(",")],
+         args.aggregate, args.load_workers)
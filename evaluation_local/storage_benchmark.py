@@ -0,0 +1,65 @@
+import argparse
+
+from retrieval import create_retriever
+from retrieval.benchmark import write_report
+from retrieval.exact_dense import normalize, exact_top_k
+from retrieval.hnsw import measure_search
+from retrieval.qdrant_dense import QDRANT_URL, QDRANT_API_KEY
+from retrieval.storage import STORAGE_PROFILES, estimate_ram_bytes, collection_footprint
+from evaluation_local.run_benchmark import DATASET, load_dataset, print_table
+
+# 对比稠密向量 collection 的存储方案：每个方案建一个 collection，报告内存/磁盘占用、
+# 相对暴力精确检索的 recall@k 和查询延迟
+MODELS = ("bge_m3", "minilm")
+MB = 1024 * 1024
+
+
+def main(dataset, model="bge_m3", profiles=tuple(STORAGE_PROFILES), use_ir_datasets=False, limit=10,
+         max_queries=1000, reindex=False, output=None):
+    docs, _, query_texts, _ = load_dataset(dataset, use_ir_datasets)
+    query_texts = query_texts[:max_queries]
+    with create_retriever(f"{model}_exact", dataset) as exact:
+        exact.index(docs, reindex=reindex)
+        query_vectors = normalize(exact.encoder.encode(query_texts))
+        indices, _ = exact_top_k(query_vectors, exact.matrix, limit)
+        exact_run = {i: [exact.doc_ids[j] for j in row] for i, row in enumerate(indices)}
+        dim = exact.encoder.dim
+    query_vectors = query_vectors.tolist()
+
+    rows = []
+    for profile in profiles:
+        with create_retriever(f"{model}_qdrant", dataset, storage=profile) as dense:
+            dense.index(docs, reindex=reindex)
+            client, collection_name = dense.client, dense.collection_name
+            points = client.count(collection_name=collection_name, exact=True).count
+            m = client.get_collection(collection_name).config.hnsw_config.m
+            row = {"profile": profile, "points": points, "est_ram_mb": estimate_ram_bytes(points, dim, profile, m) / MB}
+            try:
+                footprint = collection_footprint(collection_name, QDRANT_URL, QDRANT_API_KEY)
+            except Exception as e:
+                print(f"Telemetry unavailable for {collection_name}: {e}")
+                footprint = None
+            row["ram_mb"] = footprint["ram_bytes"] / MB if footprint else float("nan")
+            row["disk_mb"] = footprint["disk_bytes"] / MB if footprint else float("nan")
+            row.update(measure_search(client, collection_name, query_vectors, exact_run, limit, dense.search_params))
+            rows.append(row)
+    print_table(rows)
+    if output:
+        write_report([{"dataset": dataset, "model": model, "limit": limit, **row} for row in rows], output)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare Qdrant storage profiles: memory footprint, recall and latency')
+    parser.add_argument('--dataset', default=DATASET, help='Local dataset directory, or an ir_datasets id with --ir-datasets')
+    parser.add_argument('--ir-datasets', dest='use_ir_datasets', action='store_true', help='Load --dataset through ir_datasets')
+    parser.add_argument('--model', default="bge_m3", choices=MODELS, help='Dense model to benchmark')
+    parser.add_argument('--profiles', default=",".join(STORAGE_PROFILES),
+                        help='Comma separated storage profiles, combine with + (e.g. int8+on_disk_payload)')
+    parser.add_argument('--limit', type=int, default=10, help='Results per query (recall@limit)')
+    parser.add_argument('--max-queries', type=int, default=1000, help='Queries used per profile')
+    parser.add_argument('--reindex', action='store_true', help='Rebuild the collections and exact matrix first')
+    parser.add_argument('--output', default=None, help='Append results to a .csv/.jsonl file (or write a .json list)')
+    args = parser.parse_args()
+    main(args.dataset, args.model, args.profiles.split(","), args.use_ir_datasets, args.limit, args.max_queries,
+         args.reindex, args.output)
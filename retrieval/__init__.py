@@ -0,0 +1,4 @@
+from .base import Retriever, BaseRetriever, Hit, batched, point_id, doc_payload, to_page_id, PAYLOAD_VERSION
+from .registry import BACKENDS, create_retriever
+from .rerank import RerankRetriever
+from .aggregation import PageRetriever, aggregate
@@ -0,0 +1,105 @@
+from .base import BaseRetriever, Hit, to_page_id
+
+# 段落级检索结果聚合为页面（或资源）级排名：
+#   maxp - 页面得分取其最好段落的得分
+#   sump - 页面内所有召回段落得分求和
+#   rrf  - 按段落的全局排名做 reciprocal rank fusion：sum(1 / (rrf_k + rank))
+METHODS = ("maxp", "sump", "rrf")
+RRF_K = 60
+
+
+def group_id(hit, group_by="page_id"):
+    """
+    Group of a paragraph hit: the group_by payload field (top level or under
+    metadata_fields), falling back to the page id derived from doc_id.
+    """
+    value = hit.payload.get(group_by)
+    if value is None:
+        value = (hit.payload.get("metadata_fields") or {}).get(group_by)
+    if value is None:
+        if group_by != "page_id":
+            raise KeyError(f"Hit {hit.doc_id} has no {group_by} in its payload")
+        value = to_page_id(hit.doc_id)
+    return value
+
+
+def aggregate(hits, k, method="maxp", group_by="page_id", rrf_k=RRF_K):
+    """
+    Fold paragraph hits into the top k groups. Each result is a Hit whose
+    doc_id is the group id, with the payload of the group's best paragraph
+    plus "paragraphs": the group's paragraph doc_ids in rank order.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown aggregation {method}, choose from: {', '.join(METHODS)}")
+    groups = {}
+    for rank, hit in enumerate(sorted(hits, key=lambda h: -h.score), 1):
+        gid = group_id(hit, group_by)
+        contribution = 1.0 / (rrf_k + rank) if method == "rrf" else hit.score
+        if gid not in groups:
+            groups[gid] = [contribution, hit, [hit.doc_id]]
+            continue
+        group = groups[gid]
+        group[2].append(hit.doc_id)
+        if method != "maxp":
+            group[0] += contribution
+    top = sorted(groups.items(), key=lambda item: -item[1][0])[:k]
+    return [Hit(gid, score, {**best.payload, "paragraphs": doc_ids}) for gid, (score, best, doc_ids) in top]
+
+
+class PageRetriever(BaseRetriever):
+    """
+    Page-level ranking over a paragraph retriever. Backends with
+    search_groups() (Qdrant query_points_groups, ES collapse) group on the
+    server: maxp asks for exactly k groups, sump / rrf for fetch_factor * k
+    candidate groups with up to group_size paragraphs each, re-scored here.
+    Other backends fetch fetch_factor * k paragraphs and fold them locally;
+    a query that comes back full but with fewer than k pages is fetched
+    again with twice the paragraphs, up to max_fetch.
+    """
+    def __init__(self, retriever, method="maxp", group_by="page_id", group_size=3, fetch_factor=3, max_fetch=1000,
+                 server=True):
+        if method not in METHODS:
+            raise ValueError(f"Unknown aggregation {method}, choose from: {', '.join(METHODS)}")
+        self.retriever = retriever
+        self.method = method
+        self.group_by = group_by
+        self.group_size = group_size
+        self.fetch_factor = fetch_factor
+        self.max_fetch = max_fetch
+        self.server = server and hasattr(retriever, "search_groups")
+        self.name = f"{retriever.name}+{method}"
+
+    def index(self, docs, reindex=False):
+        self.retriever.index(docs, reindex=reindex)
+
+    def search(self, query, k=10):
+        return self.search_batch([query], k)[0]
+
+    def _aggregate(self, hits, k):
+        return aggregate(hits, k, self.method, self.group_by)
+
+    def search_batch(self, queries, k=10):
+        queries = list(queries)
+        if self.server:
+            limit = k if self.method == "maxp" else k * self.fetch_factor
+            groups = self.retriever.search_groups(queries, limit, self.group_by, self.group_size)
+            with self.timer.stage("score"):
+                return [self._aggregate(hits, k) for hits in groups]
+        results = [None] * len(queries)
+        pending = list(range(len(queries)))
+        fetch = min(k * self.fetch_factor, self.max_fetch)
+        while pending:
+            paragraphs = self.retriever.search_batch([queries[i] for i in pending], fetch)
+            retry = []
+            with self.timer.stage("score"):
+                for i, hits in zip(pending, paragraphs):
+                    results[i] = self._aggregate(hits, k)
+                    # 召回段落已满但页面不足 k 个：说明段落集中在少数页面，加大召回再聚合
+                    if len(results[i]) < k and len(hits) >= fetch and fetch < self.max_fetch:
+                        retry.append(i)
+            pending = retry
+            fetch = min(fetch * 2, self.max_fetch)
+        return results
+
+    def close(self):
+        self.retriever.close()
@@ -0,0 +1,51 @@
+import re
+
+# 进程内 BM25 用的分词，尽量贴近其它后端：
+# 英文/数字同 Tantivy en_stem（按非字母数字切分、去掉超长 token、小写、Snowball 英文词干），
+# 中文近似 ES ik_smart：装了 jieba 就用 jieba 分词，否则退化为相邻双字（CJK bigram）
+MAX_TOKEN_LEN = 40
+_TOKEN_RE = re.compile("[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+|[^\\W_]+")
+_CJK_RE = re.compile("[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]")
+
+try:
+    from py_rust_stemmers import SnowballStemmer  # fastembed 的依赖
+    _stem_words = SnowballStemmer("english").stem_words
+except ImportError:
+    try:
+        import Stemmer
+        _stem_words = Stemmer.Stemmer("english").stemWords
+    except ImportError:
+        _stem_words = None
+
+try:
+    import jieba
+    jieba.setLogLevel(60)
+except ImportError:
+    jieba = None
+
+
+def _segment_cjk(run):
+    if jieba is not None:
+        return [word for word in jieba.lcut(run) if word.strip()]
+    if len(run) == 1:
+        return [run]
+    return [run[i:i + 2] for i in range(len(run) - 1)]
+
+
+def tokenize(text, stem=True):
+    """
+    Split text into index terms. Without py_rust_stemmers / PyStemmer
+    installed English words are only lowercased, not stemmed.
+    """
+    words = []
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if _CJK_RE.match(token):
+            tokens.extend(_segment_cjk(token))
+        elif len(token) <= MAX_TOKEN_LEN:
+            words.append(len(tokens))
+            tokens.append(token)
+    if stem and _stem_words is not None and words:
+        for i, word in zip(words, _stem_words([tokens[i] for i in words])):
+            tokens[i] = word
+    return tokens
@@ -0,0 +1,151 @@
+import json
+import uuid
+import hashlib
+from typing import List, Protocol, runtime_checkable
+
+from .benchmark import StageTimer
+from .storage import storage_suffix
+
+
+class Hit:
+    __slots__ = ("doc_id", "score", "payload")
+
+    def __init__(self, doc_id, score, payload=None):
+        self.doc_id = doc_id
+        self.score = score
+        self.payload = payload or {}
+
+    def __repr__(self):
+        return f"Hit(doc_id={self.doc_id!r}, score={self.score:.4f})"
+
+
+@runtime_checkable
+class Retriever(Protocol):
+    """
+    Common interface of every search backend used by the benchmark runner.
+    docs are objects with doc_id, text and (optionally) metadata_fields, e.g.
+    utils.ir_local_datasets.Document or an ir_datasets GenericDoc.
+    """
+    name: str
+
+    def index(self, docs, reindex=False): ...
+
+    def search(self, query, k=10) -> List[Hit]: ...
+
+    def search_batch(self, queries, k=10) -> List[List[Hit]]: ...
+
+    def close(self): ...
+
+
+class BaseRetriever:
+    name = "base"
+    # 子类用 self.timer.stage("embed"/"network"/"score") 标注各阶段耗时，供 benchmark 统计
+    timer = StageTimer()
+
+    def index(self, docs, reindex=False):
+        raise NotImplementedError
+
+    def search(self, query, k=10):
+        raise NotImplementedError
+
+    def search_batch(self, queries, k=10):
+        return [self.search(query, k) for query in queries]
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def batched(items, batch_size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def point_id(doc_id):
+    # If doc_id is purely numeric, use it directly; otherwise, use UUID from MD5
+    if isinstance(doc_id, int):
+        return doc_id
+    md5_hash = hashlib.md5(str(doc_id).encode()).hexdigest()
+    return str(uuid.UUID(md5_hash))
+
+
+def parse_tags(tag_list):
+    """
+    (tag_ids, tag_names) string lists from a tag_list: a JSON string or a list
+    of {"tag_id", "tag_name", ...} dicts or plain tag names.
+    """
+    if isinstance(tag_list, str):
+        try:
+            tag_list = json.loads(tag_list)
+        except ValueError:
+            return [], [tag_list]
+    tag_ids, tag_names = [], []
+    for tag in tag_list or []:
+        if isinstance(tag, dict):
+            if tag.get("tag_id") is not None:
+                tag_ids.append(str(tag["tag_id"]))
+            if tag.get("tag_name") is not None:
+                tag_names.append(str(tag["tag_name"]))
+        elif tag is not None:
+            tag_names.append(str(tag))
+    return tag_ids, tag_names
+
+
+def to_page_id(doc_id):
+    # 段落 doc_id 为 {resource_id}_{page_idx}_{idx}，去掉最后的 _{idx} 得到页面 id
+    return str(doc_id).rsplit("_", 1)[0]
+
+
+# 写进 manifest config 的 payload 版本：doc_payload 的字段变化时加一，已有 collection 会按新 config 重建
+PAYLOAD_VERSION = "payload-v2"
+
+
+def dense_config(model_name, dim, distance="Cosine", storage="memory"):
+    """
+    Manifest config of a dense Qdrant collection filled with doc_payload
+    points. Every writer of the same collection (QdrantDenseRetriever and the
+    eval scripts) must build it here, otherwise each run sees a config
+    mismatch and rebuilds the collection.
+    """
+    return f"dense:{model_name}:{dim}:{distance}" + storage_suffix(storage) + f":{PAYLOAD_VERSION}"
+
+
+def doc_payload(doc):
+    """
+    Payload stored next to a document: doc_id, text and the metadata_fields
+    flattened to the first level (key conflicts skipped, JSON strings decoded),
+    plus page_id (derived from doc_id when the metadata has none) for
+    server-side grouping and tag_list split into tag_ids / tag_names arrays
+    for keyword filtering.
+    """
+    payload = {
+        "doc_id": doc.doc_id,
+        "text": doc.text
+    }
+    for k, v in (getattr(doc, "metadata_fields", None) or {}).items():
+        if k in payload:
+            continue
+        # 如果 v 是 json string，尝试转换为 json 对象
+        if isinstance(v, str):
+            try:
+                v = json.loads(v)
+            except Exception:
+                pass
+        payload[k] = v
+    payload.setdefault("page_id", to_page_id(doc.doc_id))
+    if payload.get("tag_list"):
+        tag_ids, tag_names = parse_tags(payload["tag_list"])
+        payload.setdefault("tag_ids", tag_ids)
+        payload.setdefault("tag_names", tag_names)
+    return payload
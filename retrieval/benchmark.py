@@ -0,0 +1,122 @@
+import os
+import csv
+import json
+import time
+import contextvars
+from contextlib import contextmanager
+
+import numpy as np
+
+# 每个查询的分阶段耗时：
+#   embed   - 客户端编码 query（fastembed / embedding 服务）
+#   network - 到检索服务（Qdrant / ES）的一次请求往返，包含服务端打分
+#   score   - 进程内的打分与结果解码（Tantivy 检索、hits 转换等）
+#   rerank  - cross-encoder 对 top-N 候选重排（见 retrieval.rerank）
+#   queue   - 开环压测中请求等待发出的时间（见 retrieval.loadgen）
+STAGES = ("queue", "embed", "network", "score", "rerank")
+PERCENTILES = (50, 95, 99)
+
+_durations = contextvars.ContextVar("stage_durations", default=None)
+
+
+class StageTimer:
+    """
+    Accumulates per-stage wall time for the query currently in flight. State is
+    kept in a ContextVar, so concurrent threads or asyncio tasks each see their
+    own numbers as long as they call reset() before issuing their query.
+    """
+    def reset(self):
+        _durations.set({})
+
+    def pop(self):
+        durations = _durations.get() or {}
+        _durations.set({})
+        return durations
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            durations = _durations.get()
+            if durations is None:
+                durations = {}
+                _durations.set(durations)
+            durations[name] = durations.get(name, 0.0) + time.perf_counter() - start
+
+
+def timed_search(retriever, query, k, **kwargs):
+    """
+    Run one search and return (hits, {"total": s, "embed": s, ...}); kwargs
+    (e.g. filters) are passed to retriever.search.
+    """
+    retriever.timer.reset()
+    start = time.perf_counter()
+    hits = retriever.search(query, k, **kwargs)
+    sample = {"total": time.perf_counter() - start}
+    sample.update(retriever.timer.pop())
+    return hits, sample
+
+
+def summarize_latencies(samples, warmup=0, wall_seconds=None):
+    """
+    Reduce per-query samples to QPS plus mean/p50/p95/p99 (milliseconds) for the
+    total and each stage. The first `warmup` samples are dropped. wall_seconds
+    is the elapsed time of the measured part; when omitted (sequential runs)
+    it is the sum of the per-query totals.
+    """
+    measured = samples[warmup:]
+    summary = {"queries": len(measured)}
+    if not measured:
+        return summary
+    totals = np.array([s["total"] for s in measured])
+    if wall_seconds is None:
+        wall_seconds = float(totals.sum())
+    summary["qps"] = len(measured) / wall_seconds if wall_seconds > 0 else 0.0
+    for stage in ("total",) + STAGES:
+        values = np.array([s.get(stage, 0.0) for s in measured]) * 1000
+        if stage != "total" and not values.any():
+            continue
+        summary[f"{stage}_mean_ms"] = float(values.mean())
+        for p, value in zip(PERCENTILES, np.percentile(values, PERCENTILES)):
+            summary[f"{stage}_p{p}_ms"] = float(value)
+    return summary
+
+
+def write_report(rows, path):
+    """
+    Append result rows to a .csv or .jsonl artifact (or overwrite a .json list),
+    stamping each row with the run time so results can be compared across runs.
+    """
+    timestamp = time.strftime("%Y-%m-%dT%H:%M:%S")
+    rows = [{"timestamp": timestamp, **row} for row in rows]
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        fieldnames = []
+        for row in rows:
+            fieldnames.extend(k for k in row if k not in fieldnames)
+        new_file = not os.path.exists(path)
+        if not new_file:
+            # 已有文件沿用原表头，新增列追加在后面
+            with open(path, "r", newline="", encoding="utf-8") as f:
+                header = next(csv.reader(f), [])
+            fieldnames = header + [k for k in fieldnames if k not in header]
+        with open(path, "a", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=fieldnames)
+            if new_file:
+                writer.writeheader()
+            writer.writerows(rows)
+    elif ext == ".jsonl":
+        with open(path, "a", encoding="utf-8") as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    elif ext == ".json":
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(rows, f, ensure_ascii=False, indent=2)
+    else:
+        raise ValueError(f"Unsupported report format: {path}")
+    print(f"Report written to {path}")
@@ -0,0 +1,183 @@
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+
+import numpy as np
+
+from utils.embedding_cache import EmbeddingCache
+from utils.embedding_client import XINFERENCE_URL, XINFERENCE_API_KEY, EMBEDDING_CACHE, QUERY_EMBEDDING_CACHE, get_client
+
+# 文本 -> 向量的编码器，QdrantDenseRetriever 通过 encode(texts) 编码文档、encode_queries(encoder, texts) 编码 query
+
+
+def encode_queries(encoder, texts):
+    # 编码器有 encode_queries 时用它（query 不走磁盘缓存 / 用 query 专用编码），否则退回 encode
+    encode = getattr(encoder, "encode_queries", None)
+    return encode(list(texts)) if encode is not None else encoder.encode(list(texts))
+
+
+class XinferenceEncoder:
+    """
+    OpenAI-compatible /v1/embeddings endpoint served by xinference (bge-m3).
+    """
+    def __init__(self, model="bge-m3", url=XINFERENCE_URL, api_key=XINFERENCE_API_KEY, dim=1024):
+        self.model = model
+        self.model_name = model
+        self.dim = dim
+        # 同一 endpoint 的编码器共用一个连接池和并发上限
+        self.client = get_client(model, url=url, api_key=api_key)
+
+    def encode(self, texts: List[str]) -> List[List[float]]:
+        return self.client.embed(texts)
+
+    def encode_queries(self, texts: List[str]) -> List[List[float]]:
+        return self.client.embed(texts, cache=QUERY_EMBEDDING_CACHE)
+
+    async def aencode(self, texts: List[str]) -> List[List[float]]:
+        return await self.client.aembed(texts)
+
+
+class SentenceTransformerEncoder:
+    def __init__(self, model_name="all-MiniLM-L6-v2", device=None, batch_size=64, cache=EMBEDDING_CACHE):
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name, device=device)
+        self.dim = self.model.get_sentence_embedding_dimension()
+        self.batch_size = batch_size
+        self.cache = EmbeddingCache(model_name) if cache else None
+
+    def _encode(self, texts):
+        return self.model.encode(texts, batch_size=self.batch_size, convert_to_numpy=True)
+
+    def encode(self, texts: List[str]):
+        if self.cache is not None:
+            return self.cache.embed(texts, self._encode)
+        return self._encode(texts)
+
+    def encode_queries(self, texts: List[str]):
+        if self.cache is not None and QUERY_EMBEDDING_CACHE:
+            return self.cache.embed(texts, self._encode)
+        return self._encode(texts)
+
+
+_bm25_model = None
+
+
+def _init_bm25_worker(avg_len):
+    global _bm25_model
+    from fastembed import SparseTextEmbedding
+    _bm25_model = SparseTextEmbedding(model_name="Qdrant/bm25", avg_len=avg_len)
+
+
+def _encode_bm25_chunk(texts):
+    return list(_bm25_model.embed(texts, batch_size=len(texts)))
+
+
+class BM25Encoder:
+    """
+    fastembed Qdrant/bm25 document encoder. Tokenizing and stemming are pure
+    CPU work, so with workers > 1 documents are split into chunks of
+    chunk_size and encoded by a persistent pool of processes that each hold
+    their own model (fastembed's embed(parallel=...) would start a new pool on
+    every call). The model and the pool are created on the first encode call,
+    so a sync with nothing to upload never starts them.
+    """
+    def __init__(self, avg_len=256.0, workers=1, chunk_size=64):
+        self.avg_len = avg_len
+        self.model_name = "Qdrant/bm25"
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        self.model = None
+        self.pool = None
+        self._lock = threading.Lock()
+
+    def _model(self):
+        # 本进程的模型：单进程编码文档，以及编码 query
+        with self._lock:
+            if self.model is None:
+                from fastembed import SparseTextEmbedding
+                self.model = SparseTextEmbedding(model_name=self.model_name, avg_len=self.avg_len)
+            return self.model
+
+    def _pool(self):
+        with self._lock:
+            if self.pool is None:
+                # spawn：入库时已有 embedding / 上传线程在跑，fork 不安全
+                self.pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_bm25_worker,
+                    initargs=(self.avg_len,)
+                )
+            return self.pool
+
+    def encode(self, texts: List[str]):
+        texts = list(texts)
+        if self.workers == 1:
+            return list(self._model().embed(texts, batch_size=self.chunk_size))
+        chunks = [texts[i:i + self.chunk_size] for i in range(0, len(texts), self.chunk_size)]
+        return [embedding for chunk in self._pool().map(_encode_bm25_chunk, chunks) for embedding in chunk]
+
+    def encode_queries(self, texts: List[str]):
+        return list(self._model().query_embed(list(texts)))
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+
+class SparseEmbedding:
+    __slots__ = ("indices", "values")
+
+    def __init__(self, indices, values):
+        self.indices = indices
+        self.values = values
+
+
+class BGEM3Encoder:
+    """
+    bge-m3 run locally through FlagEmbedding, which returns the dense vector,
+    the lexical-weight sparse vector and the ColBERT token vectors from one
+    forward pass (the xinference /v1/embeddings endpoint only exposes the
+    dense one). encode() returns dense vectors only, so the encoder also
+    works with QdrantDenseRetriever.
+    """
+    def __init__(self, model_name="BAAI/bge-m3", device=None, batch_size=16, max_length=8192, use_fp16=True):
+        from FlagEmbedding import BGEM3FlagModel
+        self.model_name = model_name
+        self.model = BGEM3FlagModel(model_name, use_fp16=use_fp16, devices=device)
+        self.dim = 1024
+        self.batch_size = batch_size
+        self.max_length = max_length
+
+    def encode(self, texts: List[str]):
+        return self.encode_all(texts, sparse=False, colbert=False)["dense"]
+
+    def encode_all(self, texts: List[str], dense=True, sparse=True, colbert=True):
+        """
+        {"dense": (n, 1024) array, "sparse": [SparseEmbedding], "colbert":
+        [(tokens, 1024) array]}, only with the requested outputs.
+        """
+        output = self.model.encode(
+            list(texts),
+            batch_size=self.batch_size,
+            max_length=self.max_length,
+            return_dense=dense,
+            return_sparse=sparse,
+            return_colbert_vecs=colbert
+        )
+        result = {}
+        if dense:
+            result["dense"] = np.asarray(output["dense_vecs"], dtype=np.float32)
+        if sparse:
+            # lexical_weights: [{token_id(str): weight}]
+            result["sparse"] = [
+                SparseEmbedding(np.fromiter((int(t) for t in weights), dtype=np.int64, count=len(weights)),
+                                np.fromiter(weights.values(), dtype=np.float32, count=len(weights)))
+                for weights in output["lexical_weights"]
+            ]
+        if colbert:
+            result["colbert"] = [np.asarray(vectors, dtype=np.float32) for vectors in output["colbert_vecs"]]
+        return result
@@ -0,0 +1,173 @@
+import re
+from elasticsearch import Elasticsearch, helpers
+
+from utils.index_manifest import IndexManifest, content_hash, plan_sync
+from .base import BaseRetriever, Hit, to_page_id
+
+ES_HOSTS = ["http://localhost:9200"]
+ES_AUTH = ("elastic", "changeme")
+
+
+def sanitize_query_for_es(query):
+    # Elasticsearch 会自动处理大部分特殊字符，但可适当清理
+    return re.sub(r'([+\-!(){}\[\]^"~*?:\\<\'])', r' ', query)
+
+
+class ESBM25Retriever(BaseRetriever):
+    """
+    BM25 over an Elasticsearch index analyzed with ik_smart.
+    """
+    name = "bm25_es"
+
+    def __init__(self, index_name, hosts=ES_HOSTS, http_auth=ES_AUTH, analyzer="ik_smart"):
+        self.index_name = index_name
+        self.analyzer = analyzer
+        self.es = Elasticsearch(
+            hosts=hosts,
+            http_auth=http_auth,
+            verify_certs=False
+        )
+
+    def _mapping(self):
+        # 创建 mapping，使用 ik_smart 分词器，并添加 metadata_fields
+        return {
+            "settings": {
+                "analysis": {
+                    "analyzer": {
+                        "default": {
+                            "type": self.analyzer
+                        }
+                    }
+                }
+            },
+            "mappings": {
+                "properties": {
+                    "content": {
+                        "type": "text",
+                        "analyzer": self.analyzer,
+                        "search_analyzer": self.analyzer
+                    },
+                    "doc_id": {
+                        "type": "keyword"
+                    },
+                    # 段落所属页面，用于 collapse 分组
+                    "page_id": {
+                        "type": "keyword"
+                    },
+                    "metadata_fields": {
+                        "type": "object",
+                        "enabled": True
+                    }
+                }
+            }
+        }
+
+    def _has_page_id(self):
+        mapping = self.es.indices.get_mapping(index=self.index_name)
+        return "page_id" in mapping[self.index_name]["mappings"].get("properties", {})
+
+    def _source(self, doc):
+        metadata_fields = getattr(doc, "metadata_fields", None) or {}
+        return {
+            "content": doc.text,
+            "doc_id": doc.doc_id,
+            "page_id": metadata_fields.get("page_id") or to_page_id(doc.doc_id),
+            "metadata_fields": metadata_fields
+        }
+
+    def index(self, docs, reindex=False):
+        exists = self.es.indices.exists(index=self.index_name)
+        # 没有 page_id 字段的旧索引按新 config 重建一次
+        if exists and not reindex and self._has_page_id():
+            return
+        docs = list(docs)
+        # 按内容哈希增量同步：只写入新增或变化的文档，删除已经不存在的文档
+        manifest = IndexManifest("es", self.index_name, config=f"bm25:{self.analyzer}:page_id")
+        hashes = {doc.doc_id: content_hash(doc) for doc in docs}
+        indexed_count = self.es.count(index=self.index_name)["count"] if exists else None
+        full, changed, removed = plan_sync(manifest, hashes, exists, indexed_count)
+        if full:
+            if exists:
+                self.es.indices.delete(index=self.index_name)
+            self.es.indices.create(index=self.index_name, body=self._mapping())
+        changed = set(changed)
+        actions = [
+            {"_index": self.index_name, "_id": doc.doc_id, "_source": self._source(doc)}
+            for doc in docs if doc.doc_id in changed
+        ]
+        actions += [{"_op_type": "delete", "_index": self.index_name, "_id": doc_id} for doc_id in removed]
+        helpers.bulk(self.es, actions)
+        # flush index to ensure it's ready for search
+        self.es.indices.refresh(index=self.index_name)
+        manifest.save(hashes)
+        print(f"{self.index_name}: {'rebuilt' if full else 'synced'}, {len(changed)} upserted, {len(removed)} deleted")
+
+    def _query_body(self, query, k):
+        return {
+            "size": k,
+            "query": {
+                "match": {
+                    "content": {
+                        "query": sanitize_query_for_es(query),
+                        "analyzer": self.analyzer
+                    }
+                }
+            }
+        }
+
+    def _to_hits(self, hits):
+        # 正文存在 content 字段，payload 里同时以 text 暴露，和其它后端一致（rerank 读 text）
+        return [Hit(hit["_source"]["doc_id"], hit["_score"], {**hit["_source"], "text": hit["_source"].get("content")})
+                for hit in hits]
+
+    def search(self, query, k=10):
+        # ik 分词在服务端完成，没有单独的 embed 阶段
+        with self.timer.stage("network"):
+            res = self.es.search(index=self.index_name, body=self._query_body(query, k))
+        with self.timer.stage("score"):
+            return self._to_hits(res["hits"]["hits"])
+
+    def search_batch(self, queries, k=10):
+        # msearch: 一次请求执行多条查询
+        body = []
+        for query in queries:
+            body.append({"index": self.index_name})
+            body.append(self._query_body(query, k))
+        if not body:
+            return []
+        with self.timer.stage("network"):
+            res = self.es.msearch(body=body)
+        with self.timer.stage("score"):
+            return [self._to_hits(response["hits"]["hits"]) for response in res["responses"]]
+
+    def search_groups(self, queries, k=10, group_by="page_id", group_size=3):
+        """
+        Server-side grouping with field collapsing: the top k groups ranked by
+        their best paragraph, each with up to group_size paragraphs from
+        inner_hits. Returns the paragraphs of each query as one flat Hit list.
+        group_by is page_id or a keyword metadata field.
+        """
+        field = group_by if group_by == "page_id" else f"metadata_fields.{group_by}.keyword"
+        body = []
+        for query in queries:
+            body.append({"index": self.index_name})
+            body.append({
+                **self._query_body(query, k),
+                "collapse": {
+                    "field": field,
+                    "inner_hits": {"name": "paragraphs", "size": group_size, "sort": [{"_score": "desc"}]}
+                }
+            })
+        if not body:
+            return []
+        with self.timer.stage("network"):
+            res = self.es.msearch(body=body)
+        with self.timer.stage("score"):
+            return [
+                [paragraph for hit in response["hits"]["hits"]
+                 for paragraph in self._to_hits(hit["inner_hits"]["paragraphs"]["hits"]["hits"])]
+                for response in res["responses"]
+            ]
+
+    def close(self):
+        self.es.close()
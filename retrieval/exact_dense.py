@@ -0,0 +1,171 @@
+import os
+import json
+
+import numpy as np
+from tqdm import tqdm
+
+from utils.index_manifest import corpus_hash
+from .base import BaseRetriever, Hit, batched
+from .encoders import encode_queries
+
+# 暴力精确检索：归一化后的文档向量放在 mmap 矩阵里，query 按块做 GEMM + argpartition 取 top-k。
+# 结果就是 cosine 的精确 top-k，可作为 HNSW 等近似索引召回率的 ground truth
+VECTORS_FILE = "vectors.bin"
+DOC_IDS_FILE = "doc_ids.json"
+META_FILE = "meta.json"
+
+
+def normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def _merge_top_k(best_idx, best_scores, idx, scores, k):
+    if best_idx is not None:
+        idx = np.concatenate([best_idx, idx], axis=1)
+        scores = np.concatenate([best_scores, scores], axis=1)
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        idx = np.take_along_axis(idx, part, axis=1)
+        scores = np.take_along_axis(scores, part, axis=1)
+    return idx, scores
+
+
+def exact_top_k(queries, matrix, k=10, block_size=16384, query_block_size=1024):
+    """
+    Exact inner-product top-k of every query row against matrix (n, dim),
+    which may be a float16 / float32 memmap. The matrix is read block_size
+    rows at a time (converted to float32) and multiplied with
+    query_block_size queries, keeping a running top-k per query. Returns
+    (indices, scores), both (n_queries, min(k, n)) and sorted by score.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    k = min(k, len(matrix))
+    indices = np.zeros((len(queries), k), dtype=np.int64)
+    result_scores = np.zeros((len(queries), k), dtype=np.float32)
+    if k == 0:
+        return indices, result_scores
+    for q_start in range(0, len(queries), query_block_size):
+        query_block = queries[q_start:q_start + query_block_size]
+        best_idx = best_scores = None
+        for start in range(0, len(matrix), block_size):
+            block = np.asarray(matrix[start:start + block_size], dtype=np.float32)
+            scores = query_block @ block.T
+            idx = np.broadcast_to(np.arange(start, start + len(block)), scores.shape)
+            best_idx, best_scores = _merge_top_k(best_idx, best_scores, idx, scores, k)
+        order = np.argsort(-best_scores, axis=1, kind="stable")
+        indices[q_start:q_start + len(query_block)] = np.take_along_axis(best_idx, order, axis=1)
+        result_scores[q_start:q_start + len(query_block)] = np.take_along_axis(best_scores, order, axis=1)
+    return indices, result_scores
+
+
+def ann_recall(run, exact_run, k=10):
+    """
+    Mean overlap between approximate and exact top-k doc_id lists of the same
+    queries: |approx@k & exact@k| / |exact@k|.
+    """
+    recalls = []
+    for query_id, exact_ids in exact_run.items():
+        expected = set(exact_ids[:k])
+        if not expected or query_id not in run:
+            continue
+        recalls.append(len(expected & set(run[query_id][:k])) / len(expected))
+    return float(np.mean(recalls)) if recalls else 0.0
+
+
+class ExactDenseRetriever(BaseRetriever):
+    """
+    Brute-force cosine search over L2-normalized document embeddings. With
+    index_path the matrix is written to disk once (float32 or float16) and
+    memory-mapped on later runs, as long as meta.json records the same model,
+    dim, dtype and corpus hash (doc ids + content); otherwise it is rebuilt.
+    Without index_path the matrix stays in memory.
+    encoder is any object with encode(texts) and dim (see retrieval.encoders).
+    """
+    name = "dense_exact"
+
+    def __init__(self, encoder, index_path=None, dtype="float32", batch_size=256, block_size=16384):
+        self.encoder = encoder
+        self.index_path = index_path
+        self.dtype = np.dtype(dtype)
+        self.batch_size = batch_size
+        self.block_size = block_size
+        self.matrix = None
+        self.doc_ids = []
+
+    def _path(self, name):
+        return os.path.join(self.index_path, name)
+
+    def _config(self):
+        return {
+            "model": getattr(self.encoder, "model_name", type(self.encoder).__name__),
+            "dim": self.encoder.dim,
+            "dtype": self.dtype.name
+        }
+
+    def _read_meta(self):
+        try:
+            with open(self._path(META_FILE), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _load(self):
+        meta = self._read_meta()
+        with open(self._path(DOC_IDS_FILE), "r", encoding="utf-8") as f:
+            self.doc_ids = json.load(f)
+        if meta["count"] == 0:
+            self.matrix = np.zeros((0, meta["dim"]), dtype=meta["dtype"])
+            return
+        self.matrix = np.memmap(self._path(VECTORS_FILE), dtype=meta["dtype"], mode="r",
+                                shape=(meta["count"], meta["dim"]))
+
+    def index(self, docs, reindex=False):
+        docs = list(docs)
+        digest = corpus_hash((doc.doc_id, doc) for doc in docs) if self.index_path else None
+        if self.index_path and not reindex:
+            meta = self._read_meta()
+            # 模型 / 维度 / dtype 或语料（doc_id、内容）变了，矩阵和 doc_ids 就对不上，整体重建
+            if (meta is not None and meta.get("corpus_hash") == digest
+                    and all(meta.get(key) == value for key, value in self._config().items())):
+                self._load()
+                return
+            if meta is not None:
+                print(f"{self.name}: index at {self.index_path} does not match the corpus or encoder, rebuilding")
+        shape = (len(docs), self.encoder.dim)
+        if self.index_path:
+            os.makedirs(self.index_path, exist_ok=True)
+            # meta 最后写入，作为索引完整的标志；重建时先删掉
+            if os.path.exists(self._path(META_FILE)):
+                os.remove(self._path(META_FILE))
+            matrix = np.memmap(self._path(VECTORS_FILE), dtype=self.dtype, mode="w+", shape=shape) if len(docs) else None
+        else:
+            matrix = np.zeros(shape, dtype=self.dtype)
+        for start, batch in tqdm(zip(range(0, len(docs), self.batch_size), batched(docs, self.batch_size)),
+                                 total=-(-len(docs) // self.batch_size), desc=f"Embedding {self.name}"):
+            matrix[start:start + len(batch)] = normalize(self.encoder.encode([doc.text for doc in batch]))
+        self.doc_ids = [doc.doc_id for doc in docs]
+        if not self.index_path:
+            self.matrix = matrix
+            return
+        if matrix is not None:
+            matrix.flush()
+        with open(self._path(DOC_IDS_FILE), "w", encoding="utf-8") as f:
+            json.dump(self.doc_ids, f, ensure_ascii=False)
+        with open(self._path(META_FILE), "w", encoding="utf-8") as f:
+            json.dump({**self._config(), "count": len(docs), "corpus_hash": digest}, f)
+        self._load()
+
+    def search(self, query, k=10):
+        return self.search_batch([query], k)[0]
+
+    def search_batch(self, queries, k=10):
+        with self.timer.stage("embed"):
+            query_vectors = normalize(encode_queries(self.encoder, queries))
+        with self.timer.stage("score"):
+            indices, scores = exact_top_k(query_vectors, self.matrix, k, self.block_size)
+            return [
+                [Hit(self.doc_ids[i], float(score)) for i, score in zip(row_idx, row_scores)]
+                for row_idx, row_scores in zip(indices, scores)
+            ]
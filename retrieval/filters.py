@@ -0,0 +1,51 @@
+from qdrant_client import models
+
+# 建 keyword payload 索引的字段：tag_list 在入库时（doc_payload）拆成 tag_ids / tag_names 数组，
+# page_id 供 query_points_groups 分组
+FILTER_FIELDS = ("tag_ids", "tag_names", "resource_type_code", "container_id", "parent_id", "page_id")
+
+
+def create_payload_indexes(client, collection_name, fields=FILTER_FIELDS):
+    # 已有的索引跳过；已有数据的 collection 也可以补建，wait=True 等索引建完再返回
+    existing = client.get_collection(collection_name).payload_schema
+    for field in fields:
+        if field not in existing:
+            client.create_payload_index(collection_name, field_name=field,
+                                        field_schema=models.PayloadSchemaType.KEYWORD, wait=True)
+
+
+def to_qdrant_filter(filters):
+    """
+    models.Filter from {field: value} or [(field, value), ...]. Every
+    (field, value) pair is its own condition and all of them must hold, so
+    [("tag_names", "语文"), ("tag_names", "七年级")] scopes to a subject and a
+    grade; a list value is one MatchAny condition, so
+    {"resource_type_code": ["a", "b"]} allows either type.
+    """
+    if not filters:
+        return None
+    if isinstance(filters, models.Filter):
+        return filters
+    items = filters.items() if isinstance(filters, dict) else filters
+    must = []
+    for field, value in items:
+        if isinstance(value, (list, tuple, set)):
+            match = models.MatchAny(any=list(value))
+        else:
+            match = models.MatchValue(value=value)
+        must.append(models.FieldCondition(key=field, match=match))
+    return models.Filter(must=must)
+
+
+def parse_filter_args(specs):
+    """
+    CLI filters "field=value" or "field=v1|v2" (any of) -> [(field, value)].
+    """
+    filters = []
+    for spec in specs or []:
+        field, _, value = spec.partition("=")
+        if not field or not value:
+            raise ValueError(f"Invalid filter {spec!r}, expected field=value or field=v1|v2")
+        values = value.split("|")
+        filters.append((field, values if len(values) > 1 else values[0]))
+    return filters
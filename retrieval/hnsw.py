@@ -0,0 +1,81 @@
+import time
+
+from qdrant_client import models
+
+from .benchmark import summarize_latencies
+from .exact_dense import ann_recall
+from .ingest import wait_for_collection
+
+# HNSW 参数扫描：构建期 m / ef_construct 通过 update_collection 原地重建索引，
+# 查询期 hnsw_ef / exact 逐个测延迟和相对精确检索的召回率，最后取 Pareto 前沿
+HNSW_M = (8, 16, 32)
+HNSW_EF_CONSTRUCT = (64, 128, 256)
+HNSW_EF = (16, 32, 64, 128, 256, 512)
+
+
+def tune_hnsw(client, collection_name, m, ef_construct, indexing_threshold=None, timeout=3600.0, strict=True):
+    """
+    Change the HNSW build parameters of an existing collection and wait until
+    Qdrant has rebuilt the graph (collection green again). indexing_threshold
+    (KB) can force small collections to be indexed at all; by default Qdrant
+    keeps segments under ~10 MB unindexed and answers them by full scan.
+    strict=False only warns when the rebuild outlasts timeout instead of
+    raising TimeoutError.
+    """
+    client.update_collection(
+        collection_name=collection_name,
+        hnsw_config=models.HnswConfigDiff(m=m, ef_construct=ef_construct),
+        optimizers_config=(
+            models.OptimizersConfigDiff(indexing_threshold=indexing_threshold)
+            if indexing_threshold is not None else None
+        )
+    )
+    # 更新后状态可能短暂仍为 green，先等优化器接手
+    time.sleep(1.0)
+    wait_for_collection(client, collection_name, timeout=timeout, strict=strict)
+
+
+def measure_search(client, collection_name, query_vectors, exact_run, k=10, search_params=None, using=None, warmup=10):
+    """
+    Query every vector sequentially with the given models.SearchParams and
+    return latency percentiles plus recall@k against exact_run, a
+    {query index: [doc_id, ...]} of exact top-k results.
+    """
+    run = {}
+    samples = []
+    for i, vector in enumerate(query_vectors):
+        start = time.perf_counter()
+        result = client.query_points(
+            collection_name=collection_name,
+            query=vector,
+            using=using,
+            limit=k,
+            search_params=search_params,
+            with_payload=["doc_id"]
+        )
+        elapsed = time.perf_counter() - start
+        samples.append({"total": elapsed, "network": elapsed})
+        run[i] = [point.payload["doc_id"] for point in result.points]
+    row = {f"recall@{k}": ann_recall(run, exact_run, k)}
+    row.update(summarize_latencies(samples, min(warmup, len(samples) // 2)))
+    return row
+
+
+def pareto_frontier(rows, quality=None, speed="qps"):
+    """
+    Mark rows that no other row beats on both quality (higher is better) and
+    speed (higher is better): row["pareto"] = True/False. Returns the frontier
+    sorted by speed.
+    """
+    quality = quality or next(key for key in rows[0] if key.startswith("recall@"))
+    frontier = []
+    for row in rows:
+        dominated = any(
+            other[quality] >= row[quality] and other[speed] >= row[speed]
+            and (other[quality] > row[quality] or other[speed] > row[speed])
+            for other in rows
+        )
+        row["pareto"] = not dominated
+        if not dominated:
+            frontier.append(row)
+    return sorted(frontier, key=lambda row: row[speed])
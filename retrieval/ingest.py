@@ -0,0 +1,266 @@
+import time
+import queue
+import threading
+
+import numpy as np
+from qdrant_client import models
+from qdrant_client.local.qdrant_local import QdrantLocal
+
+from utils.index_manifest import IndexManifest, content_hash, plan_sync
+from .base import batched, point_id
+
+# 流水线入库：读取/切批 -> 多个 embedding 线程 -> upload_points（多进程、wait=False），
+# 各阶段之间用有界队列连接，embedding 服务和 Qdrant 同时工作；最后统一等待数据可见
+_DONE = object()
+
+
+def _put(q, item, stop):
+    # 下游出错时 stop 被置位，避免上游一直阻塞在满队列上
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def dense_batch(ids, vectors, payloads=None, name=None):
+    """
+    Column-oriented models.Batch from a (n, dim) array. The matrix is turned
+    into lists with a single tolist() call and the Batch skips pydantic
+    validation, so no PointStruct or per-float conversion happens per point.
+    """
+    rows = np.asarray(vectors, dtype=np.float32).tolist()
+    return models.Batch.model_construct(ids=list(ids), vectors={name: rows} if name else rows, payloads=payloads)
+
+
+def sparse_batch(ids, embeddings, payloads=None, name="bm25"):
+    """
+    Column-oriented models.Batch of named sparse vectors from fastembed
+    SparseEmbedding objects (or anything with indices / values arrays).
+    """
+    vectors = [
+        models.SparseVector.model_construct(indices=embedding.indices.tolist(), values=embedding.values.tolist())
+        for embedding in embeddings
+    ]
+    return models.Batch.model_construct(ids=list(ids), vectors={name: vectors}, payloads=payloads)
+
+
+def named_batch(ids, vectors, payloads=None):
+    """
+    Column-oriented models.Batch carrying several named vectors per point,
+    e.g. {"dense": (n, dim) array, "bm25": [SparseEmbedding, ...],
+    "colbert": [(tokens, dim) array, ...]}.
+    """
+    columns = {}
+    for name, values in vectors.items():
+        if len(values) and hasattr(values[0], "indices"):
+            columns[name] = sparse_batch(ids, values, name=name).vectors[name]
+        elif len(values) and np.ndim(values[0]) == 2:
+            # multivector：每个点一个 (tokens, dim) 矩阵
+            columns[name] = [np.asarray(matrix, dtype=np.float32).tolist() for matrix in values]
+        else:
+            columns[name] = dense_batch(ids, values).vectors
+    return models.Batch.model_construct(ids=list(ids), vectors=columns, payloads=payloads)
+
+
+def pipelined_upload(client, collection_name, items, encode, make_point=None, batch_size=64, embed_workers=2,
+                     upload_workers=2, queue_size=8, wait=True, timeout=600.0, min_count=None, make_batch=None):
+    """
+    Ingest items into an existing collection with embedding and uploading
+    overlapped. encode(batch_of_items) returns one vector per item and
+    make_point(item, vector) builds the PointStruct. embed_workers threads
+    encode batches while client.upload_points(parallel=upload_workers,
+    wait=False) streams the results; with wait=True the call then waits up to
+    timeout seconds for the collection to count min_count points (default:
+    the number uploaded) and turn green, see wait_for_collection. Returns the
+    number of points uploaded.
+
+    With make_batch(batch_of_items, vectors) instead of make_point, every
+    encoded batch becomes one column-oriented models.Batch (see dense_batch /
+    sparse_batch) that upload_workers threads send with upsert(wait=False).
+    """
+    if (make_point is None) == (make_batch is None):
+        raise ValueError("Pass exactly one of make_point / make_batch")
+    batch_queue = queue.Queue(maxsize=queue_size)
+    point_queue = queue.Queue(maxsize=queue_size)
+    stop = threading.Event()
+    errors = []
+
+    def produce():
+        try:
+            for batch in batched(items, batch_size):
+                if not _put(batch_queue, batch, stop):
+                    return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            for _ in range(embed_workers):
+                _put(batch_queue, _DONE, stop)
+
+    def embed():
+        try:
+            while not stop.is_set():
+                try:
+                    batch = batch_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if batch is _DONE:
+                    break
+                vectors = encode(batch)
+                if make_batch is not None:
+                    points = make_batch(batch, vectors)
+                else:
+                    points = [make_point(item, vector) for item, vector in zip(batch, vectors)]
+                if not _put(point_queue, points, stop):
+                    return
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(point_queue, _DONE, stop)
+
+    uploaded = 0
+    done_workers = 0
+    lock = threading.Lock()
+
+    def upload():
+        # 列式 Batch：每个线程从队列取整批直接 upsert
+        nonlocal uploaded, done_workers
+        try:
+            while not stop.is_set():
+                with lock:
+                    if done_workers >= embed_workers:
+                        return
+                try:
+                    batch = point_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if batch is _DONE:
+                    with lock:
+                        done_workers += 1
+                    continue
+                client.upsert(collection_name=collection_name, points=batch, wait=False)
+                with lock:
+                    uploaded += len(batch.ids)
+        except BaseException as e:
+            errors.append(e)
+            stop.set()
+
+    def points():
+        nonlocal uploaded
+        finished = 0
+        while finished < embed_workers and not stop.is_set():
+            try:
+                item = point_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is _DONE:
+                finished += 1
+                continue
+            uploaded += len(item)
+            yield from item
+
+    threads = [threading.Thread(target=produce, daemon=True)]
+    threads += [threading.Thread(target=embed, daemon=True) for _ in range(embed_workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        if make_batch is not None:
+            # 本地模式（:memory: / path）的存储不是线程安全的，只用一个上传线程
+            local = isinstance(getattr(client, "_client", None), QdrantLocal)
+            uploaders = [threading.Thread(target=upload, daemon=True) for _ in range(1 if local else upload_workers)]
+            for thread in uploaders:
+                thread.start()
+            for thread in uploaders:
+                thread.join()
+        else:
+            client.upload_points(
+                collection_name=collection_name,
+                points=points(),
+                batch_size=batch_size,
+                parallel=upload_workers,
+                wait=False
+            )
+    except BaseException:
+        stop.set()
+        raise
+    finally:
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+    if wait:
+        wait_for_collection(client, collection_name, uploaded if min_count is None else min_count, timeout=timeout)
+    return uploaded
+
+
+def wait_for_collection(client, collection_name, min_count=0, timeout=600.0, interval=0.5, strict=False):
+    """
+    Consistency barrier after wait=False uploads: block until the collection
+    holds at least min_count points and its status is green. On timeout only
+    a warning is printed (the uploads are already acknowledged and Qdrant
+    keeps optimizing in the background) unless strict=True, which raises
+    TimeoutError. Returns the last point count.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        count = client.count(collection_name=collection_name, exact=True).count
+        info = client.get_collection(collection_name)
+        if count >= min_count and info.status == models.CollectionStatus.GREEN:
+            return count
+        if time.monotonic() > deadline:
+            message = (f"Collection {collection_name} not ready after {timeout}s: "
+                       f"{count}/{min_count} points, status {info.status}")
+            if strict:
+                raise TimeoutError(message)
+            print(f"Warning: {message}")
+            return count
+        time.sleep(interval)
+
+
+def sync_collection(client, collection_name, items, create_collection, encode, make_point=None, reindex=False,
+                    config=None, hash_item=content_hash, **pipeline_kwargs):
+    """
+    Idempotent ingest of items = [(doc_id, item), ...]. A missing collection is
+    created with create_collection() and filled; an existing one is left alone
+    unless reindex=True, in which case only new or changed items (by content
+    hash against the collection's manifest) are uploaded and items that
+    disappeared are deleted. Without a usable manifest the collection is
+    rebuilt once. encode / make_point are as in pipelined_upload and receive
+    the (doc_id, item) tuples; make_batch can be passed instead of make_point.
+    The manifest is saved as soon as the uploads are acknowledged, before the
+    optional wait / timeout barrier of pipelined_upload.
+    """
+    exists = client.collection_exists(collection_name)
+    if exists and not reindex:
+        return
+    # 同一 doc_id 出现多次时以最后一次为准
+    items = list({doc_id: (doc_id, item) for doc_id, item in items}.values())
+    manifest = IndexManifest("qdrant", collection_name, config)
+    hashes = {doc_id: hash_item(item) for doc_id, item in items}
+    indexed_count = client.count(collection_name=collection_name, exact=True).count if exists else None
+    full, changed, removed = plan_sync(manifest, hashes, exists, indexed_count)
+    if full:
+        if exists:
+            client.delete_collection(collection_name)
+        create_collection()
+    if removed:
+        for ids in batched(removed, 1000):
+            client.delete(
+                collection_name=collection_name,
+                points_selector=models.PointIdsList(points=[point_id(doc_id) for doc_id in ids]),
+                wait=True
+            )
+    changed = set(changed)
+    wait = pipeline_kwargs.pop("wait", True)
+    timeout = pipeline_kwargs.pop("timeout", 600.0)
+    pipelined_upload(client, collection_name, [(doc_id, item) for doc_id, item in items if doc_id in changed],
+                     encode, make_point, wait=False, **pipeline_kwargs)
+    # 上传已被 Qdrant 确认即写 manifest，等待变绿超时也不会丢掉这次同步的记录
+    manifest.save(hashes)
+    if wait:
+        wait_for_collection(client, collection_name, len(hashes), timeout=timeout)
+    print(f"{collection_name}: {'rebuilt' if full else 'synced'}, {len(changed)} upserted, {len(removed)} deleted")
@@ -0,0 +1,146 @@
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from .benchmark import timed_search, summarize_latencies
+
+# 压测：检索后端都是同步接口，用线程池承载请求，asyncio 负责调度和限流
+CONCURRENCY_LEVELS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+async def _closed_loop(retriever, queries, k, concurrency, deadline, executor):
+    # 闭环：concurrency 个 worker 各自发完一个再发下一个，在途请求数恒为 concurrency
+    loop = asyncio.get_running_loop()
+    samples = []
+    position = 0
+
+    async def worker():
+        nonlocal position
+        while time.perf_counter() < deadline:
+            query = queries[position % len(queries)]
+            position += 1
+            start = time.perf_counter()
+            _, sample = await loop.run_in_executor(executor, timed_search, retriever, query, k)
+            sample["start"] = start
+            samples.append(sample)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples
+
+
+async def _open_loop(retriever, queries, k, target_qps, max_in_flight, deadline, executor):
+    # 开环：按固定间隔发请求，不等前一个返回；超过 max_in_flight 时在 semaphore 上排队。
+    # total 从计划发出时刻算起，包含排队时间，避免 coordinated omission 低估尾延迟
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(max_in_flight)
+    samples = []
+
+    async def issue(query, scheduled):
+        async with semaphore:
+            queued = time.perf_counter() - scheduled
+            _, sample = await loop.run_in_executor(executor, timed_search, retriever, query, k)
+        sample["queue"] = queued
+        sample["total"] = time.perf_counter() - scheduled
+        sample["start"] = scheduled
+        samples.append(sample)
+
+    tasks = []
+    interval = 1.0 / target_qps
+    scheduled = time.perf_counter()
+    position = 0
+    while scheduled < deadline:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.ensure_future(issue(queries[position % len(queries)], scheduled)))
+        position += 1
+        scheduled += interval
+    await asyncio.gather(*tasks)
+    return samples
+
+
+def _summarize(samples, started, warmup_seconds):
+    # 丢弃预热阶段发出的请求，吞吐按预热结束到最后一个请求完成的时间计算
+    measured_from = started + warmup_seconds
+    measured = [s for s in samples if s["start"] >= measured_from]
+    if not measured:
+        return summarize_latencies([])
+    finished = max(s["start"] + s["total"] for s in measured)
+    return summarize_latencies(measured, wall_seconds=finished - measured_from)
+
+
+def run_closed_loop(retriever, queries, k=10, concurrency=1, duration=30.0, warmup=5.0):
+    """
+    Keep exactly `concurrency` queries in flight for warmup + duration seconds.
+    Returns the latency summary of the queries issued after the warm-up.
+    """
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        started = time.perf_counter()
+        deadline = started + warmup + duration
+        samples = asyncio.run(_closed_loop(retriever, queries, k, concurrency, deadline, executor))
+    return _summarize(samples, started, warmup)
+
+
+def run_open_loop(retriever, queries, k=10, target_qps=10.0, max_in_flight=256, duration=30.0, warmup=5.0):
+    """
+    Issue queries at a fixed `target_qps` regardless of how fast they complete,
+    with at most `max_in_flight` running at once. Latency includes queueing.
+    """
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        started = time.perf_counter()
+        deadline = started + warmup + duration
+        samples = asyncio.run(_open_loop(retriever, queries, k, target_qps, max_in_flight, deadline, executor))
+    return _summarize(samples, started, warmup)
+
+
+def sweep(retriever, queries, k=10, levels=CONCURRENCY_LEVELS, open_loop=False, max_in_flight=256,
+          duration=30.0, warmup=5.0):
+    """
+    Run one load level after another. levels are concurrency values for the
+    closed loop or target QPS values for the open loop. Returns one row per level.
+    """
+    rows = []
+    for level in levels:
+        if open_loop:
+            summary = run_open_loop(retriever, queries, k, level, max_in_flight, duration, warmup)
+            row = {"backend": retriever.name, "mode": "open", "target_qps": level}
+        else:
+            summary = run_closed_loop(retriever, queries, k, int(level), duration, warmup)
+            row = {"backend": retriever.name, "mode": "closed", "concurrency": int(level)}
+        row.update(summary)
+        print(f"{retriever.name} {row['mode']} {level}: {summary.get('qps', 0.0):.1f} qps, "
+              f"p50 {summary.get('total_p50_ms', 0.0):.1f} ms, p99 {summary.get('total_p99_ms', 0.0):.1f} ms")
+        rows.append(row)
+    return rows
+
+
+def plot_curve(rows, path):
+    """
+    Throughput (x) against p50/p99 latency (y), one line pair per backend,
+    each point labelled with its concurrency / target QPS.
+    """
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(9, 6))
+    backends = list(dict.fromkeys(row["backend"] for row in rows))
+    for backend in backends:
+        points = [row for row in rows if row["backend"] == backend and row.get("queries")]
+        qps = [row["qps"] for row in points]
+        for percentile, style in (("p50", "-o"), ("p99", "--x")):
+            ax.plot(qps, [row[f"total_{percentile}_ms"] for row in points], style, label=f"{backend} {percentile}")
+        for row in points:
+            level = row.get("concurrency", row.get("target_qps"))
+            ax.annotate(str(level), (row["qps"], row["total_p99_ms"]), fontsize=7,
+                        textcoords="offset points", xytext=(3, 3))
+    ax.set_xlabel("Throughput (QPS)")
+    ax.set_ylabel("Latency (ms)")
+    ax.set_yscale("log")
+    ax.set_title("Throughput / latency")
+    ax.grid(True, which="both", alpha=0.3)
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+    print(f"Plot saved to {path}")
@@ -0,0 +1,105 @@
+import numpy as np
+import scipy.sparse as sp
+from tqdm import tqdm
+
+from .analysis import tokenize
+from .base import BaseRetriever, Hit, batched
+
+
+def top_k_rows(scores, k):
+    """
+    Per-row top-k of a CSR score matrix: [(columns, values)] sorted by
+    descending score, using argpartition on each row's non-zeros.
+    """
+    results = []
+    for row in range(scores.shape[0]):
+        start, end = scores.indptr[row], scores.indptr[row + 1]
+        values = scores.data[start:end]
+        columns = scores.indices[start:end]
+        if len(values) > k:
+            part = np.argpartition(-values, k - 1)[:k]
+            values, columns = values[part], columns[part]
+        order = np.argsort(-values, kind="stable")
+        results.append((columns[order], values[order]))
+    return results
+
+
+class LocalBM25Retriever(BaseRetriever):
+    """
+    In-process BM25 over a CSR term-document matrix (NumPy / SciPy only).
+    Document term weights are precomputed at index time, so a batch of queries
+    is scored with one sparse matrix product followed by a per-row
+    argpartition top-k.
+    """
+    name = "bm25_local"
+
+    def __init__(self, k1=1.2, b=0.75, stem=True, query_batch_size=256):
+        self.k1 = k1
+        self.b = b
+        self.stem = stem
+        self.query_batch_size = query_batch_size
+        self.vocab = {}
+        self.doc_ids = []
+        self.weights = None
+
+    def index(self, docs, reindex=False):
+        if self.weights is not None and not reindex:
+            return
+        vocab = {}
+        doc_ids = []
+        indices = []
+        indptr = [0]
+        for doc in tqdm(docs, desc="Indexing documents"):
+            doc_ids.append(doc.doc_id)
+            indices.extend(vocab.setdefault(term, len(vocab)) for term in tokenize(doc.text, self.stem))
+            indptr.append(len(indices))
+        # 重复的 (doc, term) 在 sum_duplicates 后合并为词频
+        counts = sp.csr_matrix(
+            (np.ones(len(indices), dtype=np.float32), np.asarray(indices, dtype=np.int32), np.asarray(indptr, dtype=np.int64)),
+            shape=(len(doc_ids), len(vocab))
+        )
+        counts.sum_duplicates()
+        n_docs = counts.shape[0]
+        doc_len = np.diff(indptr).astype(np.float32)
+        avg_len = doc_len.mean() if n_docs else 0.0
+        df = np.bincount(counts.indices, minlength=len(vocab)).astype(np.float32)
+        # Lucene / Tantivy 的 idf
+        idf = np.log1p((n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+        tf = counts.data
+        norm = np.repeat(self.k1 * (1 - self.b + self.b * doc_len / max(avg_len, 1e-9)), np.diff(counts.indptr))
+        counts.data = (tf * (self.k1 + 1) / (tf + norm) * idf[counts.indices]).astype(np.float32)
+        # 转成 term x doc，query 矩阵右乘即得到每个 query 对所有文档的得分
+        self.weights = counts.T.tocsr()
+        self.vocab = vocab
+        self.doc_ids = doc_ids
+        print(f"{self.name}: indexed {n_docs} documents, {len(vocab)} terms")
+
+    def _query_matrix(self, queries):
+        rows, cols = [], []
+        for row, query in enumerate(queries):
+            for term in tokenize(query, self.stem):
+                col = self.vocab.get(term)
+                if col is not None:
+                    rows.append(row)
+                    cols.append(col)
+        # 重复的查询词各算一次，和 ES / Tantivy 的 should 子句一致
+        return sp.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+            shape=(len(queries), len(self.vocab))
+        )
+
+    def search(self, query, k=10):
+        return self.search_batch([query], k)[0]
+
+    def search_batch(self, queries, k=10):
+        if self.weights is None:
+            raise RuntimeError(f"{self.name}: index() has to be called before searching")
+        results = []
+        for chunk in batched(queries, self.query_batch_size):
+            with self.timer.stage("embed"):
+                query_matrix = self._query_matrix(chunk)
+            with self.timer.stage("score"):
+                scores = (query_matrix @ self.weights).tocsr()
+                for columns, values in top_k_rows(scores, k):
+                    results.append([Hit(self.doc_ids[col], float(score)) for col, score in zip(columns, values)])
+        return results
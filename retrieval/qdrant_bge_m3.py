@@ -0,0 +1,137 @@
+import os
+from qdrant_client import QdrantClient, models
+from tqdm import tqdm
+
+from .base import BaseRetriever, Hit, point_id, doc_payload, PAYLOAD_VERSION
+from .ingest import sync_collection, named_batch
+
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", None)
+CANDIDATES = ("dense", "sparse", "hybrid")
+
+
+class QdrantBGEM3Retriever(BaseRetriever):
+    """
+    All three bge-m3 outputs in one collection: a "dense" vector, a "sparse"
+    lexical-weight vector and a "colbert" multivector, written from a single
+    encode_all() pass per batch.
+
+    Search generates prefetch_limit candidates from the dense vector, the
+    sparse vector or both (candidates=...), then with rerank=True Qdrant
+    rescores them by MaxSim over the ColBERT token vectors in the same
+    query_points call. rerank=False returns the candidates directly (RRF for
+    "hybrid"), i.e. plain dense / sparse search on the same collection.
+    """
+    name = "bge_m3_multi_qdrant"
+
+    def __init__(self, collection_name, encoder, url=QDRANT_URL, api_key=QDRANT_API_KEY, client=None,
+                 candidates="dense", rerank=True, prefetch_limit=100, batch_size=32, embed_workers=1,
+                 upload_workers=2):
+        if candidates not in CANDIDATES:
+            raise ValueError(f"Unknown candidates {candidates}, choose from: {', '.join(CANDIDATES)}")
+        self.collection_name = collection_name
+        self.encoder = encoder
+        self.client = client or QdrantClient(url=url, api_key=api_key, prefer_grpc=True)
+        self.candidates = candidates
+        self.rerank = rerank
+        self.prefetch_limit = prefetch_limit
+        self.batch_size = batch_size
+        self.embed_workers = embed_workers
+        self.upload_workers = upload_workers
+
+    def index(self, docs, reindex=False):
+        def create_collection():
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config={
+                    "dense": models.VectorParams(size=self.encoder.dim, distance=models.Distance.COSINE),
+                    # ColBERT 向量只用于 rescore：不建 HNSW（m=0），float16 + 落盘，每个 token 一个向量，体积远大于 dense
+                    "colbert": models.VectorParams(
+                        size=self.encoder.dim,
+                        distance=models.Distance.COSINE,
+                        multivector_config=models.MultiVectorConfig(comparator=models.MultiVectorComparator.MAX_SIM),
+                        hnsw_config=models.HnswConfigDiff(m=0),
+                        datatype=models.Datatype.FLOAT16,
+                        on_disk=True
+                    )
+                },
+                # lexical weights 已经是模型给出的词权重，不再叠加 IDF
+                sparse_vectors_config={"sparse": models.SparseVectorParams()}
+            )
+
+        progress = tqdm(desc=f"Indexing {self.collection_name}")
+
+        def encode(batch):
+            embeddings = self.encoder.encode_all([doc.text for _, doc in batch])
+            progress.update(len(batch))
+            return embeddings
+
+        def make_batch(batch, embeddings):
+            return named_batch([point_id(doc_id) for doc_id, _ in batch], embeddings,
+                               [doc_payload(doc) for _, doc in batch])
+
+        model_name = getattr(self.encoder, "model_name", type(self.encoder).__name__)
+        sync_collection(self.client, self.collection_name, ((doc.doc_id, doc) for doc in docs), create_collection,
+                        encode, make_batch=make_batch, reindex=reindex,
+                        config=f"bge_m3_multi:{model_name}:{self.encoder.dim}:cosine:dense+sparse+colbert:{PAYLOAD_VERSION}",
+                        batch_size=self.batch_size, embed_workers=self.embed_workers,
+                        upload_workers=self.upload_workers)
+        progress.close()
+
+    def _prefetch(self, dense_query, sparse_query, limit):
+        prefetch = []
+        if self.candidates != "sparse":
+            prefetch.append(models.Prefetch(query=dense_query, using="dense", limit=limit))
+        if self.candidates != "dense":
+            prefetch.append(models.Prefetch(query=sparse_query, using="sparse", limit=limit))
+        return prefetch
+
+    def _request(self, embeddings, i, k):
+        dense_query = embeddings["dense"][i].tolist() if "dense" in embeddings else None
+        sparse_query = models.SparseVector(
+            indices=embeddings["sparse"][i].indices.tolist(),
+            values=embeddings["sparse"][i].values.tolist()
+        ) if "sparse" in embeddings else None
+        if self.rerank:
+            return models.QueryRequest(
+                prefetch=self._prefetch(dense_query, sparse_query, max(k, self.prefetch_limit)),
+                query=embeddings["colbert"][i].tolist(),
+                using="colbert",
+                limit=k,
+                with_payload=True
+            )
+        if self.candidates == "dense":
+            return models.QueryRequest(query=dense_query, using="dense", limit=k, with_payload=True)
+        if self.candidates == "sparse":
+            return models.QueryRequest(query=sparse_query, using="sparse", limit=k, with_payload=True)
+        return models.QueryRequest(
+            prefetch=self._prefetch(dense_query, sparse_query, max(k, self.prefetch_limit)),
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            limit=k,
+            with_payload=True
+        )
+
+    def search(self, query, k=10):
+        return self.search_batch([query], k)[0]
+
+    def search_batch(self, queries, k=10):
+        queries = list(queries)
+        if not queries:
+            return []
+        with self.timer.stage("embed"):
+            # 只让模型输出这次查询用得到的表示
+            embeddings = self.encoder.encode_all(
+                queries,
+                dense=self.candidates != "sparse",
+                sparse=self.candidates != "dense",
+                colbert=self.rerank
+            )
+            requests = [self._request(embeddings, i, k) for i in range(len(queries))]
+        with self.timer.stage("network"):
+            responses = self.client.query_batch_points(collection_name=self.collection_name, requests=requests)
+        with self.timer.stage("score"):
+            return [[Hit(point.payload["doc_id"], point.score, point.payload) for point in response.points]
+                    for response in responses]
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,112 @@
+import os
+from fastembed import SparseTextEmbedding
+from qdrant_client import QdrantClient, models
+from tqdm import tqdm
+
+from .base import BaseRetriever, Hit, point_id, doc_payload, PAYLOAD_VERSION
+from .encoders import BM25Encoder
+from .ingest import sync_collection, sparse_batch
+
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", None)
+# 入库时 BM25 编码的进程数，入库机器上可设为核数
+BM25_ENCODE_WORKERS = int(os.getenv("BM25_ENCODE_WORKERS", "1"))
+
+
+class QdrantBM25Retriever(BaseRetriever):
+    name = "bm25_qdrant"
+
+    def __init__(self, collection_name, url=QDRANT_URL, api_key=QDRANT_API_KEY, client=None,
+                 avg_len=256.0, batch_size=64, embed_workers=2, upload_workers=2,
+                 encode_workers=BM25_ENCODE_WORKERS, chunk_size=64):
+        self.collection_name = collection_name
+        self.client = client or QdrantClient(url=url, api_key=api_key, prefer_grpc=True)
+        # avg_len only affects document encoding; query_embed ignores it
+        self.model = SparseTextEmbedding(model_name="Qdrant/bm25", avg_len=avg_len)
+        self.avg_len = avg_len
+        self.batch_size = batch_size
+        self.embed_workers = embed_workers
+        self.upload_workers = upload_workers
+        # 文档编码的进程数和每个进程一次处理的文档数（见 BM25Encoder）
+        self.encode_workers = encode_workers
+        self.chunk_size = chunk_size
+
+    def index(self, docs, reindex=False):
+        def create_collection():
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config={},
+                sparse_vectors_config={
+                    "bm25": models.SparseVectorParams(
+                        modifier=models.Modifier.IDF
+                    )
+                }
+            )
+
+        progress = tqdm(desc=f"Indexing {self.collection_name}")
+        encoder = BM25Encoder(avg_len=self.avg_len, workers=self.encode_workers, chunk_size=self.chunk_size)
+
+        def encode(batch):
+            embeddings = encoder.encode([doc.text for _, doc in batch])
+            progress.update(len(batch))
+            return embeddings
+
+        def make_batch(batch, embeddings):
+            # 整批列式上传，不再为每个文档构造 PointStruct
+            return sparse_batch([point_id(doc_id) for doc_id, _ in batch], embeddings,
+                                [doc_payload(doc) for _, doc in batch], name="bm25")
+
+        # 每个 embedding 线程一次把一批交给进程池，线程数不少于进程数才能让所有进程都有活干
+        try:
+            sync_collection(self.client, self.collection_name, ((doc.doc_id, doc) for doc in docs), create_collection,
+                            encode, make_batch=make_batch, reindex=reindex, config=f"bm25:Qdrant/bm25:{self.avg_len}:{PAYLOAD_VERSION}",
+                            batch_size=self.batch_size, embed_workers=max(self.embed_workers, self.encode_workers),
+                            upload_workers=self.upload_workers)
+        finally:
+            encoder.close()
+        progress.close()
+
+    def _to_hits(self, points):
+        return [Hit(point.payload["doc_id"], point.score, point.payload) for point in points]
+
+    def search(self, query, k=10):
+        with self.timer.stage("embed"):
+            sparse_vector_fe = list(self.model.query_embed(query))[0]
+        with self.timer.stage("network"):
+            result = self.client.query_points(
+                collection_name=self.collection_name,
+                query=models.SparseVector(
+                    values=sparse_vector_fe.values.tolist(),
+                    indices=sparse_vector_fe.indices.tolist()
+                ),
+                using="bm25",
+                with_payload=True,
+                limit=k
+            )
+        with self.timer.stage("score"):
+            return self._to_hits(result.points)
+
+    def search_batch(self, queries, k=10):
+        # query_embed 一次编码整批，query_batch_points 一次往返
+        with self.timer.stage("embed"):
+            requests = [
+                models.QueryRequest(
+                    query=models.SparseVector(
+                        values=sparse_vector_fe.values.tolist(),
+                        indices=sparse_vector_fe.indices.tolist()
+                    ),
+                    using="bm25",
+                    with_payload=True,
+                    limit=k
+                )
+                for sparse_vector_fe in self.model.query_embed(list(queries))
+            ]
+        if not requests:
+            return []
+        with self.timer.stage("network"):
+            responses = self.client.query_batch_points(collection_name=self.collection_name, requests=requests)
+        with self.timer.stage("score"):
+            return [self._to_hits(response.points) for response in responses]
+
+    def close(self):
+        self.client.close()
@@ -0,0 +1,125 @@
+import os
+from qdrant_client import QdrantClient, models
+from tqdm import tqdm
+
+from .base import BaseRetriever, Hit, point_id, doc_payload, dense_config
+from .ingest import sync_collection, dense_batch
+from .encoders import encode_queries
+from .filters import FILTER_FIELDS, create_payload_indexes, to_qdrant_filter
+from .storage import collection_kwargs, search_params as storage_search_params
+
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", None)
+
+
+class QdrantDenseRetriever(BaseRetriever):
+    """
+    Dense retrieval over a single unnamed Qdrant vector. encoder is any object
+    with encode(texts) -> vectors and a dim attribute (see retrieval.encoders).
+    storage names a profile from retrieval.storage (e.g. "int8", "binary",
+    "on_disk+on_disk_payload"). The metadata fields in filter_fields get keyword
+    payload indexes, and search / search_batch accept filters (see
+    retrieval.filters.to_qdrant_filter).
+    """
+    name = "dense_qdrant"
+
+    def __init__(self, collection_name, encoder, url=QDRANT_URL, api_key=QDRANT_API_KEY, client=None,
+                 batch_size=64, distance=models.Distance.COSINE, embed_workers=2, upload_workers=2,
+                 hnsw_config=None, search_params=None, storage="memory", filter_fields=FILTER_FIELDS):
+        self.collection_name = collection_name
+        self.encoder = encoder
+        self.client = client or QdrantClient(url=url, api_key=api_key, prefer_grpc=True)
+        self.batch_size = batch_size
+        self.distance = distance
+        self.embed_workers = embed_workers
+        self.upload_workers = upload_workers
+        # models.HnswConfigDiff 用于建 collection，models.SearchParams（hnsw_ef / exact）用于查询，
+        # 取值可用 evaluation_local/hnsw_sweep.py 扫描得到
+        self.hnsw_config = hnsw_config
+        self.storage = storage
+        # 量化方案默认带 rescore 的查询参数
+        self.search_params = search_params if search_params is not None else storage_search_params(storage)
+        self.filter_fields = filter_fields
+
+    def index(self, docs, reindex=False):
+        def create_collection():
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                hnsw_config=self.hnsw_config,
+                **collection_kwargs(self.encoder.dim, self.distance, self.storage)
+            )
+
+        progress = tqdm(desc=f"Indexing {self.collection_name}")
+
+        def encode(batch):
+            embeddings = self.encoder.encode([doc.text for _, doc in batch])
+            progress.update(len(batch))
+            return embeddings
+
+        def make_batch(batch, embeddings):
+            return dense_batch([point_id(doc_id) for doc_id, _ in batch], embeddings,
+                               [doc_payload(doc) for _, doc in batch])
+
+        model_name = getattr(self.encoder, "model_name", type(self.encoder).__name__)
+        config = dense_config(model_name, self.encoder.dim, self.distance, self.storage)
+        sync_collection(self.client, self.collection_name, ((doc.doc_id, doc) for doc in docs), create_collection,
+                        encode, make_batch=make_batch, reindex=reindex, config=config,
+                        batch_size=self.batch_size, embed_workers=self.embed_workers, upload_workers=self.upload_workers)
+        progress.close()
+        create_payload_indexes(self.client, self.collection_name, self.filter_fields)
+
+    def _to_hits(self, points):
+        return [Hit(point.payload["doc_id"], point.score, point.payload) for point in points]
+
+    def search(self, query, k=10, filters=None):
+        return self.search_batch([query], k, filters)[0]
+
+    def search_batch(self, queries, k=10, filters=None):
+        # 一次请求编码所有 query，再用 query_batch_points 一次往返完成检索；filters 作用于整批
+        with self.timer.stage("embed"):
+            query_vectors = encode_queries(self.encoder, queries)
+        query_filter = to_qdrant_filter(filters)
+        requests = [
+            models.QueryRequest(
+                query=[float(x) for x in vector],
+                filter=query_filter,
+                params=self.search_params,
+                limit=k,
+                with_payload=True
+            )
+            for vector in query_vectors
+        ]
+        with self.timer.stage("network"):
+            responses = self.client.query_batch_points(collection_name=self.collection_name, requests=requests)
+        with self.timer.stage("score"):
+            return [self._to_hits(response.points) for response in responses]
+
+    def search_groups(self, queries, k=10, group_by="page_id", group_size=3, filters=None):
+        """
+        Server-side grouping with query_points_groups: the top k groups of the
+        group_by payload field ranked by their best point, up to group_size
+        points each. Returns the points of each query as one flat Hit list.
+        """
+        with self.timer.stage("embed"):
+            query_vectors = encode_queries(self.encoder, queries)
+        query_filter = to_qdrant_filter(filters)
+        results = []
+        for vector in query_vectors:
+            # 分组查询没有 batch 接口，逐条请求
+            with self.timer.stage("network"):
+                response = self.client.query_points_groups(
+                    collection_name=self.collection_name,
+                    query=[float(x) for x in vector],
+                    group_by=group_by,
+                    query_filter=query_filter,
+                    search_params=self.search_params,
+                    limit=k,
+                    group_size=group_size,
+                    with_payload=True
+                )
+            with self.timer.stage("score"):
+                results.append([hit for group in response.groups for hit in self._to_hits(group.hits)])
+        return results
+
+    def close(self):
+        self.client.close()
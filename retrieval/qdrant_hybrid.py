@@ -0,0 +1,125 @@
+import os
+from qdrant_client import QdrantClient, models
+from tqdm import tqdm
+
+from .base import BaseRetriever, Hit, point_id, doc_payload, PAYLOAD_VERSION
+from .encoders import BM25Encoder, encode_queries
+from .ingest import sync_collection, named_batch
+from .qdrant_bm25 import BM25_ENCODE_WORKERS
+
+QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+QDRANT_API_KEY = os.getenv("QDRANT_API_KEY", None)
+FUSIONS = {"rrf": models.Fusion.RRF, "dbsf": models.Fusion.DBSF}
+
+
+class QdrantHybridRetriever(BaseRetriever):
+    """
+    BM25 + dense retrieval from one collection with a "dense" and a "bm25"
+    named vector per point. A query prefetches prefetch_limit candidates from
+    each vector and Qdrant fuses them (RRF or DBSF) within the same
+    query_points call, so hybrid search costs one round-trip.
+    mode="dense" / "bm25" queries a single vector of the same collection.
+    """
+    name = "hybrid_qdrant"
+
+    def __init__(self, collection_name, encoder, url=QDRANT_URL, api_key=QDRANT_API_KEY, client=None,
+                 fusion="rrf", prefetch_limit=100, mode="hybrid", avg_len=256.0, batch_size=64,
+                 embed_workers=2, upload_workers=2, encode_workers=BM25_ENCODE_WORKERS, chunk_size=64):
+        if fusion not in FUSIONS:
+            raise ValueError(f"Unknown fusion {fusion}, choose from: {', '.join(FUSIONS)}")
+        self.collection_name = collection_name
+        self.encoder = encoder
+        self.client = client or QdrantClient(url=url, api_key=api_key, prefer_grpc=True)
+        self.fusion = fusion
+        self.prefetch_limit = prefetch_limit
+        self.mode = mode
+        self.avg_len = avg_len
+        self.bm25 = BM25Encoder(avg_len=avg_len)
+        self.batch_size = batch_size
+        self.embed_workers = embed_workers
+        self.upload_workers = upload_workers
+        self.encode_workers = encode_workers
+        self.chunk_size = chunk_size
+
+    def index(self, docs, reindex=False):
+        def create_collection():
+            self.client.create_collection(
+                collection_name=self.collection_name,
+                vectors_config={
+                    "dense": models.VectorParams(size=self.encoder.dim, distance=models.Distance.COSINE)
+                },
+                sparse_vectors_config={
+                    "bm25": models.SparseVectorParams(modifier=models.Modifier.IDF)
+                }
+            )
+
+        progress = tqdm(desc=f"Indexing {self.collection_name}")
+        bm25 = self.bm25
+        if self.encode_workers > 1:
+            bm25 = BM25Encoder(avg_len=self.avg_len, workers=self.encode_workers, chunk_size=self.chunk_size)
+
+        def encode(batch):
+            texts = [doc.text for _, doc in batch]
+            embeddings = {"dense": self.encoder.encode(texts), "bm25": bm25.encode(texts)}
+            progress.update(len(batch))
+            return embeddings
+
+        def make_batch(batch, embeddings):
+            return named_batch([point_id(doc_id) for doc_id, _ in batch], embeddings,
+                               [doc_payload(doc) for _, doc in batch])
+
+        model_name = getattr(self.encoder, "model_name", type(self.encoder).__name__)
+        try:
+            sync_collection(self.client, self.collection_name, ((doc.doc_id, doc) for doc in docs), create_collection,
+                            encode, make_batch=make_batch, reindex=reindex,
+                            config=f"hybrid:{model_name}:{self.encoder.dim}:cosine:Qdrant/bm25:{self.avg_len}:{PAYLOAD_VERSION}",
+                            batch_size=self.batch_size, embed_workers=max(self.embed_workers, self.encode_workers),
+                            upload_workers=self.upload_workers)
+        finally:
+            if bm25 is not self.bm25:
+                bm25.close()
+        progress.close()
+
+    def _request(self, dense_vector, sparse_vector, k):
+        dense_query = [float(x) for x in dense_vector] if dense_vector is not None else None
+        sparse_query = models.SparseVector(
+            values=sparse_vector.values.tolist(),
+            indices=sparse_vector.indices.tolist()
+        ) if sparse_vector is not None else None
+        if self.mode == "dense":
+            return models.QueryRequest(query=dense_query, using="dense", limit=k, with_payload=True)
+        if self.mode == "bm25":
+            return models.QueryRequest(query=sparse_query, using="bm25", limit=k, with_payload=True)
+        return models.QueryRequest(
+            prefetch=[
+                models.Prefetch(query=dense_query, using="dense", limit=max(k, self.prefetch_limit)),
+                models.Prefetch(query=sparse_query, using="bm25", limit=max(k, self.prefetch_limit))
+            ],
+            query=models.FusionQuery(fusion=FUSIONS[self.fusion]),
+            limit=k,
+            with_payload=True
+        )
+
+    def _to_hits(self, points):
+        return [Hit(point.payload["doc_id"], point.score, point.payload) for point in points]
+
+    def search(self, query, k=10):
+        return self.search_batch([query], k)[0]
+
+    def search_batch(self, queries, k=10):
+        queries = list(queries)
+        if not queries:
+            return []
+        # 两种向量各编码一次整批，融合在服务端完成，整批只需一次往返
+        with self.timer.stage("embed"):
+            dense_vectors = encode_queries(self.encoder, queries) if self.mode != "bm25" else [None] * len(queries)
+            sparse_vectors = self.bm25.encode_queries(queries) if self.mode != "dense" else [None] * len(queries)
+            requests = [self._request(d, s, k) for d, s in zip(dense_vectors, sparse_vectors)]
+        with self.timer.stage("network"):
+            responses = self.client.query_batch_points(collection_name=self.collection_name, requests=requests)
+        with self.timer.stage("score"):
+            return [self._to_hits(response.points) for response in responses]
+
+    def close(self):
+        self.bm25.close()
+        self.client.close()
@@ -0,0 +1,131 @@
+import os
+
+# backend 名称 -> 构造函数；各后端的依赖在构造时才 import，只用 ES 时不需要装 fastembed 等
+
+
+def _bm25_qdrant(dataset_name, **kwargs):
+    from .qdrant_bm25 import QdrantBM25Retriever
+    return QdrantBM25Retriever(collection_name=f"{dataset_name}_bm25", **kwargs)
+
+
+def _bge_m3_qdrant(dataset_name, **kwargs):
+    from .encoders import XinferenceEncoder
+    from .qdrant_dense import QdrantDenseRetriever
+    from .storage import storage_suffix
+    retriever = QdrantDenseRetriever(
+        collection_name=f"{dataset_name}_bge_m3" + storage_suffix(kwargs.get("storage", "memory")),
+        encoder=XinferenceEncoder(model="bge-m3"),
+        batch_size=256,
+        **kwargs
+    )
+    retriever.name = "bge_m3_qdrant"
+    return retriever
+
+
+def _minilm_qdrant(dataset_name, **kwargs):
+    from .encoders import SentenceTransformerEncoder
+    from .qdrant_dense import QdrantDenseRetriever
+    from .storage import storage_suffix
+    retriever = QdrantDenseRetriever(
+        collection_name=f"{dataset_name}_minilm_l6_v2" + storage_suffix(kwargs.get("storage", "memory")),
+        encoder=SentenceTransformerEncoder("all-MiniLM-L6-v2"),
+        **kwargs
+    )
+    retriever.name = "minilm_qdrant"
+    return retriever
+
+
+def _bge_m3_exact(dataset_name, **kwargs):
+    from .encoders import XinferenceEncoder
+    from .exact_dense import ExactDenseRetriever
+    retriever = ExactDenseRetriever(
+        encoder=XinferenceEncoder(model="bge-m3"),
+        index_path=os.path.join("data", f"exact_{dataset_name}", "bge_m3"),
+        **kwargs
+    )
+    retriever.name = "bge_m3_exact"
+    return retriever
+
+
+def _minilm_exact(dataset_name, **kwargs):
+    from .encoders import SentenceTransformerEncoder
+    from .exact_dense import ExactDenseRetriever
+    retriever = ExactDenseRetriever(
+        encoder=SentenceTransformerEncoder("all-MiniLM-L6-v2"),
+        index_path=os.path.join("data", f"exact_{dataset_name}", "minilm_l6_v2"),
+        **kwargs
+    )
+    retriever.name = "minilm_exact"
+    return retriever
+
+
+def _bge_m3_hybrid(name, **defaults):
+    # 同一个混合 collection 上的不同查询方式：RRF / DBSF 融合，或只用其中一种向量
+    def factory(dataset_name, **kwargs):
+        from .encoders import XinferenceEncoder
+        from .qdrant_hybrid import QdrantHybridRetriever
+        retriever = QdrantHybridRetriever(
+            collection_name=f"{dataset_name}_hybrid_bge_m3",
+            encoder=XinferenceEncoder(model="bge-m3"),
+            batch_size=256,
+            **{**defaults, **kwargs}
+        )
+        retriever.name = name
+        return retriever
+    return factory
+
+
+def _bge_m3_multi(name, **defaults):
+    # dense + sparse + ColBERT 同一个 collection：不同的候选来源，是否做 MaxSim rescore
+    def factory(dataset_name, **kwargs):
+        from .encoders import BGEM3Encoder
+        from .qdrant_bge_m3 import QdrantBGEM3Retriever
+        retriever = QdrantBGEM3Retriever(
+            collection_name=f"{dataset_name}_multi_bge_m3",
+            encoder=BGEM3Encoder(),
+            **{**defaults, **kwargs}
+        )
+        retriever.name = name
+        return retriever
+    return factory
+
+
+def _bm25_es(dataset_name, **kwargs):
+    from .es_bm25 import ESBM25Retriever
+    return ESBM25Retriever(index_name="bm25_es_" + dataset_name, **kwargs)
+
+
+def _bm25_tantivy(dataset_name, **kwargs):
+    from .tantivy_bm25 import TantivyBM25Retriever
+    return TantivyBM25Retriever(index_path=os.path.join("data", f"tantivy_{dataset_name}", "bm25.tantivy"), **kwargs)
+
+
+def _bm25_local(dataset_name, **kwargs):
+    from .local_bm25 import LocalBM25Retriever
+    return LocalBM25Retriever(**kwargs)
+
+
+BACKENDS = {
+    "bm25_qdrant": _bm25_qdrant,
+    "bge_m3_qdrant": _bge_m3_qdrant,
+    "minilm_qdrant": _minilm_qdrant,
+    "bge_m3_exact": _bge_m3_exact,
+    "minilm_exact": _minilm_exact,
+    "bge_m3_hybrid": _bge_m3_hybrid("bge_m3_hybrid", fusion="rrf"),
+    "bge_m3_hybrid_dbsf": _bge_m3_hybrid("bge_m3_hybrid_dbsf", fusion="dbsf"),
+    "bge_m3_hybrid_dense": _bge_m3_hybrid("bge_m3_hybrid_dense", mode="dense"),
+    "bge_m3_hybrid_bm25": _bge_m3_hybrid("bge_m3_hybrid_bm25", mode="bm25"),
+    "bge_m3_multi_dense": _bge_m3_multi("bge_m3_multi_dense", candidates="dense", rerank=False),
+    "bge_m3_multi_sparse": _bge_m3_multi("bge_m3_multi_sparse", candidates="sparse", rerank=False),
+    "bge_m3_multi_colbert": _bge_m3_multi("bge_m3_multi_colbert", candidates="dense"),
+    "bge_m3_multi_hybrid_colbert": _bge_m3_multi("bge_m3_multi_hybrid_colbert", candidates="hybrid"),
+    "bm25_es": _bm25_es,
+    "bm25_tantivy": _bm25_tantivy,
+    "bm25_local": _bm25_local,
+}
+
+
+def create_retriever(backend, dataset_name, **kwargs):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend}, choose from: {', '.join(BACKENDS)}")
+    return BACKENDS[backend](dataset_name.replace("/", "_"), **kwargs)
@@ -0,0 +1,66 @@
+import os
+
+from .base import BaseRetriever, Hit
+
+RERANK_TOP_N = int(os.getenv("RERANK_TOP_N", "50"))
+
+
+class RerankRetriever(BaseRetriever):
+    """
+    Cross-encoder second stage over any retriever: take its top_n candidates,
+    score the (query, passage) pairs with the reranker and put them in
+    relevance order. With top_n < k the remaining first-stage hits follow in
+    their original order, scored just below the last reranked hit, so k
+    results always come back. Passage text is the "text" field of the hit
+    payload; for backends that return bare doc ids (bm25_local, dense_exact)
+    it is fetched from docs_store, any object with get_many(doc_ids) ->
+    {doc_id: doc} such as LocalDataset.docs_store() or ir_datasets'.
+    """
+    def __init__(self, retriever, reranker=None, top_n=RERANK_TOP_N, docs_store=None):
+        if reranker is None:
+            from utils.rerank_client import get_reranker
+            reranker = get_reranker()
+        self.retriever = retriever
+        self.reranker = reranker
+        self.top_n = top_n
+        self.name = f"{retriever.name}+rerank@{top_n}"
+        self.docs_store = docs_store
+
+    def index(self, docs, reindex=False):
+        self.retriever.index(docs, reindex=reindex)
+
+    def _texts(self, candidates):
+        # payload 里没有正文的命中按 doc_id 从 docs_store 一次批量取回，不在内存里常驻全部文档
+        missing = {hit.doc_id for hits in candidates for hit in hits if hit.payload.get("text") is None}
+        found = {}
+        if missing:
+            if self.docs_store is None:
+                raise ValueError(f"{self.retriever.name} returns hits without payload text, pass docs_store to rerank")
+            found = {doc_id: doc.text for doc_id, doc in self.docs_store.get_many(missing).items()}
+        return [
+            [hit.payload["text"] if hit.payload.get("text") is not None else found.get(hit.doc_id, "") for hit in hits]
+            for hits in candidates
+        ]
+
+    def search(self, query, k=10):
+        return self.search_batch([query], k)[0]
+
+    def search_batch(self, queries, k=10):
+        queries = list(queries)
+        candidates = self.retriever.search_batch(queries, max(k, self.top_n))
+        with self.timer.stage("rerank"):
+            texts = self._texts([hits[:self.top_n] for hits in candidates])
+            scores = self.reranker.score_batch(list(zip(queries, texts)))
+            results = []
+            for hits, hit_scores in zip(candidates, scores):
+                order = sorted(range(len(hit_scores)), key=lambda i: -hit_scores[i])[:k]
+                result = [Hit(hits[i].doc_id, float(hit_scores[i]), hits[i].payload) for i in order]
+                # top_n < k：未参与 rerank 的一阶段结果按原顺序接在后面，分数排在最后一个 rerank 结果之下
+                floor = result[-1].score if result else 0.0
+                for rank, hit in enumerate(hits[len(hit_scores):k], 1):
+                    result.append(Hit(hit.doc_id, floor - rank, hit.payload))
+                results.append(result)
+            return results
+
+    def close(self):
+        self.retriever.close()
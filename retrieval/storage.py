@@ -0,0 +1,111 @@
+import os
+
+import requests
+from qdrant_client import models
+
+# 稠密向量 collection 的存储方案：原始向量放内存还是磁盘（mmap）、是否加 int8 / binary 量化、
+# payload 是否落盘。量化向量常驻内存，原始向量放磁盘只在 rescore 时读取
+STORAGE_PROFILES = {
+    "memory": {},
+    "on_disk": {"on_disk": True},
+    "on_disk_payload": {"on_disk_payload": True},
+    "int8": {"on_disk": True, "quantization": "int8"},
+    "binary": {"on_disk": True, "quantization": "binary"},
+}
+# 二值量化损失大，rescore 前多取几倍候选
+OVERSAMPLING = {"int8": 1.0, "binary": 3.0}
+QDRANT_STORAGE = os.getenv("QDRANT_STORAGE", "memory")
+
+
+def storage_profile(name):
+    """
+    Resolve a profile name; profiles can be combined with "+", e.g.
+    "int8+on_disk_payload".
+    """
+    profile = {}
+    for part in name.split("+"):
+        if part not in STORAGE_PROFILES:
+            raise ValueError(f"Unknown storage profile {part}, choose from: {', '.join(STORAGE_PROFILES)}")
+        profile.update(STORAGE_PROFILES[part])
+    return profile
+
+
+def storage_suffix(name):
+    # 默认方案沿用原来的 collection 名，其它方案各建一个 collection，便于并排比较
+    return "" if name == "memory" else "_" + name.replace("+", "_")
+
+
+def collection_kwargs(size, distance, name="memory"):
+    """
+    create_collection keyword arguments (vectors_config, quantization_config,
+    on_disk_payload) for a single unnamed dense vector under a profile.
+    """
+    profile = storage_profile(name)
+    quantization = None
+    if profile.get("quantization") == "int8":
+        quantization = models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+    elif profile.get("quantization") == "binary":
+        quantization = models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True))
+    return {
+        "vectors_config": models.VectorParams(size=size, distance=distance, on_disk=profile.get("on_disk")),
+        "quantization_config": quantization,
+        "on_disk_payload": profile.get("on_disk_payload")
+    }
+
+
+def search_params(name="memory", hnsw_ef=None, exact=False):
+    """
+    models.SearchParams for a profile: quantized profiles search the quantized
+    vectors and rescore an oversampled candidate set with the originals.
+    """
+    quantization = storage_profile(name).get("quantization")
+    if quantization is None and hnsw_ef is None and not exact:
+        return None
+    return models.SearchParams(
+        hnsw_ef=hnsw_ef,
+        exact=exact,
+        quantization=(
+            models.QuantizationSearchParams(rescore=True, oversampling=OVERSAMPLING[quantization])
+            if quantization else None
+        )
+    )
+
+
+def estimate_ram_bytes(num_vectors, dim, name="memory", m=16):
+    """
+    Rough resident size of the vector data of a collection: original float32
+    vectors unless on disk, quantized vectors, and the HNSW links (2m per
+    point on level 0, 4-byte ids). Payload is not included.
+    """
+    profile = storage_profile(name)
+    total = 0 if profile.get("on_disk") else num_vectors * dim * 4
+    if profile.get("quantization") == "int8":
+        total += num_vectors * dim
+    elif profile.get("quantization") == "binary":
+        total += num_vectors * ((dim + 7) // 8)
+    return total + num_vectors * 2 * m * 4
+
+
+def collection_footprint(collection_name, url, api_key=None, timeout=30):
+    """
+    RAM and disk usage of a collection summed over its local segments, from
+    Qdrant's /telemetry endpoint. Returns {"ram_bytes", "disk_bytes"} or None
+    if the server does not report segment details.
+    """
+    headers = {"api-key": api_key} if api_key else {}
+    resp = requests.get(f"{url.rstrip('/')}/telemetry", params={"details_level": 10}, headers=headers, timeout=timeout)
+    resp.raise_for_status()
+    collections = resp.json()["result"].get("collections", {}).get("collections") or []
+    for collection in collections:
+        if collection.get("id") != collection_name:
+            continue
+        footprint = {"ram_bytes": 0, "disk_bytes": 0}
+        for replica_set in collection.get("shards") or []:
+            for segment in (replica_set.get("local") or {}).get("segments") or []:
+                info = segment.get("info", {})
+                footprint["ram_bytes"] += info.get("ram_usage_bytes", 0)
+                footprint["disk_bytes"] += info.get("disk_usage_bytes", 0)
+        return footprint
+    return None
@@ -0,0 +1,79 @@
+import os
+import re
+import shutil
+import tantivy
+from tqdm import tqdm
+
+from utils.index_manifest import IndexManifest, content_hash, plan_sync
+from .base import BaseRetriever, Hit
+
+
+def sanitize_query_for_tantivy(query):
+    # escape special characters including apostrophes
+    return re.sub(r'([+\-!(){}\[\]^"~*?:\\<\'])', r' ', query)
+
+
+class TantivyBM25Retriever(BaseRetriever):
+    """
+    BM25 over an on-disk Tantivy index using the en_stem tokenizer.
+    """
+    name = "bm25_tantivy"
+
+    def __init__(self, index_path, tokenizer_name="en_stem"):
+        self.index_path = index_path
+        schema_builder = tantivy.SchemaBuilder()
+        schema_builder.add_text_field("body", stored=True, tokenizer_name=tokenizer_name)
+        # doc_id 用 raw 分词器整体索引，增量同步时按 term 删除
+        schema_builder.add_text_field("doc_id", stored=True, tokenizer_name="raw")
+        self.schema = schema_builder.build()
+        self.tokenizer_name = tokenizer_name
+        self._index = None
+        self._searcher = None
+
+    def _open(self):
+        if self._index is None:
+            self._index = tantivy.Index(self.schema, path=self.index_path)
+            self._searcher = self._index.searcher()
+
+    def index(self, docs, reindex=False):
+        exists = os.path.exists(self.index_path)
+        if exists and not reindex:
+            return
+        docs = list({str(doc.doc_id): doc for doc in docs}.values())
+        manifest = IndexManifest("tantivy", os.path.abspath(self.index_path), config=f"bm25:{self.tokenizer_name}:raw_doc_id")
+        hashes = {str(doc.doc_id): content_hash(doc) for doc in docs}
+        full, changed, removed = plan_sync(manifest, hashes, exists)
+        if full:
+            if exists:
+                shutil.rmtree(self.index_path)
+            os.makedirs(self.index_path, exist_ok=True)
+        index = tantivy.Index(self.schema, path=self.index_path)
+        writer = index.writer()
+        changed = set(changed)
+        for doc_id in removed:
+            writer.delete_documents("doc_id", doc_id)
+        for doc in tqdm(docs, desc="Indexing documents"):
+            doc_id = str(doc.doc_id)
+            if doc_id not in changed:
+                continue
+            if not full:
+                # 内容变化的文档先按 doc_id 删除旧版本
+                writer.delete_documents("doc_id", doc_id)
+            writer.add_document(tantivy.Document(body=doc.text, doc_id=doc_id))
+        writer.commit()
+        writer.wait_merging_threads()
+        manifest.save(hashes)
+        print(f"{self.index_path}: {'rebuilt' if full else 'synced'}, {len(changed)} upserted, {len(removed)} deleted")
+        self._index = None
+
+    def search(self, query, k=10):
+        self._open()
+        # 进程内检索，没有网络往返：分词解析记为 embed，检索和取文档记为 score
+        with self.timer.stage("embed"):
+            parsed = self._index.parse_query(sanitize_query_for_tantivy(query), ["body"])
+        with self.timer.stage("score"):
+            hits = []
+            for score, doc_address in self._searcher.search(parsed, k).hits:
+                doc = self._searcher.doc(doc_address)
+                hits.append(Hit(doc["doc_id"][0], score, {"doc_id": doc["doc_id"][0], "text": doc["body"][0]}))
+        return hits
@@ -0,0 +1,18 @@
+import pytest
+
+import utils.ir_metrics as ir_metrics
+
+
+def test_duplicate_hits_count_once():
+    results = ir_metrics.evaluate({"q1": ["a", "a", "b"]}, {"q1": ["a"]}, cutoffs=(1, 2))
+    assert results["Recall@2"] == pytest.approx(1.0)
+    assert results["Precision@2"] == pytest.approx(0.5)
+    assert results["MAP@2"] == pytest.approx(1.0)
+    assert results["nDCG@2"] == pytest.approx(1.0)
+
+
+def test_duplicate_moves_later_docs_up():
+    # ["b", "b", "a"] 去重后为 ["b", "a"]，a 位于第 2 名
+    results = ir_metrics.evaluate({"q1": ["b", "b", "a"]}, {"q1": ["a"]}, cutoffs=(2,))
+    assert results["Recall@2"] == pytest.approx(1.0)
+    assert results["MRR@2"] == pytest.approx(0.5)
@@ -0,0 +1,119 @@
+import json
+
+import numpy as np
+import pytest
+from qdrant_client import QdrantClient
+
+import utils.ir_local_cache as ir_local_cache
+import utils.index_manifest as index_manifest
+import utils.ir_local_datasets as ir_local_datasets
+from retrieval.es_bm25 import ESBM25Retriever
+from retrieval.exact_dense import ExactDenseRetriever
+from retrieval.local_bm25 import LocalBM25Retriever
+from retrieval.qdrant_dense import QdrantDenseRetriever
+from retrieval.rerank import RerankRetriever
+
+# 每类后端各跑一遍 rerank：payload 带 text（Qdrant）、正文在 content 字段（ES）、
+# 只返回 doc_id 需要 docs_store 取正文（bm25_local / dense_exact）
+DOCS = [
+    {"doc_id": "r1_0_0", "text": "apple banana"},
+    {"doc_id": "r1_0_1", "text": "apple apple banana cherry"},
+    {"doc_id": "r2_0_0", "text": "banana cherry"},
+    {"doc_id": "r3_0_0", "text": "durian"},
+]
+
+
+class LengthReranker:
+    # 文本越长分数越高，结果顺序与一阶段不同，便于确认 rerank 真正生效
+    def score_batch(self, items):
+        return [np.array([len(passage) for passage in passages], dtype=np.float32) for _, passages in items]
+
+
+class HashEncoder:
+    dim = 8
+    model_name = "hash"
+
+    def encode(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            for token in text.split():
+                vectors[i, sum(map(ord, token)) % self.dim] += 1.0
+        return vectors
+
+
+@pytest.fixture
+def dataset(tmp_path, monkeypatch):
+    monkeypatch.setattr(ir_local_cache, "CACHE_ROOT", str(tmp_path / "cache"))
+    monkeypatch.setattr(index_manifest, "MANIFEST_ROOT", str(tmp_path / "manifests"))
+    path = tmp_path / "dataset"
+    path.mkdir()
+    (path / "metadata.yaml").write_text(
+        "dataset: rerank_test\nfiles:\n  documents:\n    path: docs.jsonl\n", encoding="utf-8"
+    )
+    (path / "docs.jsonl").write_text("\n".join(json.dumps(doc) for doc in DOCS) + "\n", encoding="utf-8")
+    ds = ir_local_datasets.load(str(path), lazy=True)
+    return list(ds.docs_iter()), ds.docs_store()
+
+
+def check_reranked(retriever, docs, docs_store):
+    reranker = RerankRetriever(retriever, LengthReranker(), top_n=2, docs_store=docs_store)
+    reranker.index(docs)
+    hits = reranker.search("apple banana cherry", k=3)
+    texts = {doc.doc_id: doc.text for doc in docs}
+    assert len(hits) == 3
+    # 前 top_n 个按文本长度重排，分数就是文本长度
+    assert [hit.score for hit in hits[:2]] == [float(len(texts[hit.doc_id])) for hit in hits[:2]]
+    assert hits[0].score >= hits[1].score > hits[2].score
+    return hits
+
+
+def test_rerank_payload_backend(dataset):
+    docs, _ = dataset
+    retriever = QdrantDenseRetriever("rerank_test", HashEncoder(), client=QdrantClient(location=":memory:"),
+                                     filter_fields=())
+    check_reranked(retriever, docs, docs_store=None)
+
+
+def test_rerank_local_bm25(dataset):
+    docs, docs_store = dataset
+    check_reranked(LocalBM25Retriever(), docs, docs_store)
+
+
+def test_rerank_exact_dense(dataset):
+    docs, docs_store = dataset
+    check_reranked(ExactDenseRetriever(HashEncoder()), docs, docs_store)
+
+
+def test_rerank_without_text_needs_docs_store(dataset):
+    docs, _ = dataset
+    reranker = RerankRetriever(LocalBM25Retriever(), LengthReranker(), top_n=2)
+    reranker.index(docs)
+    with pytest.raises(ValueError):
+        reranker.search("apple", k=2)
+
+
+class FakeES:
+    # 只模拟 msearch 的返回格式，按 content 中命中的词数打分
+    def __init__(self, docs):
+        self.docs = docs
+
+    def msearch(self, body):
+        responses = []
+        for query in body[1::2]:
+            terms = query["query"]["match"]["content"]["query"].split()
+            scored = [(sum(doc.text.split().count(t) for t in terms), doc) for doc in self.docs]
+            scored = sorted((item for item in scored if item[0] > 0), key=lambda item: -item[0])[:query["size"]]
+            responses.append({"hits": {"hits": [
+                {"_score": float(score), "_source": {"content": doc.text, "doc_id": doc.doc_id}}
+                for score, doc in scored
+            ]}})
+        return {"responses": responses}
+
+
+def test_rerank_es(dataset):
+    docs, _ = dataset
+    retriever = ESBM25Retriever("rerank_test")
+    retriever.es = FakeES(docs)
+    retriever.index = lambda docs, reindex=False: None
+    hits = check_reranked(retriever, docs, docs_store=None)
+    assert all(hit.payload["text"] == hit.payload["content"] for hit in hits)
@@ -0,0 +1,160 @@
+import os
+import re
+import json
+import hashlib
+import threading
+
+import numpy as np
+
+from .ir_local_cache import CACHE_ROOT
+
+try:
+    import fcntl
+except ImportError:  # Windows: 只做进程内加锁
+    fcntl = None
+
+# 按 (model, 文本哈希) 缓存向量：vectors.bin 是按行追加的 float16/float32 矩阵（mmap 读取），
+# keys.bin 是同序的 16 字节 blake2b 摘要，第 i 个摘要对应矩阵第 i 行
+EMBEDDING_CACHE_ROOT = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(CACHE_ROOT, "embeddings"))
+KEY_SIZE = 16
+META_FILE = "meta.json"
+KEYS_FILE = "keys.bin"
+VECTORS_FILE = "vectors.bin"
+LOCK_FILE = "lock"
+
+
+def text_key(text):
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=KEY_SIZE).digest()
+
+
+class EmbeddingCache:
+    """
+    Persistent content-addressed embedding cache for one model. Rows are only
+    ever appended, so several processes can share a cache directory; appends
+    are serialized with a file lock and readers pick up new rows on a miss.
+    """
+    def __init__(self, model, dtype="float32", cache_dir=None):
+        self.model = model
+        self.cache_dir = cache_dir or os.path.join(EMBEDDING_CACHE_ROOT, re.sub(r"[^\w.-]+", "_", model))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.dtype = np.dtype(dtype)
+        self.dim = None
+        meta_path = os.path.join(self.cache_dir, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            # 已有缓存以落盘时的 dtype 为准
+            self.dtype = np.dtype(meta["dtype"])
+            self.dim = meta["dim"]
+        self._rows = {}
+        self._matrix = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._refresh()
+
+    def _path(self, name):
+        return os.path.join(self.cache_dir, name)
+
+    def _row_bytes(self):
+        return self.dim * self.dtype.itemsize
+
+    def _committed_rows(self):
+        # keys 在向量之后写入，因此 keys.bin 的行数就是完整写入的行数
+        try:
+            return os.path.getsize(self._path(KEYS_FILE)) // KEY_SIZE
+        except FileNotFoundError:
+            return 0
+
+    def _refresh(self):
+        committed = self._committed_rows()
+        known = len(self._rows)
+        if committed <= known:
+            return
+        if self.dim is None:
+            with open(self._path(META_FILE), "r", encoding="utf-8") as f:
+                self.dim = json.load(f)["dim"]
+        with open(self._path(KEYS_FILE), "rb") as f:
+            f.seek(known * KEY_SIZE)
+            data = f.read((committed - known) * KEY_SIZE)
+        for row in range(committed - known):
+            self._rows.setdefault(data[row * KEY_SIZE:(row + 1) * KEY_SIZE], known + row)
+        self._matrix = None
+
+    def _vectors(self):
+        if self._matrix is None or len(self._matrix) < len(self._rows):
+            rows = self._committed_rows()
+            self._matrix = np.memmap(self._path(VECTORS_FILE), dtype=self.dtype, mode="r", shape=(rows, self.dim))
+        return self._matrix
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __contains__(self, text):
+        return text_key(text) in self._rows
+
+    def missing(self, texts):
+        """
+        Unique texts (in first-seen order) that are not cached yet.
+        """
+        with self._lock:
+            keys = {text_key(text): text for text in texts}
+            if any(key not in self._rows for key in keys):
+                self._refresh()
+            missing = [text for key, text in keys.items() if key not in self._rows]
+            self.misses += len(missing)
+            self.hits += len(keys) - len(missing)
+            return missing
+
+    def put(self, texts, vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(texts) == 0:
+            return
+        with self._lock, open(self._path(LOCK_FILE), "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                if self.dim is None:
+                    self.dim = int(vectors.shape[1])
+                    with open(self._path(META_FILE), "w", encoding="utf-8") as f:
+                        json.dump({"model": self.model, "dim": self.dim, "dtype": self.dtype.name}, f)
+                elif vectors.shape[1] != self.dim:
+                    raise ValueError(f"Embedding dim {vectors.shape[1]} does not match cache dim {self.dim} for {self.model}")
+                self._refresh()
+                keys = [text_key(text) for text in texts]
+                new = [i for i, key in enumerate(keys) if key not in self._rows]
+                if not new:
+                    return
+                start = self._committed_rows()
+                with open(self._path(VECTORS_FILE), "ab") as f:
+                    # 丢掉上次中途退出残留的、没有对应 key 的向量行
+                    f.truncate(start * self._row_bytes())
+                    f.write(vectors[new].astype(self.dtype).tobytes())
+                with open(self._path(KEYS_FILE), "ab") as f:
+                    f.write(b"".join(keys[i] for i in new))
+                for offset, i in enumerate(new):
+                    self._rows[keys[i]] = start + offset
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def get(self, texts):
+        """
+        float32 matrix of shape (len(texts), dim); every text must be cached.
+        """
+        with self._lock:
+            rows = [self._rows[text_key(text)] for text in texts]
+            return np.asarray(self._vectors()[rows], dtype=np.float32)
+
+    def embed(self, texts, encode):
+        """
+        Return the vectors of texts, calling encode(list_of_texts) only for the
+        ones not cached yet and storing its output.
+        """
+        texts = list(texts)
+        missing = self.missing(texts)
+        if missing:
+            self.put(missing, encode(missing))
+        if not texts:
+            return np.zeros((0, self.dim or 0), dtype=np.float32)
+        return self.get(texts)
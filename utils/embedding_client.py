@@ -0,0 +1,188 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from .embedding_cache import EmbeddingCache
+
+# xinference 的 OpenAI 兼容 /v1/embeddings 接口（bge-m3）
+XINFERENCE_URL = os.getenv("XINFERENCE_URL", "http://localhost:9998/v1/embeddings")
+XINFERENCE_API_KEY = os.getenv("XINFERENCE_API_KEY", "sk-72tkvudyGLPMi")
+
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+# 设为 0 关闭磁盘 embedding 缓存（文档）
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "1") != "0"
+# query 默认不走缓存：benchmark / 压测里 embed 阶段要测的是模型延迟而不是读缓存，设为 1 打开
+QUERY_EMBEDDING_CACHE = os.getenv("QUERY_EMBEDDING_CACHE", "0") != "0"
+
+
+def estimate_tokens(text):
+    # 不加载 tokenizer 的粗略估计：CJK 字符按 1 个 token，其余按 4 个字符 1 个 token
+    cjk = sum(1 for ch in text if "\u3400" <= ch <= "\u9fff" or "\uf900" <= ch <= "\ufaff")
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+class EmbeddingClient:
+    """
+    Shared client for the embedding endpoint.
+
+    - one requests.Session, so connections are kept alive and pooled
+    - texts are packed into micro-batches of at most max_batch_size texts and
+      max_batch_tokens estimated tokens; similar lengths are batched together
+      and the token estimate is calibrated from the server's reported usage
+    - at most max_concurrency requests are in flight across all callers
+    - timeouts, connection errors, 429 and 5xx are retried with exponential
+      backoff; a 413 splits the batch in half
+    - with cache=True (or an EmbeddingCache) only texts missing from the
+      on-disk cache are sent to the server; embed(texts, cache=False) skips
+      it for one call, which query paths do unless QUERY_EMBEDDING_CACHE=1
+    embed() is the blocking API, aembed() the asyncio one; both return the
+    vectors in input order.
+    """
+    def __init__(self, model="bge-m3", url=XINFERENCE_URL, api_key=XINFERENCE_API_KEY, max_batch_size=32,
+                 max_batch_tokens=8192, max_concurrency=4, timeout=60.0, max_retries=4, backoff=0.5, cache=False):
+        self.model = model
+        if cache is True:
+            cache = EmbeddingCache(model)
+        self.cache = cache if isinstance(cache, EmbeddingCache) else None
+        self.url = url
+        self.max_batch_size = max_batch_size
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+        # 实际 token 数 / 估计 token 数，用服务端返回的 usage 做滑动平均
+        self._token_ratio = 1.0
+
+    def _plan_batches(self, texts):
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = []
+        batch, batch_tokens = [], 0
+        for i in order:
+            tokens = estimate_tokens(texts[i]) * self._token_ratio
+            if batch and (len(batch) >= self.max_batch_size or batch_tokens + tokens > self.max_batch_tokens):
+                batches.append(batch)
+                batch, batch_tokens = [], 0
+            batch.append(i)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _calibrate(self, texts, usage):
+        actual = (usage or {}).get("prompt_tokens") or (usage or {}).get("total_tokens")
+        if not actual:
+            return
+        estimated = sum(estimate_tokens(text) for text in texts)
+        self._token_ratio = 0.8 * self._token_ratio + 0.2 * (actual / estimated)
+
+    def _post(self, texts):
+        data = {"model": self.model, "input": texts}
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._slots:
+                    resp = self.session.post(self.url, json=data, timeout=self.timeout)
+                if resp.status_code == 413 and len(texts) > 1:
+                    # 请求过大：拆成两半分别发送
+                    half = len(texts) // 2
+                    return self._post(texts[:half]) + self._post(texts[half:])
+                if resp.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    resp.raise_for_status()
+                    body = resp.json()
+                    self._calibrate(texts, body.get("usage"))
+                    data_items = sorted(body["data"], key=lambda item: item.get("index", 0))
+                    return [item["embedding"] for item in data_items]
+                reason = f"HTTP {resp.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                reason = type(e).__name__
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            print(f"Embedding request failed ({reason}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def _assemble(self, texts, batches, results):
+        embeddings = [None] * len(texts)
+        for batch, vectors in zip(batches, results):
+            for i, vector in zip(batch, vectors):
+                embeddings[i] = vector
+        return embeddings
+
+    def embed(self, texts: List[str], cache=True) -> List[List[float]]:
+        texts = list(texts)
+        if cache and self.cache is not None:
+            return self.cache.embed(texts, self._embed).tolist()
+        return self._embed(texts)
+
+    async def aembed(self, texts: List[str], cache=True) -> List[List[float]]:
+        texts = list(texts)
+        if not cache or self.cache is None:
+            return await self._aembed(texts)
+        missing = self.cache.missing(texts)
+        if missing:
+            self.cache.put(missing, await self._aembed(missing))
+        return self.cache.get(texts).tolist() if texts else []
+
+    def _embed(self, texts):
+        if not texts:
+            return []
+        batches = self._plan_batches(texts)
+        if len(batches) == 1:
+            results = [self._post([texts[i] for i in batches[0]])]
+        else:
+            results = list(self._executor.map(lambda batch: self._post([texts[i] for i in batch]), batches))
+        return self._assemble(texts, batches, results)
+
+    async def _aembed(self, texts):
+        if not texts:
+            return []
+        loop = asyncio.get_running_loop()
+        batches = self._plan_batches(texts)
+        results = await asyncio.gather(*(
+            loop.run_in_executor(self._executor, self._post, [texts[i] for i in batch])
+            for batch in batches
+        ))
+        return self._assemble(texts, batches, results)
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(model="bge-m3", **kwargs):
+    """
+    Process-wide client per (model, url), so every caller shares one pool and
+    one embedding cache (enabled unless EMBEDDING_CACHE=0; queries bypass it
+    unless QUERY_EMBEDDING_CACHE=1).
+    """
+    key = (model, kwargs.get("url", XINFERENCE_URL))
+    kwargs.setdefault("cache", EMBEDDING_CACHE)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = EmbeddingClient(model=model, **kwargs)
+        return _clients[key]
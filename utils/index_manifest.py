@@ -0,0 +1,95 @@
+import os
+import re
+import json
+import hashlib
+
+from .ir_local_cache import CACHE_ROOT
+
+# 每个索引（Qdrant collection / ES index / Tantivy 目录）一份 doc_id -> 内容哈希 的清单，
+# reindex 时据此只写入新增或变化的文档、删除已移除的文档
+MANIFEST_ROOT = os.getenv("INDEX_MANIFEST_DIR", os.path.join(CACHE_ROOT, "index_manifests"))
+MANIFEST_VERSION = 1
+
+
+def content_hash(value):
+    """
+    Stable hash of what gets indexed for one document: a text, a dict such as
+    {"text": ..., "metadata_fields": ...}, or a Document-like object. All three
+    forms of the same text and metadata hash alike, so eval scripts (dicts /
+    texts) and retrievers (Documents) can sync the same index.
+    """
+    # 统一成 [text, metadata_fields or None]，空 metadata 与没有 metadata 视为相同
+    if hasattr(value, "text"):
+        value = [value.text, getattr(value, "metadata_fields", None) or None]
+    elif isinstance(value, dict) and "text" in value:
+        value = [value["text"], value.get("metadata_fields") or None]
+    elif isinstance(value, str):
+        value = [value, None]
+    data = json.dumps(value, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def corpus_hash(items, hash_item=content_hash):
+    """
+    One hash of a whole corpus items = [(doc_id, item), ...] in order, for
+    indexes that can only be rebuilt as a whole (e.g. an exact-search matrix).
+    """
+    h = hashlib.blake2b(digest_size=16)
+    for doc_id, item in items:
+        h.update(json.dumps([doc_id, hash_item(item)], ensure_ascii=False).encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()
+
+
+class IndexManifest:
+    """
+    On-disk doc_id -> content hash map of one backend index. config describes
+    everything else that shapes the index (model, analyzer, vector params); a
+    manifest written under a different config is ignored.
+    """
+    def __init__(self, backend, index_name, config=None):
+        self.backend = backend
+        self.index_name = index_name
+        self.config = config
+        self.path = os.path.join(MANIFEST_ROOT, backend, re.sub(r"[^\w.-]+", "_", index_name) + ".json")
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("config") != self.config:
+            return None
+        # 以 [doc_id, hash] 对保存，保留 doc_id 原本的 int / str 类型
+        return {doc_id: h for doc_id, h in manifest["docs"]}
+
+    def save(self, hashes):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": MANIFEST_VERSION, "config": self.config, "docs": list(hashes.items())}, f,
+                      ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def delete(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def plan_sync(manifest, hashes, exists, indexed_count=None):
+    """
+    Compare the current {doc_id: hash} with the manifest of an index. Returns
+    (full, changed_ids, removed_ids); full=True means the index has to be
+    rebuilt from scratch because there is no usable manifest for it (index
+    missing, manifest missing / written under another config, or the index
+    holds a different number of docs than the manifest says).
+    """
+    old = manifest.load() if exists else None
+    if old is not None and indexed_count is not None and indexed_count != len(old):
+        old = None
+    if old is None:
+        return True, list(hashes), []
+    changed = [doc_id for doc_id, h in hashes.items() if old.get(doc_id) != h]
+    removed = [doc_id for doc_id in old if doc_id not in hashes]
+    return False, changed, removed
@@ -0,0 +1,303 @@
+import os
+import json
+import mmap
+import shutil
+import struct
+import hashlib
+from array import array
+
+# 本地 IR 数据集的列式二进制缓存：每一列由 offsets(uint64) + blob 两个文件组成，
+# 之后的加载直接 mmap，不再逐行 json.loads
+CACHE_VERSION = 1
+CACHE_ROOT = os.getenv(
+    "IR_LOCAL_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "ir_local_datasets")
+)
+MANIFEST_FILE = "manifest.json"
+
+# column kinds: "str" 直接存 UTF-8，"json" 存 json.dumps 后的 UTF-8（保留 None/int/list 等类型）
+STR = "str"
+JSON = "json"
+
+
+def dataset_cache_dir(dataset_path, kind="columns"):
+    key = hashlib.md5(os.path.abspath(dataset_path).encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_ROOT, key, kind)
+
+
+def source_signature(paths):
+    """
+    Build the cache key for a set of source files: path, size and mtime of each.
+    Missing files are recorded as None so that creating them invalidates the cache.
+    """
+    signature = {}
+    for name, path in paths.items():
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature[name] = {
+                "path": os.path.abspath(path),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns
+            }
+        else:
+            signature[name] = None
+    return signature
+
+
+def _encode(value, kind):
+    if kind == STR:
+        return value.encode("utf-8")
+    return json.dumps(value, ensure_ascii=False).encode("utf-8")
+
+
+def _decode(raw, kind):
+    if kind == STR:
+        return str(raw, "utf-8")
+    return json.loads(str(raw, "utf-8"))
+
+
+def write_table(cache_dir, table_name, columns, rows):
+    """
+    Write rows (tuples matching columns=[(name, kind), ...]) as one offsets/blob
+    file pair per column. Returns the number of rows written.
+    """
+    blobs = []
+    offsets = []
+    for column_name, _ in columns:
+        blobs.append(open(os.path.join(cache_dir, f"{table_name}.{column_name}.blob"), "wb"))
+        offsets.append(array("Q", [0]))
+    try:
+        count = 0
+        for row in rows:
+            for i, (_, kind) in enumerate(columns):
+                raw = _encode(row[i], kind)
+                blobs[i].write(raw)
+                offsets[i].append(offsets[i][-1] + len(raw))
+            count += 1
+    finally:
+        for blob in blobs:
+            blob.close()
+    for (column_name, _), column_offsets in zip(columns, offsets):
+        with open(os.path.join(cache_dir, f"{table_name}.{column_name}.offsets"), "wb") as f:
+            column_offsets.tofile(f)
+    return count
+
+
+def _map_file(path):
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class MappedColumn:
+    def __init__(self, cache_dir, table_name, column_name, kind):
+        self.kind = kind
+        self._offsets_map = _map_file(os.path.join(cache_dir, f"{table_name}.{column_name}.offsets"))
+        self._offsets = memoryview(self._offsets_map).cast("Q")
+        self._blob = _map_file(os.path.join(cache_dir, f"{table_name}.{column_name}.blob"))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, index):
+        return _decode(self._blob[self._offsets[index]:self._offsets[index + 1]], self.kind)
+
+
+class MappedTable:
+    """
+    Read-only, memory-mapped view of a table written by write_table().
+    Rows are decoded on access and passed through row_factory(*values).
+    """
+    def __init__(self, cache_dir, table_name, columns, num_rows, row_factory=tuple):
+        self.columns = [MappedColumn(cache_dir, table_name, name, kind) for name, kind in columns]
+        self.num_rows = num_rows
+        self.row_factory = row_factory
+
+    def __len__(self):
+        return self.num_rows
+
+    def _row(self, index):
+        return self.row_factory(*[column[index] for column in self.columns])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._row(i) for i in range(*index.indices(self.num_rows))]
+        if index < 0:
+            index += self.num_rows
+        if not 0 <= index < self.num_rows:
+            raise IndexError("table index out of range")
+        return self._row(index)
+
+    def __iter__(self):
+        for i in range(self.num_rows):
+            yield self._row(i)
+
+
+def load_manifest(cache_dir):
+    manifest_path = os.path.join(cache_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _make_tmp_dir(cache_dir):
+    tmp_dir = f"{cache_dir}.tmp{os.getpid()}"
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    return tmp_dir
+
+
+def _replace_dir(tmp_dir, cache_dir):
+    if os.path.exists(cache_dir):
+        shutil.rmtree(cache_dir)
+    os.rename(tmp_dir, cache_dir)
+
+
+def is_fresh(manifest, signature):
+    return (
+        manifest is not None
+        and manifest.get("version") == CACHE_VERSION
+        and manifest.get("signature") == signature
+    )
+
+
+def build_cache(cache_dir, signature, tables):
+    """
+    Build the cache for all tables into a temporary directory and move it into
+    place, so a crashed build never leaves a half-written cache behind.
+    tables: {table_name: (columns, rows_iterable)}
+    """
+    tmp_dir = _make_tmp_dir(cache_dir)
+    manifest = {
+        "version": CACHE_VERSION,
+        "signature": signature,
+        "tables": {}
+    }
+    for table_name, (columns, rows) in tables.items():
+        num_rows = write_table(tmp_dir, table_name, columns, rows)
+        manifest["tables"][table_name] = {"columns": columns, "rows": num_rows}
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    _replace_dir(tmp_dir, cache_dir)
+    return manifest
+
+
+def open_cache(cache_dir, signature, tables, row_factories=None):
+    """
+    Return {table_name: MappedTable} for the cache in cache_dir, (re)building it
+    first when it is missing, from an older version or its signature no longer
+    matches the source files. tables: {table_name: (columns, rows_callable)}
+    """
+    row_factories = row_factories or {}
+    manifest = load_manifest(cache_dir)
+    if not is_fresh(manifest, signature) or set(manifest.get("tables", {})) != set(tables):
+        os.makedirs(os.path.dirname(cache_dir), exist_ok=True)
+        manifest = build_cache(
+            cache_dir,
+            signature,
+            {name: (columns, rows()) for name, (columns, rows) in tables.items()}
+        )
+    return {
+        name: MappedTable(
+            cache_dir,
+            name,
+            [tuple(column) for column in info["columns"]],
+            info["rows"],
+            row_factories.get(name, tuple)
+        )
+        for name, info in manifest["tables"].items()
+    }
+
+
+# 持久化的开放寻址哈希索引：key 的 64 位哈希 -> 源文件中的字节偏移
+# 每个 slot 16 字节 (hash, offset + 1)，offset 字段为 0 表示空 slot
+_SLOT = struct.Struct("=QQ")
+
+
+def key_hash(key):
+    return int.from_bytes(hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def build_offset_index(cache_dir, signature, entries):
+    """
+    Build a hash index from (key, byte_offset) pairs. A later entry with the same
+    key replaces the earlier one, like assigning into a dict.
+    """
+    hashes = array("Q")
+    offsets = array("Q")
+    for key, offset in entries:
+        hashes.append(key_hash(key))
+        offsets.append(offset)
+    capacity = 8
+    while capacity < 2 * len(hashes):
+        capacity *= 2
+    mask = capacity - 1
+    table = array("Q", bytes(16 * capacity))
+    count = 0
+    for h, offset in zip(hashes, offsets):
+        slot = h & mask
+        while table[2 * slot + 1] != 0 and table[2 * slot] != h:
+            slot = (slot + 1) & mask
+        if table[2 * slot + 1] == 0:
+            count += 1
+        table[2 * slot] = h
+        table[2 * slot + 1] = offset + 1
+
+    tmp_dir = _make_tmp_dir(cache_dir)
+    with open(os.path.join(tmp_dir, "index.bin"), "wb") as f:
+        table.tofile(f)
+    manifest = {
+        "version": CACHE_VERSION,
+        "signature": signature,
+        "capacity": capacity,
+        "count": count
+    }
+    with open(os.path.join(tmp_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    _replace_dir(tmp_dir, cache_dir)
+    return manifest
+
+
+class OffsetIndex:
+    """
+    Memory-mapped view of an index written by build_offset_index(). lookup()
+    yields candidate offsets in probe order; since only hashes are stored the
+    caller must check the record at each offset really carries the key.
+    """
+    def __init__(self, cache_dir, manifest):
+        self.capacity = manifest["capacity"]
+        self.count = manifest["count"]
+        self._mask = self.capacity - 1
+        self._table = _map_file(os.path.join(cache_dir, "index.bin"))
+
+    def __len__(self):
+        return self.count
+
+    def lookup(self, key):
+        h = key_hash(key)
+        slot = h & self._mask
+        while True:
+            slot_hash, offset = _SLOT.unpack_from(self._table, slot * _SLOT.size)
+            if offset == 0:
+                return
+            if slot_hash == h:
+                yield offset - 1
+            slot = (slot + 1) & self._mask
+
+
+def open_offset_index(cache_dir, signature, entries):
+    """
+    Open the index in cache_dir, building it from entries() first when it is
+    missing or stale.
+    """
+    manifest = load_manifest(cache_dir)
+    if not is_fresh(manifest, signature):
+        os.makedirs(os.path.dirname(cache_dir), exist_ok=True)
+        manifest = build_offset_index(cache_dir, signature, entries())
+    return OffsetIndex(cache_dir, manifest)
@@ -1,110 +1,475 @@
 import os
 import json
 import yaml
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+
+from . import ir_local_cache
+
+# 可选的快速 JSON 解析：优先 orjson，其次 simdjson，都没有时退回标准库
+try:
+    import orjson
+    json_loads = orjson.loads
+except ImportError:
+    try:
+        import simdjson
+        json_loads = simdjson.loads
+    except ImportError:
+        json_loads = json.loads
+
+# docs.jsonl 小于该大小时直接单进程解析，进程池的启动开销不划算
+PARALLEL_MIN_BYTES = 16 * 1024 * 1024
+# 解析 docs.jsonl 的默认进程数，评测脚本不传 num_workers 时生效；0 表示使用全部 CPU
+LOAD_WORKERS = int(os.getenv("IR_LOAD_WORKERS", "1"))
 
 class Document:
+    # __slots__ 去掉每个实例的 __dict__；metadata 的字段名 tuple 由同一数据集的所有文档共享，
+    # 每个文档只保存自己的值 tuple
+    __slots__ = ("doc_id", "text", "metadata_keys", "metadata_values")
+
     def __init__(self, doc_id, text, metadata_fields=None):
         self.doc_id = doc_id
         self.text = text
         self.metadata_fields = metadata_fields or {}
 
+    @classmethod
+    def from_values(cls, doc_id, text, metadata_keys, metadata_values):
+        doc = cls.__new__(cls)
+        doc.doc_id = doc_id
+        doc.text = text
+        doc.metadata_keys = metadata_keys
+        doc.metadata_values = metadata_values
+        return doc
+
+    @property
+    def metadata_fields(self):
+        return dict(zip(self.metadata_keys, self.metadata_values))
+
+    @metadata_fields.setter
+    def metadata_fields(self, metadata_fields):
+        self.metadata_keys = tuple(metadata_fields)
+        self.metadata_values = tuple(metadata_fields.values())
+
 class Query:
+    __slots__ = ("query_id", "text")
+
     def __init__(self, query_id, text):
         self.query_id = query_id
         self.text = text
 
 class Qrel:
+    __slots__ = ("query_id", "doc_id", "relevance")
+
     def __init__(self, query_id, doc_id, relevance):
         self.query_id = query_id
         self.doc_id = doc_id
         self.relevance = relevance
 
+class QrelsColumns:
+    """
+    Column-oriented qrels: parallel int arrays (query_idx, doc_idx, relevance)
+    over interned query_id/doc_id tables. to_numpy() exposes the arrays without
+    copying, for vectorized lookups.
+    """
+    def __init__(self):
+        self.query_ids = []
+        self.doc_ids = []
+        self.query_index = {}
+        self.doc_index = {}
+        self.query_idx = array("i")
+        self.doc_idx = array("i")
+        self.relevance = array("i")
+
+    @classmethod
+    def from_qrels(cls, qrels):
+        columns = cls()
+        for qrel in qrels:
+            columns.add(qrel.query_id, qrel.doc_id, qrel.relevance)
+        return columns
+
+    def _intern(self, value, table, index):
+        idx = index.get(value)
+        if idx is None:
+            idx = len(table)
+            index[value] = idx
+            table.append(value)
+        return idx
+
+    def add(self, query_id, doc_id, relevance):
+        self.query_idx.append(self._intern(query_id, self.query_ids, self.query_index))
+        self.doc_idx.append(self._intern(doc_id, self.doc_ids, self.doc_index))
+        self.relevance.append(int(relevance))
+
+    def __len__(self):
+        return len(self.relevance)
+
+    def __iter__(self):
+        for q, d, rel in zip(self.query_idx, self.doc_idx, self.relevance):
+            yield Qrel(self.query_ids[q], self.doc_ids[d], rel)
+
+    def relevant_docs(self, min_relevance=1):
+        """
+        {query_id: [doc_id, ...]} for judgments with relevance >= min_relevance,
+        the qrels_dict shape used by the evaluators.
+        """
+        relevant = {}
+        for q, d, rel in zip(self.query_idx, self.doc_idx, self.relevance):
+            if rel >= min_relevance:
+                relevant.setdefault(self.query_ids[q], []).append(self.doc_ids[d])
+        return relevant
+
+    def to_numpy(self):
+        import numpy as np
+        return (
+            np.frombuffer(self.query_idx, dtype=np.int32),
+            np.frombuffer(self.doc_idx, dtype=np.int32),
+            np.frombuffer(self.relevance, dtype=np.int32)
+        )
+
+def _doc_id(obj, doc_id_field):
+    # 支持 doc_id_field 为 list 的情况
+    if isinstance(doc_id_field, list):
+        return "_".join(str(obj[field]) for field in doc_id_field)
+    return obj[doc_id_field]
+
+def _split_jsonl(path, num_chunks):
+    """
+    Split a JSONL file into at most num_chunks (start, end) byte ranges, each
+    ending right after a newline.
+    """
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, "rb") as f:
+        for i in range(1, num_chunks):
+            f.seek(max(size * i // num_chunks, boundaries[-1]))
+            f.readline()
+            position = min(f.tell(), size)
+            if position > boundaries[-1]:
+                boundaries.append(position)
+    if boundaries[-1] < size:
+        boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def _parse_docs_chunk(args):
+    """
+    Process pool worker: decode one byte range of docs.jsonl into
+    (doc_id, text, metadata_values) tuples.
+    """
+    docs_path, start, end, doc_id_field, text_field, metadata_keys = args
+    with open(docs_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start)
+    rows = []
+    for line in data.splitlines():
+        if not line.strip():
+            continue
+        obj = json_loads(line)
+        rows.append((
+            _doc_id(obj, doc_id_field),
+            obj[text_field],
+            tuple(obj.get(k) for k in metadata_keys)
+        ))
+    return rows
+
 class LocalDataset:
-    def __init__(self, dataset_path):
+    def __init__(self, dataset_path, lazy=False, cache=False, num_workers=LOAD_WORKERS):
         self.dataset_path = dataset_path
+        # num_workers > 1 时大文件 docs.jsonl 用多进程分块解析；None 表示使用全部 CPU
+        self.num_workers = num_workers or os.cpu_count() or 1
         self.metadata = self._load_metadata()
         self.name = self.metadata.get("dataset", os.path.basename(dataset_path))
-        self.docs = self._load_docs()
-        self.queries = self._load_queries()
-        self.qrels = self._load_qrels()
+        self.lazy = lazy
+        self.cache = cache
+        self._docs = None
+        self._queries = None
+        self._qrels = None
+        self._docs_store = None
+        self._qrels_columns = None
+        if cache:
+            # mmap 缓存打开几乎不耗时，docs/queries/qrels 直接是按需解码的只读序列
+            self._docs, self._queries, self._qrels = self._open_cache()
+        elif not lazy:
+            self._docs = self._load_docs()
+            self._queries = self._load_queries()
+            self._qrels = self._load_qrels()
+
+    # lazy 模式下，列表只在第一次随机访问时才构建
+    @property
+    def docs(self):
+        if self._docs is None:
+            self._docs = self._load_docs()
+        return self._docs
+
+    @property
+    def queries(self):
+        if self._queries is None:
+            self._queries = self._load_queries()
+        return self._queries
+
+    @property
+    def qrels(self):
+        if self._qrels is None:
+            self._qrels = self._load_qrels()
+        return self._qrels
 
     def _load_metadata(self):
         metadata_path = os.path.join(self.dataset_path, "metadata.yaml")
         with open(metadata_path, "r", encoding="utf-8") as f:
             return yaml.safe_load(f)
 
-    def _load_docs(self):
+    def _file_path(self, file_key, default_path):
+        file_info = self.metadata.get("files").get(file_key, {})
+        return os.path.join(self.dataset_path, file_info.get("path", default_path))
+
+    def _open_cache(self):
+        docs_info = self.metadata.get("files").get("documents", {})
+        metadata_keys = tuple(docs_info.get("metadata_fields", []))
+        signature = ir_local_cache.source_signature({
+            "metadata": os.path.join(self.dataset_path, "metadata.yaml"),
+            "documents": self._file_path("documents", "docs.jsonl"),
+            "queries": self._file_path("queries", "queries.jsonl"),
+            "qrels": self._file_path("qrels", "qrels.jsonl")
+        })
+        docs_columns = [("doc_id", ir_local_cache.JSON), ("text", ir_local_cache.STR)]
+        docs_columns += [(f"metadata_{i}", ir_local_cache.JSON) for i in range(len(metadata_keys))]
+        tables = {
+            "docs": (
+                docs_columns,
+                lambda: (
+                    (doc.doc_id, doc.text, *doc.metadata_values)
+                    for doc in self._iter_docs_file()
+                )
+            ),
+            "queries": (
+                [("query_id", ir_local_cache.JSON), ("text", ir_local_cache.STR)],
+                lambda: ((q.query_id, q.text) for q in self._iter_queries_file())
+            ),
+            "qrels": (
+                [("query_id", ir_local_cache.JSON), ("doc_id", ir_local_cache.JSON), ("relevance", ir_local_cache.JSON)],
+                lambda: ((qrel.query_id, qrel.doc_id, qrel.relevance) for qrel in self._iter_qrels_file())
+            )
+        }
+        row_factories = {
+            "docs": lambda doc_id, text, *values: Document.from_values(doc_id, text, metadata_keys, values),
+            "queries": Query,
+            "qrels": Qrel
+        }
+        mapped = ir_local_cache.open_cache(
+            ir_local_cache.dataset_cache_dir(self.dataset_path), signature, tables, row_factories
+        )
+        return mapped["docs"], mapped["queries"], mapped["qrels"]
+
+    def _doc_parser(self):
+        """
+        Return a function turning one parsed docs.jsonl object into a Document.
+        """
+        docs_info = self.metadata.get("files").get("documents", {})
+        doc_id_field = docs_info.get("doc_id_field", "doc_id")
+        text_field = docs_info.get("text_field", "text")
+        metadata_keys = tuple(docs_info.get("metadata_fields", []))
+
+        def parse(obj):
+            # 提取 metadata_fields
+            metadata_values = tuple(obj.get(k) for k in metadata_keys)
+            return Document.from_values(_doc_id(obj, doc_id_field), obj[text_field], metadata_keys, metadata_values)
+        return parse
+
+    def _iter_docs_parallel(self, docs_path):
         docs_info = self.metadata.get("files").get("documents", {})
-        docs_path = os.path.join(self.dataset_path, docs_info.get("path", "docs.jsonl"))
         doc_id_field = docs_info.get("doc_id_field", "doc_id")
         text_field = docs_info.get("text_field", "text")
-        metadata_fields_list = docs_info.get("metadata_fields", [])
-        docs = []
+        metadata_keys = tuple(docs_info.get("metadata_fields", []))
+        # 切得比进程数多一些，避免某个大块拖慢整体
+        chunks = [
+            (docs_path, start, end, doc_id_field, text_field, metadata_keys)
+            for start, end in _split_jsonl(docs_path, self.num_workers * 4)
+        ]
+        with ProcessPoolExecutor(max_workers=self.num_workers) as executor:
+            # executor.map 按提交顺序返回，保持文档原有顺序
+            for rows in executor.map(_parse_docs_chunk, chunks):
+                for doc_id, text, metadata_values in rows:
+                    yield Document.from_values(doc_id, text, metadata_keys, metadata_values)
+
+    def _iter_docs_file(self):
+        docs_path = self._file_path("documents", "docs.jsonl")
+        parse = self._doc_parser()
         if os.path.exists(docs_path):
+            if self.num_workers > 1 and os.path.getsize(docs_path) >= PARALLEL_MIN_BYTES:
+                yield from self._iter_docs_parallel(docs_path)
+                return
             with open(docs_path, "r", encoding="utf-8") as f:
                 for line in f:
-                    obj = json.loads(line)
-                    # 支持 doc_id_field 为 list 的情况
-                    if isinstance(doc_id_field, list):
-                        doc_id = "_".join(str(obj[field]) for field in doc_id_field)
-                    else:
-                        doc_id = obj[doc_id_field]
-                    # 提取 metadata_fields
-                    metadata_fields = {k: obj.get(k) for k in metadata_fields_list}
-                    docs.append(Document(doc_id, obj[text_field], metadata_fields))
-        return docs
+                    # 与多进程路径一致，跳过空行
+                    if line.strip():
+                        yield parse(json_loads(line))
 
-    def _load_queries(self):
+    def _iter_queries_file(self):
         queries_info = self.metadata.get("files").get("queries", {})
-        queries_path = os.path.join(self.dataset_path, queries_info.get("path", "queries.jsonl"))
+        queries_path = self._file_path("queries", "queries.jsonl")
         query_id_field = queries_info.get("id_field", "query_id")
         text_field = queries_info.get("text_field", "text")
-        queries = []
         if os.path.exists(queries_path):
             with open(queries_path, "r", encoding="utf-8") as f:
                 for line in f:
-                    obj = json.loads(line)
-                    queries.append(Query(obj[query_id_field], obj[text_field]))
-        return queries
+                    if not line.strip():
+                        continue
+                    obj = json_loads(line)
+                    yield Query(obj[query_id_field], obj[text_field])
 
-    def _load_qrels(self):
+    def _iter_qrels_file(self):
         qrels_info = self.metadata.get("files").get("qrels", {})
-        qrels_path = os.path.join(self.dataset_path, qrels_info.get("path", "qrels.jsonl"))
+        qrels_path = self._file_path("qrels", "qrels.jsonl")
         query_id_field = qrels_info.get("query_id_field", "query_id")
         docs_field = qrels_info.get("docs_field", None)
         doc_id_field = qrels_info.get("doc_id_field", "doc_id")
         relevance_field = qrels_info.get("relevance_field", "relevance")
-        qrels = []
         if os.path.exists(qrels_path):
             with open(qrels_path, "r", encoding="utf-8") as f:
                 for line in f:
-                    obj = json.loads(line)
+                    if not line.strip():
+                        continue
+                    obj = json_loads(line)
                     query_id = obj[query_id_field]
                     if docs_field and docs_field in obj:
                         for doc in obj[docs_field]:
                             doc_id = doc[doc_id_field]
                             relevance = doc[relevance_field]
-                            qrels.append(Qrel(query_id, doc_id, relevance))
+                            yield Qrel(query_id, doc_id, relevance)
                     else:
                         doc_id = obj[doc_id_field]
                         relevance = obj[relevance_field]
-                        qrels.append(Qrel(query_id, doc_id, relevance))
-        return qrels
+                        yield Qrel(query_id, doc_id, relevance)
+
+    def _load_docs(self):
+        return list(self._iter_docs_file())
+
+    def _load_queries(self):
+        return list(self._iter_queries_file())
+
+    def _load_qrels(self):
+        return list(self._iter_qrels_file())
+
+    def qrels_columns(self):
+        """
+        Qrels in columnar form (QrelsColumns), built once from qrels_iter().
+        """
+        if self._qrels_columns is None:
+            self._qrels_columns = QrelsColumns.from_qrels(self.qrels_iter())
+        return self._qrels_columns
+
+    def docs_store(self):
+        """
+        Random access to documents by doc_id without loading the corpus, backed
+        by a persistent hash index over byte offsets in docs.jsonl.
+        """
+        if self._docs_store is None:
+            self._docs_store = DocStore(self)
+        return self._docs_store
 
     def docs_iter(self):
-        for doc in self.docs:
-            yield doc
+        # 已经加载过的直接复用，否则从磁盘流式读取，不占用额外内存
+        if self._docs is not None:
+            return iter(self._docs)
+        return self._iter_docs_file()
 
     def queries_iter(self):
-        for query in self.queries:
-            yield query
+        if self._queries is not None:
+            return iter(self._queries)
+        return self._iter_queries_file()
 
     def qrels_iter(self):
-        for qrel in self.qrels:
-            yield qrel
+        if self._qrels is not None:
+            return iter(self._qrels)
+        return self._iter_qrels_file()
+
+class DocStore:
+    """
+    Look up documents by doc_id, similar to ir_datasets' docs_store(). The index
+    maps doc_id -> byte offset of its line in docs.jsonl and is kept under
+    ir_local_cache.dataset_cache_dir(); it is rebuilt when docs.jsonl or
+    metadata.yaml changes. Lines are read from a mmap of docs.jsonl, so only
+    the requested documents are ever decoded.
+    """
+    def __init__(self, dataset):
+        self.docs_path = dataset._file_path("documents", "docs.jsonl")
+        self._parse = dataset._doc_parser()
+        signature = ir_local_cache.source_signature({
+            "metadata": os.path.join(dataset.dataset_path, "metadata.yaml"),
+            "documents": self.docs_path
+        })
+        self._index = ir_local_cache.open_offset_index(
+            ir_local_cache.dataset_cache_dir(dataset.dataset_path, "docstore"),
+            signature,
+            self._iter_offsets
+        )
+        self._docs_map = ir_local_cache._map_file(self.docs_path) if os.path.exists(self.docs_path) else b""
+
+    def _iter_offsets(self):
+        if not os.path.exists(self.docs_path):
+            return
+        offset = 0
+        with open(self.docs_path, "rb") as f:
+            for line in f:
+                if line.strip():
+                    yield self._parse(json_loads(line)).doc_id, offset
+                offset += len(line)
+
+    def _read(self, offset):
+        end = self._docs_map.find(b"\n", offset)
+        if end < 0:
+            end = len(self._docs_map)
+        return self._parse(json_loads(self._docs_map[offset:end]))
+
+    def _find(self, doc_id):
+        for offset in self._index.lookup(doc_id):
+            doc = self._read(offset)
+            if doc.doc_id == doc_id:
+                return offset, doc
+        return None, None
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, doc_id):
+        return self._find(doc_id)[1] is not None
+
+    def get(self, doc_id):
+        doc = self._find(doc_id)[1]
+        if doc is None:
+            raise KeyError(doc_id)
+        return doc
+
+    def get_many(self, doc_ids):
+        """
+        Return {doc_id: Document} for the ids that exist, in the order given.
+        Lines are read in file order to keep disk access sequential.
+        """
+        offsets = {}
+        for doc_id in doc_ids:
+            if doc_id not in offsets:
+                offsets[doc_id] = list(self._index.lookup(doc_id))
+        candidates = sorted(
+            ((offset, doc_id) for doc_id, doc_offsets in offsets.items() for offset in doc_offsets),
+            key=lambda item: item[0]
+        )
+        found = {}
+        for offset, doc_id in candidates:
+            if doc_id in found:
+                continue
+            doc = self._read(offset)
+            if doc.doc_id == doc_id:
+                found[doc_id] = doc
+        return {doc_id: found[doc_id] for doc_id in offsets if doc_id in found}
 
-def load(dataset_path):
+def load(dataset_path, lazy=False, cache=False, num_workers=LOAD_WORKERS):
     """
     Load a local IR dataset from the given directory.
+    With lazy=True nothing is parsed up front: the *_iter() methods stream
+    from disk and the docs/queries/qrels lists are built on first access.
+    With cache=True the JSONL files are converted once into a memory-mapped
+    columnar cache (see ir_local_cache), rebuilt whenever a source file changes.
+    num_workers > 1 (None for all cores) decodes large docs.jsonl files in a
+    process pool, keeping the original document order; it defaults to the
+    IR_LOAD_WORKERS environment variable. Blank lines are skipped.
     """
-    return LocalDataset(dataset_path)
+    return LocalDataset(dataset_path, lazy=lazy, cache=cache, num_workers=num_workers)
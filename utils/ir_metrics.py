@@ -0,0 +1,169 @@
+import numpy as np
+
+# 统一的检索评估：把 run 和 qrels 编码成整数 id 后，一次 NumPy 计算所有指标和截断
+METRICS = ("Recall", "Precision", "MRR", "nDCG", "MAP")
+DEFAULT_CUTOFFS = (1, 3, 5, 10)
+
+
+def _encode_qrels(qrels):
+    """
+    Normalize qrels into (query_ids, query_index, doc_index, q_idx, d_idx, rel).
+    Accepts a QrelsColumns, {query_id: {doc_id: relevance}} or
+    {query_id: [doc_id, ...]} (every listed doc has relevance 1).
+    """
+    if hasattr(qrels, "to_numpy"):
+        q_idx, d_idx, rel = qrels.to_numpy()
+        return qrels.query_ids, qrels.query_index, qrels.doc_index, q_idx, d_idx, rel
+    query_ids = []
+    query_index = {}
+    doc_index = {}
+    q_list = []
+    d_list = []
+    rel_list = []
+    for query_id, docs in qrels.items():
+        q = len(query_ids)
+        query_index[query_id] = q
+        query_ids.append(query_id)
+        if isinstance(docs, dict):
+            d_list.extend(doc_index.setdefault(doc_id, len(doc_index)) for doc_id in docs)
+            rel_list.extend(docs.values())
+        else:
+            d_list.extend(doc_index.setdefault(doc_id, len(doc_index)) for doc_id in docs)
+            rel_list.extend([1] * len(docs))
+        q_list.extend([q] * len(docs))
+    return (
+        query_ids,
+        query_index,
+        doc_index,
+        np.asarray(q_list, dtype=np.int64),
+        np.asarray(d_list, dtype=np.int64),
+        np.asarray(rel_list, dtype=np.float64)
+    )
+
+
+def encode(run, qrels, depth):
+    """
+    Turn a run ({query_id: [doc_id, ...]} in rank order) and qrels into dense
+    matrices over the queries that have at least one relevant document:
+    gains (relevance of the doc at each rank, 0 when unjudged), ideal gains
+    (judged relevances sorted descending) and the number of relevant docs.
+    Repeated doc_ids in a run count once, at their first rank; entries beyond
+    depth are ignored, shorter runs are padded with 0.
+    """
+    query_ids, _, doc_index, q_idx, d_idx, rel = _encode_qrels(qrels)
+    q_idx = np.asarray(q_idx, dtype=np.int64)
+    d_idx = np.asarray(d_idx, dtype=np.int64)
+    rel = np.asarray(rel, dtype=np.float64)
+    num_queries = len(query_ids)
+    num_docs = max(len(doc_index), 1)
+
+    positive = rel > 0
+    n_rel = np.bincount(q_idx[positive], minlength=num_queries)
+    eval_q = np.flatnonzero(n_rel > 0)
+
+    # (query, doc) -> relevance，用排序后的 int64 key + searchsorted 查表
+    keys = q_idx * num_docs + d_idx
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]
+    sorted_rel = rel[order]
+
+    flat = []
+    lookup = doc_index.get
+    for q in eval_q.tolist():
+        # 重复的 doc_id 只保留第一次出现的位置，否则同一文档会被算作多次命中
+        retrieved = list(dict.fromkeys(run.get(query_ids[q], ())))[:depth]
+        flat.extend([lookup(doc_id, -1) for doc_id in retrieved])
+        flat.extend([-1] * (depth - len(retrieved)))
+    run_idx = np.asarray(flat, dtype=np.int64).reshape(len(eval_q), depth)
+    run_keys = eval_q[:, None] * num_docs + run_idx
+    gains = np.zeros(run_idx.shape, dtype=np.float64)
+    if len(sorted_keys):
+        pos = np.minimum(np.searchsorted(sorted_keys, run_keys), len(sorted_keys) - 1)
+        matched = (sorted_keys[pos] == run_keys) & (run_idx >= 0)
+        gains = np.where(matched, np.maximum(sorted_rel[pos], 0), 0.0)
+
+    # ideal ranking: 每个 query 的相关文档按 relevance 降序
+    q_pos = q_idx[positive]
+    rel_pos = rel[positive]
+    ideal_order = np.lexsort((-rel_pos, q_pos))
+    q_sorted = q_pos[ideal_order]
+    rel_sorted = rel_pos[ideal_order]
+    group_start = np.concatenate(([0], np.cumsum(n_rel)[:-1]))
+    rank = np.arange(len(q_sorted)) - group_start[q_sorted]
+    within = rank < depth
+    ideal_full = np.zeros((num_queries, depth), dtype=np.float64)
+    ideal_full[q_sorted[within], rank[within]] = rel_sorted[within]
+
+    return [query_ids[q] for q in eval_q.tolist()], gains, ideal_full[eval_q], n_rel[eval_q]
+
+
+def compute(gains, ideal, n_rel, cutoffs=DEFAULT_CUTOFFS, metrics=METRICS):
+    """
+    Per-query metric values from encode() output: {"Recall@10": array, ...}.
+    nDCG uses linear gains and MAP@k divides by the total number of relevant
+    docs, following trec_eval.
+    """
+    depth = gains.shape[1]
+    ranks = np.arange(1, depth + 1)
+    discounts = 1.0 / np.log2(ranks + 1)
+    hits = gains > 0
+    cum_hits = np.cumsum(hits, axis=1)
+    n_rel = n_rel.astype(np.float64)
+    if "nDCG" in metrics:
+        dcg = np.cumsum(gains * discounts, axis=1)
+        idcg = np.cumsum(ideal * discounts, axis=1)
+    if "MRR" in metrics:
+        first_hit = np.where(hits.any(axis=1), hits.argmax(axis=1), depth)
+    if "MAP" in metrics:
+        ap = np.cumsum(hits * (cum_hits / ranks), axis=1)
+
+    per_query = {}
+    for metric in metrics:
+        for k in cutoffs:
+            col = min(k, depth) - 1
+            if metric == "Recall":
+                values = cum_hits[:, col] / n_rel
+            elif metric == "Precision":
+                values = cum_hits[:, col] / k
+            elif metric == "MRR":
+                values = np.where(first_hit < k, 1.0 / (first_hit + 1), 0.0)
+            elif metric == "nDCG":
+                values = np.divide(dcg[:, col], idcg[:, col], out=np.zeros(len(n_rel)), where=idcg[:, col] > 0)
+            elif metric == "MAP":
+                values = ap[:, col] / n_rel
+            else:
+                raise ValueError(f"Unsupported metric: {metric}")
+            per_query[f"{metric}@{k}"] = values
+    return per_query
+
+
+def evaluate(run, qrels, cutoffs=DEFAULT_CUTOFFS, metrics=METRICS, per_query=False, include_missing=False):
+    """
+    Score a run against qrels at every cutoff in one pass.
+
+    run: {query_id: [doc_id, ...]} ranked best first.
+    qrels: QrelsColumns, {query_id: {doc_id: relevance}} or {query_id: [doc_id, ...]}.
+    Only queries with at least one relevant document that are also in the run
+    are averaged, so the mean matches len(run) when every run query is judged;
+    include_missing=True also counts judged queries absent from the run as 0.
+    Returns {"Recall@10": mean, ...}, plus ({query_id: ...}, per-query
+    arrays) when per_query=True.
+    """
+    cutoffs = sorted(set(cutoffs))
+    query_ids, gains, ideal, n_rel = encode(run, qrels, max(cutoffs))
+    if not include_missing:
+        # 只统计实际跑过的查询（如脚本限制了查询数），避免未跑的查询按 0 分拉低均值
+        keep = np.fromiter((query_id in run for query_id in query_ids), dtype=bool, count=len(query_ids))
+        query_ids = [query_id for query_id, k in zip(query_ids, keep) if k]
+        gains, ideal, n_rel = gains[keep], ideal[keep], n_rel[keep]
+    values = compute(gains, ideal, n_rel, cutoffs, metrics)
+    means = {name: float(v.mean()) if len(v) else 0.0 for name, v in values.items()}
+    if per_query:
+        return means, query_ids, values
+    return means
+
+
+def print_results(results, num_queries):
+    print(f"\nEvaluation results for {num_queries} queries:")
+    for name, value in results.items():
+        print(f"Average {name}: {value:.4f}")
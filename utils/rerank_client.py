@@ -0,0 +1,149 @@
+import os
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from .embedding_cache import EmbeddingCache
+from .embedding_client import XINFERENCE_API_KEY, RETRY_STATUS
+from .ir_local_cache import CACHE_ROOT
+
+# xinference 的 /v1/rerank 接口（bge-reranker-v2-m3），返回 [{"index", "relevance_score"}]
+XINFERENCE_RERANK_URL = os.getenv("XINFERENCE_RERANK_URL", "http://localhost:9998/v1/rerank")
+RERANK_MODEL = os.getenv("RERANK_MODEL", "bge-reranker-v2-m3")
+# 设为 0 关闭磁盘 rerank 分数缓存
+RERANK_CACHE = os.getenv("RERANK_CACHE", "1") != "0"
+RERANK_CACHE_ROOT = os.getenv("RERANK_CACHE_DIR", os.path.join(CACHE_ROOT, "rerank"))
+
+
+def pair_text(query, passage):
+    # 缓存按 (query, passage) 整体哈希，\0 不会出现在正常文本里
+    return f"{query}\0{passage}"
+
+
+class RerankClient:
+    """
+    Shared client for the cross-encoder rerank endpoint.
+
+    - the passages of a query are scored in requests of at most
+      max_batch_size passages; requests of all queries in a call run in
+      parallel, at most max_concurrency in flight
+    - retries and 413 splitting as in EmbeddingClient
+    - with cache=True scores are cached on disk by pair hash (an
+      EmbeddingCache of 1-dim rows), so only unseen pairs are sent
+    """
+    def __init__(self, model=RERANK_MODEL, url=XINFERENCE_RERANK_URL, api_key=XINFERENCE_API_KEY, max_batch_size=64,
+                 max_concurrency=4, timeout=60.0, max_retries=4, backoff=0.5, cache=RERANK_CACHE):
+        self.model = model
+        self.url = url
+        if cache is True:
+            cache = EmbeddingCache(model, cache_dir=os.path.join(RERANK_CACHE_ROOT, model.replace("/", "_")))
+        self.cache = cache if isinstance(cache, EmbeddingCache) else None
+        self.max_batch_size = max_batch_size
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if api_key:
+            self.session.headers["Authorization"] = f"Bearer {api_key}"
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency)
+
+    def _post(self, query, passages):
+        data = {"model": self.model, "query": query, "documents": passages, "return_documents": False}
+        for attempt in range(self.max_retries + 1):
+            try:
+                with self._slots:
+                    resp = self.session.post(self.url, json=data, timeout=self.timeout)
+                if resp.status_code == 413 and len(passages) > 1:
+                    half = len(passages) // 2
+                    return self._post(query, passages[:half]) + self._post(query, passages[half:])
+                if resp.status_code not in RETRY_STATUS or attempt == self.max_retries:
+                    resp.raise_for_status()
+                    scores = [0.0] * len(passages)
+                    for item in resp.json()["results"]:
+                        scores[item["index"]] = float(item["relevance_score"])
+                    return scores
+                reason = f"HTTP {resp.status_code}"
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                reason = type(e).__name__
+            delay = self.backoff * (2 ** attempt) * (0.5 + random.random())
+            print(f"Rerank request failed ({reason}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+            time.sleep(delay)
+
+    def _score(self, pairs):
+        # pairs: [(query, passage)]，同一 query 的 passage 合并成请求，每个请求最多 max_batch_size 条
+        by_query = {}
+        for i, (query, _) in enumerate(pairs):
+            by_query.setdefault(query, []).append(i)
+        calls = [(query, indices[start:start + self.max_batch_size])
+                 for query, indices in by_query.items()
+                 for start in range(0, len(indices), self.max_batch_size)]
+        results = self._executor.map(lambda call: self._post(call[0], [pairs[i][1] for i in call[1]]), calls)
+        scores = np.zeros(len(pairs), dtype=np.float32)
+        for (_, indices), values in zip(calls, results):
+            scores[indices] = values
+        return scores
+
+    def score(self, query, passages):
+        return self.score_batch([(query, passages)])[0]
+
+    def score_batch(self, items):
+        """
+        items: [(query, [passage, ...])]. Returns one float32 score array per
+        item, in passage order.
+        """
+        items = [(query, list(passages)) for query, passages in items]
+        pairs = [(query, passage) for query, passages in items for passage in passages]
+        if not pairs:
+            return [np.zeros(0, dtype=np.float32) for _ in items]
+        if self.cache is None:
+            scores = self._score(pairs)
+        else:
+            texts = [pair_text(query, passage) for query, passage in pairs]
+            missing = set(self.cache.missing(texts))
+            if missing:
+                # 同一批里重复的 pair 只打一次分
+                todo = list({text: pair for text, pair in zip(texts, pairs) if text in missing}.items())
+                self.cache.put([text for text, _ in todo], self._score([pair for _, pair in todo])[:, None])
+            scores = self.cache.get(texts)[:, 0]
+        result, start = [], 0
+        for _, passages in items:
+            result.append(scores[start:start + len(passages)])
+            start += len(passages)
+        return result
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_reranker(model=RERANK_MODEL, **kwargs):
+    """
+    Process-wide rerank client per (model, url), shared like get_client().
+    """
+    key = (model, kwargs.get("url", XINFERENCE_RERANK_URL))
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = RerankClient(model=model, **kwargs)
+        return _clients[key]